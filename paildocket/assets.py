@@ -0,0 +1,242 @@
+"""
+Fingerprinted, precompressed static assets.
+
+``paildocket-build-assets`` copies each static asset tree (our own and
+deform's) into ``paildocket.assets.directory``, under a directory named
+after a hash of the tree's contents, and writes gzip and (if the
+``brotli`` package is installed) brotli compressed variants of the
+files worth compressing. A manifest maps each tree's asset spec to its
+hashed directory.
+
+Hashing whole trees rather than single files keeps the relative URLs
+between files of a tree (deform's CSS referencing its images, say)
+working. Any change to a tree changes the URL of all its files, and
+since the URL changes whenever the content does, assets are served
+with far-future ``immutable`` caching headers.
+
+``request.asset_url(spec)`` returns the fingerprinted URL of an asset,
+or its ordinary static URL when no manifest has been built.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.path import AssetResolver
+from pyramid.response import FileResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# (asset spec of the tree, name of its built directory)
+ASSET_TREES = [
+    ('paildocket:static/', 'paildocket'),
+    ('deform:static/', 'deform'),
+]
+
+MANIFEST_NAME = 'manifest.json'
+
+# Formats which are already compressed
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.png', '.jpg', '.jpeg', '.gif', '.ico', '.webp',
+    '.woff', '.woff2', '.zip', '.gz', '.br',
+])
+
+# A compressed variant is only kept if it is at most this much of the
+# original's size.
+MAX_COMPRESSED_RATIO = 0.9
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Content-Encoding token and file suffix of each precompressed variant,
+# most preferred first.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _iter_files(directory):
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, directory).replace(os.sep, '/')
+
+
+def tree_hash(directory):
+    """
+    Return a hash of the names and contents of the files below
+    ``directory``.
+    """
+    tree = hashlib.sha256()
+    for relative in _iter_files(directory):
+        with open(os.path.join(directory, relative), 'rb') as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        tree.update('{0}\0{1}\0'.format(relative, content_hash).encode())
+    return tree.hexdigest()[:12]
+
+
+def _compress(data):
+    """Yield (suffix, compressed data) for each available encoding."""
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br':
+            if brotli is None:
+                continue
+            yield suffix, brotli.compress(data)
+        elif encoding == 'gzip':
+            yield suffix, gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def write_compressed_variants(path):
+    """
+    Write the compressed variants of the file at ``path`` next to it,
+    where that is worthwhile. Return the suffixes written.
+    """
+    if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for suffix, compressed in _compress(data):
+        if len(compressed) <= len(data) * MAX_COMPRESSED_RATIO:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def build_assets(output_directory, trees=ASSET_TREES):
+    """
+    Build every tree of ``trees`` into ``output_directory`` and write
+    the manifest. Return the manifest, mapping asset specs to built
+    directory names.
+
+    Existing builds are left alone, so that pages rendered by processes
+    still running the previous release can load their assets.
+    """
+    resolver = AssetResolver()
+    manifest = {}
+    for spec, name in trees:
+        source = resolver.resolve(spec).abspath()
+        built_name = '{0}-{1}'.format(name, tree_hash(source))
+        destination = os.path.join(output_directory, built_name)
+        manifest[spec] = built_name
+        if os.path.isdir(destination):
+            logger.info('{0} is up to date in {1}'.format(spec, built_name))
+            continue
+        # Built beside the destination and renamed, so a half built tree
+        # is never served.
+        building = destination + '.building'
+        shutil.rmtree(building, ignore_errors=True)
+        shutil.copytree(source, building)
+        compressed = 0
+        for relative in _iter_files(building):
+            if write_compressed_variants(os.path.join(building, relative)):
+                compressed += 1
+        os.rename(building, destination)
+        logger.info('Built {0} into {1}, compressing {2} files'.format(
+            spec, built_name, compressed))
+
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def load_manifest(output_directory):
+    """Return the manifest built into ``output_directory``, or None."""
+    try:
+        with open(os.path.join(output_directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def asset_url(request, spec):
+    """
+    Return the URL of the asset ``spec``: its fingerprinted URL if the
+    assets have been built, otherwise its static view URL.
+    """
+    manifest = request.registry.get('asset_manifest')
+    if manifest:
+        for tree_spec, built_name in manifest.items():
+            if spec.startswith(tree_spec):
+                subpath = [built_name] + spec[len(tree_spec):].split('/')
+                return request.route_url('assets', subpath=subpath)
+    return request.static_url(spec)
+
+
+def _choose_encoding(request, path):
+    """
+    Return the (encoding, suffix) of the best precompressed variant of
+    ``path`` acceptable to the client, or (None, '') for the original.
+    """
+    if 'Accept-Encoding' not in request.headers:
+        return None, ''
+    available = dict(
+        (encoding, suffix) for encoding, suffix in ENCODINGS
+        if os.path.isfile(path + suffix))
+    if not available:
+        return None, ''
+    offers = [encoding for encoding, suffix in ENCODINGS
+              if encoding in available]
+    acceptable = request.accept_encoding.acceptable_offers(offers)
+    if not acceptable:
+        return None, ''
+    encoding = acceptable[0][0]
+    return encoding, available[encoding]
+
+
+def serve_asset(request):
+    directory = request.registry['asset_directory']
+    subpath = request.matchdict['subpath']
+    built_names = request.registry['asset_manifest'].values()
+    if len(subpath) < 2 or subpath[0] not in built_names or any(
+            part in ('', '.', '..') or '/' in part or os.sep in part
+            for part in subpath):
+        raise HTTPNotFound()
+    path = os.path.join(directory, *subpath)
+    # Variants are only served in place of their original
+    if path.endswith(tuple(suffix for e, suffix in ENCODINGS)):
+        raise HTTPNotFound()
+    if not os.path.isfile(path):
+        raise HTTPNotFound()
+
+    content_type, ignored = mimetypes.guess_type(path)
+    encoding, suffix = _choose_encoding(request, path)
+    response = FileResponse(
+        path + suffix, request=request,
+        content_type=content_type or 'application/octet-stream')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary = ('Accept-Encoding',)
+    response.cache_control = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def includeme(config):
+    settings = config.registry.settings
+    directory = settings.get('paildocket.assets.directory')
+    manifest = None
+    if directory:
+        directory = os.path.abspath(directory)
+        manifest = load_manifest(directory)
+        if manifest is None:
+            logger.warning(
+                'No asset manifest in {0}, serving unfingerprinted static '
+                'assets; run paildocket-build-assets'.format(directory))
+    config.registry['asset_directory'] = directory
+    config.registry['asset_manifest'] = manifest
+    if manifest is not None:
+        config.add_route('assets', '/assets/*subpath')
+        config.add_view(serve_asset, route_name='assets')
+    config.add_request_method(asset_url, 'asset_url')
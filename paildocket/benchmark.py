@@ -0,0 +1,205 @@
+"""
+Micro-benchmarks for hot paths, run against the configured database.
+
+Each benchmark creates whatever rows it needs inside a transaction
+which is rolled back afterwards, so it is safe to point at a
+development database.
+"""
+import logging
+import timeit
+import uuid
+
+import transaction
+from pyramid.paster import get_app, get_appsettings
+from pyramid.request import Request
+from sqlalchemy import engine_from_config, or_
+from sqlalchemy.orm import Session
+
+from paildocket.management import BaseCommand
+from paildocket.models import User, Checklist, ChecklistPermission
+
+
+logger = logging.getLogger(__name__)
+
+
+def _plain_from_userid(db_session, fixture):
+    q = db_session.query(User).filter(User.id == fixture.user.id)
+    return q.first()
+
+
+def _plain_from_identity(db_session, fixture):
+    identity = fixture.user.username
+    q = db_session.query(User)
+    q = q.filter(or_(User.username == identity, User.email == identity))
+    return q.first()
+
+
+def _plain_for_user_and_checklist(db_session, fixture):
+    q = db_session.query(ChecklistPermission)
+    q = q.filter(
+        ChecklistPermission.user_id == fixture.user.id,
+        ChecklistPermission.checklist_id == fixture.checklist.id,
+    )
+    return q.first()
+
+
+def _plain_checklist_from_id(db_session, fixture):
+    q = db_session.query(Checklist)
+    q = q.filter(Checklist.id == fixture.checklist.id)
+    return q.first()
+
+
+# (name, uncached equivalent, model lookup)
+QUERY_BENCHMARKS = [
+    (
+        'User.from_userid',
+        _plain_from_userid,
+        lambda s, f: User.from_userid(s, f.user.id),
+    ),
+    (
+        'User.from_identity',
+        _plain_from_identity,
+        lambda s, f: User.from_identity(s, f.user.username),
+    ),
+    (
+        'ChecklistPermission.for_user_and_checklist',
+        _plain_for_user_and_checklist,
+        lambda s, f: ChecklistPermission.for_user_and_checklist(
+            s, f.user.id, f.checklist.id),
+    ),
+    (
+        'Checklist.from_id',
+        _plain_checklist_from_id,
+        lambda s, f: Checklist.from_id(s, f.checklist.id),
+    ),
+]
+
+
+class _QueryFixture(object):
+    def __init__(self, db_session):
+        name = 'benchmark-' + uuid.uuid4().hex[:12]
+        self.user = User(
+            username=name,
+            email=name + '@example.com',
+            password_hash='not a real hash',
+        )
+        self.checklist = Checklist(title=name)
+        self.checklist.editors.add(self.user)
+        db_session.add(self.checklist)
+        db_session.flush()
+
+
+def time_per_call(func, iterations):
+    """Return the mean wall clock seconds per call of ``func``."""
+    return timeit.timeit(func, number=iterations) / iterations
+
+
+class BenchmarkCommand(BaseCommand):
+    name = 'paildocket-benchmark'
+
+    def configure_parser(self):
+        subparsers = self.parser.add_subparsers(
+            dest='subparser_name', metavar='benchmark')
+        subparsers.required = True
+
+        queries_subcommand = subparsers.add_parser(
+            'queries',
+            help='Compare baked model lookups with freshly built queries')
+        queries_subcommand.add_argument(
+            '--iterations', '-n', type=int, default=2000)
+
+        login_subcommand = subparsers.add_parser(
+            'login',
+            help='Time failed logins for unknown and known identities')
+        login_subcommand.add_argument(
+            '--iterations', '-n', type=int, default=20)
+
+    def run(self, args):
+        if args.subparser_name == 'queries':
+            settings = get_appsettings(self.config_uri)
+            engine = engine_from_config(settings, 'sqlalchemy.')
+            self.benchmark_queries(engine, args.iterations)
+        elif args.subparser_name == 'login':
+            self.benchmark_login(get_app(self.config_uri), args.iterations)
+        else:
+            raise Exception('Unexpected subparser name')
+
+    def benchmark_queries(self, engine, iterations):
+        connection = engine.connect()
+        outer_transaction = connection.begin()
+        try:
+            db_session = Session(bind=connection)
+            fixture = _QueryFixture(db_session)
+            print('{0:<45} {1:>12} {2:>12} {3:>8}'.format(
+                'lookup', 'plain (us)', 'baked (us)', 'saved'))
+            for name, plain, baked in QUERY_BENCHMARKS:
+                # Warm up, so the baked query is compiled before timing.
+                plain(db_session, fixture)
+                baked(db_session, fixture)
+                plain_time = time_per_call(
+                    lambda: plain(db_session, fixture), iterations)
+                baked_time = time_per_call(
+                    lambda: baked(db_session, fixture), iterations)
+                print('{0:<45} {1:>12.1f} {2:>12.1f} {3:>7.0%}'.format(
+                    name, plain_time * 1e6, baked_time * 1e6,
+                    1 - baked_time / plain_time))
+            db_session.close()
+        finally:
+            outer_transaction.rollback()
+            connection.close()
+
+    def benchmark_login(self, app, iterations):
+        """
+        POST failed logins through the whole application, for an
+        unknown identity and for a known identity with a wrong password.
+        Both should take about the same time.
+        """
+        # Every attempt comes from the same address and names the same
+        # identities, so would soon be refused without hashing anything.
+        app.registry['login_throttle'] = None
+        maker = app.registry['db_sessionmaker']
+        connection = maker.kw['bind'].connect()
+        outer_transaction = connection.begin()
+        # Commits by the application only reach the outer transaction.
+        maker.configure(bind=connection)
+        try:
+            name = 'benchmark-' + uuid.uuid4().hex[:12]
+            password_context = app.registry['password_context']
+            with transaction.manager:
+                maker().add(User(
+                    username=name,
+                    email=name + '@example.com',
+                    password_hash=password_context.encrypt('password'),
+                ))
+
+            print('{0:<20} {1:>12} {2:>12}'.format(
+                'login path', 'ms/login', 'logins/s'))
+            paths = [
+                ('unknown identity', 'unknown-' + name, 'password'),
+                ('wrong password', name, 'wrong password'),
+            ]
+            for label, identity, password in paths:
+                post = {
+                    '__formid__': 'login_form',
+                    'identity': identity,
+                    'password': password,
+                    'submit': 'submit',
+                }
+
+                def attempt():
+                    request = Request.blank('/login', POST=post)
+                    response = request.get_response(app)
+                    if response.status_int != 200:
+                        raise Exception(
+                            'Unexpected response {0}'.format(response.status))
+
+                attempt()  # warm up templates and queries
+                per_login = time_per_call(attempt, iterations)
+                print('{0:<20} {1:>12.1f} {2:>12.1f}'.format(
+                    label, per_login * 1e3, 1 / per_login))
+        finally:
+            outer_transaction.rollback()
+            connection.close()
+
+
+benchmark = BenchmarkCommand()
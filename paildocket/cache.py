@@ -0,0 +1,60 @@
+"""
+Small in-process caches shared by the rest of the application.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping holding at most ``maxsize`` entries, which
+    evicts the least recently used entry when full.
+
+    If ``ttl`` is given, entries stored more than ``ttl`` seconds ago
+    (as measured by ``clock``) are treated as missing.
+    """
+    def __init__(self, maxsize, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                stored_at, value = self._entries[key]
+            except KeyError:
+                return default
+            if self.ttl is not None and self._clock() - stored_at >= self.ttl:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_missing = object()
@@ -0,0 +1,129 @@
+"""
+A tween compressing dynamic responses with gzip or brotli.
+
+Only enabled if ``paildocket.compression.enabled`` is true, since a
+fronting web server may already be doing this.
+
+A response is compressed when its content type is one of
+``paildocket.compression.content_types``, its body is at least
+``paildocket.compression.min_size`` bytes, and the client accepts one
+of the encodings. Responses which are already encoded, are streamed
+(their body is not in memory), are partial or forbid transformation
+are passed through unchanged.
+"""
+import gzip
+
+from pyramid.settings import asbool, aslist
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+DEFAULT_CONTENT_TYPES = [
+    'text/html', 'text/plain', 'text/css', 'text/csv',
+    'application/json', 'application/javascript', 'image/svg+xml',
+]
+
+
+class Compressor(object):
+    """
+    Compresses eligible responses, with gzip at ``level`` or brotli at
+    ``brotli_quality``, preferring brotli when the client's preferences
+    do not decide.
+    """
+    def __init__(self, content_types=DEFAULT_CONTENT_TYPES, min_size=1024,
+                 level=6, brotli_quality=5):
+        self.content_types = frozenset(content_types)
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.encodings = ['gzip'] if brotli is None else ['br', 'gzip']
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def choose_encoding(self, request):
+        """Return the encoding to use for ``request``, or None."""
+        if 'Accept-Encoding' not in request.headers:
+            return None
+        acceptable = request.accept_encoding.acceptable_offers(self.encodings)
+        return acceptable[0][0] if acceptable else None
+
+    def is_eligible(self, response):
+        """
+        Return True if the representation of ``response`` depends on the
+        client's Accept-Encoding, whether or not this client gets it
+        compressed.
+        """
+        if response.content_type not in self.content_types:
+            return False
+        if response.content_encoding or response.status_int in (204, 206):
+            return False
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return False
+        # Streamed bodies (file and generator app_iters) are left alone,
+        # so they stay streamed.
+        return isinstance(response.app_iter, (list, tuple))
+
+    def __call__(self, request, response):
+        """Compress ``response`` in place if eligible and worthwhile."""
+        if not self.is_eligible(response):
+            return
+        # Before any other check, so that every variant, including the
+        # response to a HEAD, says what it varies on
+        _add_vary(response, 'Accept-Encoding')
+        if request.method == 'HEAD':
+            return
+        body = response.body
+        if len(body) < self.min_size:
+            return
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return
+        compressed = self.compress(body, encoding)
+        if len(compressed) >= len(body):
+            return
+        response.body = compressed
+        response.content_encoding = encoding
+        # The compressed bytes differ from the uncompressed ones, so a
+        # strong validator would be wrong; weak ones still let
+        # If-None-Match work.
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response.headers['ETag'] = 'W/' + etag
+
+
+def _add_vary(response, header):
+    vary = list(response.vary or ())
+    if header.lower() not in (value.lower() for value in vary):
+        response.vary = tuple(vary + [header])
+
+
+def compression_tween_factory(handler, registry):
+    compressor = registry['response_compressor']
+
+    def compression_tween(request):
+        response = handler(request)
+        compressor(request, response)
+        return response
+    return compression_tween
+
+
+def includeme(config):
+    settings = config.registry.settings
+    if not asbool(settings.get('paildocket.compression.enabled', False)):
+        return
+    content_types = aslist(settings.get(
+        'paildocket.compression.content_types', ''))
+    config.registry['response_compressor'] = Compressor(
+        content_types=content_types or DEFAULT_CONTENT_TYPES,
+        min_size=int(settings.get('paildocket.compression.min_size', 1024)),
+        level=int(settings.get('paildocket.compression.level', 6)),
+        brotli_quality=int(settings.get(
+            'paildocket.compression.brotli_quality', 5)),
+    )
+    config.add_tween('paildocket.compression.compression_tween_factory')
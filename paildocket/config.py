@@ -3,6 +3,7 @@ from pyramid_jinja2.filters import (
     route_url_filter, static_url_filter, model_url_filter
 )
 
+from paildocket.i18n import CachedGetText
 from paildocket.traversal import RootResource
 
 
@@ -14,19 +15,30 @@ def make_config(global_config, **settings):
             'resource_url': model_url_filter,
         },
         'jinja2.extensions': ['jinja2.ext.i18n'],
+        'jinja2.i18n.gettext': CachedGetText,
     })
 
     config = Configurator(settings=settings, root_factory=RootResource)
 
     config.include('pyramid_jinja2')
     config.add_jinja2_search_path('paildocket:templates/')
+    config.include('paildocket.templating')
+    config.include('paildocket.renderers')
+    config.include('paildocket.compression')
     config.add_static_view('static', 'static', cache_max_age=3600)
-    config.add_static_view('deform_static', 'deform:static/')
+    config.add_static_view(
+        'deform_static', 'deform:static/', cache_max_age=3600)
+    config.include('paildocket.assets')
 
     config.include('paildocket.i18n')
     config.include('paildocket.models')
     config.include('paildocket.session')
+    config.include('paildocket.traversal')
+    config.include('paildocket.lookup')
     config.include('paildocket.security')
+    config.include('paildocket.rehash')
+    config.include('paildocket.throttle')
 
+    config.include('paildocket.views')
     config.scan('paildocket.views')
     return config
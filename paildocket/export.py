@@ -0,0 +1,100 @@
+"""
+Streamed exports of checklists and their items, as CSV or JSON Lines.
+
+An export is the ``app_iter`` of its response, which is consumed after
+``pyramid_tm`` has closed the request's session. The rows are read on a
+connection of their own, through a server-side cursor fetching
+``paildocket.export.batch_size`` rows at a time, and sent in chunks of
+about ``paildocket.export.chunk_size`` bytes: memory use does not depend
+on the size of the export, and the first rows go out as soon as the
+database returns them.
+"""
+import csv
+import io
+
+from pyramid.httpexceptions import HTTPBadRequest
+from sqlalchemy.orm import Session
+
+from paildocket.models import Checklist, EXPORT_COLUMNS
+from paildocket.renderers import get_backend, iter_chunks
+
+
+def iter_rows(bind, user_id, checklist_id=None, batch_size=1000):
+    """
+    Yield the rows of `Checklist.export_query`, read on a new connection
+    of ``bind`` ``batch_size`` rows at a time.
+    """
+    # A separate connection, outside the request's transaction, which
+    # has ended by the time the rows are read
+    connection = bind.connect()
+    db_session = Session(bind=connection)
+    try:
+        q = Checklist.export_query(db_session, user_id, checklist_id)
+        yield from q.yield_per(batch_size)
+    finally:
+        db_session.close()
+        connection.close()
+
+
+def iter_csv(rows):
+    """Yield the CSV lines of ``rows``, after a header, as bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # The header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl(rows, dumps):
+    """
+    Yield ``rows`` as JSON objects, one per line, encoded by ``dumps``
+    (see `paildocket.renderers.get_backend`).
+    """
+    for row in rows:
+        yield dumps(dict(zip(EXPORT_COLUMNS, row)), None) + b'\n'
+
+
+# Content type and extension of each format
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+
+def export_response(request, checklist_id=None):
+    """
+    Set up ``request.response`` to stream the export of the checklists
+    the user can view (or only of the one with ``checklist_id``) in the
+    format given by the ``format`` parameter, and return it.
+    """
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        raise HTTPBadRequest('Unknown export format')
+    settings = request.registry.settings
+    rows = iter_rows(
+        request.registry['db_sessionmaker'].kw['bind'], request.user.id,
+        checklist_id,
+        batch_size=int(settings.get('paildocket.export.batch_size', 1000)))
+    if format == 'csv':
+        parts = iter_csv(rows)
+    else:
+        parts = iter_jsonl(rows, get_backend(
+            settings.get('paildocket.json.backend', 'auto')))
+
+    content_type, extension = FORMATS[format]
+    filename = 'checklists' if checklist_id is None else (
+        'checklist-{0}'.format(checklist_id))
+    response = request.response
+    response.content_type = content_type
+    response.charset = 'UTF-8'
+    response.content_disposition = 'attachment; filename="{0}.{1}"'.format(
+        filename, extension)
+    response.app_iter = iter_chunks(parts, int(settings.get(
+        'paildocket.export.chunk_size', 64 * 1024)))
+    return response
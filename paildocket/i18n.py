@@ -1,9 +1,14 @@
 import deform
 
 from pkg_resources import resource_filename
-from pyramid.i18n import TranslationStringFactory, get_localizer
+from pyramid.events import ApplicationCreated, NewResponse
+from pyramid.i18n import TranslationStringFactory, make_localizer
+from pyramid.interfaces import ITranslationDirectories
 from pyramid.threadlocal import get_current_request
 
+from paildocket.cache import LRUCache
+from paildocket.session import SESSION_COOKIE_NAME
+
 
 _ = PaildocketTranslationString = TranslationStringFactory('paildocket')
 
@@ -15,38 +20,192 @@ class AcceptLanguageLocaleNegotiator(object):
     the browser's preference based on the application's
     declared ``available_languages``, and optionally falls back
     to another negotiator if the match fails.
+
+    Matches are remembered for the ``cache_size`` most recently seen
+    header values, since browsers send only a handful of distinct ones.
     """
-    def __init__(self, available_languages, fallback=None):
+    def __init__(self, available_languages, fallback=None, cache_size=1000):
         self._available_languages = available_languages
         self._fallback = (lambda r: None) if fallback is None else fallback
+        self._matches = LRUCache(cache_size)
 
     def __call__(self, request):
-        if request.accept_language:
-            return request.accept_language.best_match(
-                self._available_languages)
-        else:
+        header = request.environ.get('HTTP_ACCEPT_LANGUAGE', '').strip()
+        if not header:
             # no or empty Accept-Language, fall back to next negotiator
             return self._fallback(request)
+        language = self._matches.get(header, _unmatched)
+        if language is _unmatched:
+            language = request.accept_language.best_match(
+                self._available_languages)
+            self._matches.set(header, language)
+        return language
+
+
+_unmatched = object()
 
 
 class SessionLocaleNegotiator(object):
     """
-    A Pyramid locale negotiator that inspects the session for a 'lang'
-    key, otherwise uses the ``fallback_negotiator`` to try to figure
-    it out, and if found sets it in the session.
+    A Pyramid locale negotiator that uses the language stored under the
+    session's 'lang' key by `remember_language`, otherwise uses the
+    ``fallback_negotiator`` to try to figure it out.
+
+    The session is only loaded if the request carries a session cookie,
+    so that anonymous requests never need one.
     """
-    def __init__(self, fallback_negotiator):
+    def __init__(self, fallback_negotiator, cookie_name=SESSION_COOKIE_NAME):
         self.fallback_negotiator = fallback_negotiator
+        self.cookie_name = cookie_name
 
     def __call__(self, request):
-        language = request.session.get('lang')
+        language = None
+        if self.cookie_name in request.cookies:
+            language = request.session.get('lang')
         if language is None:
             language = self.fallback_negotiator(request)
-            if language is not None:
-                request.session['lang'] = language
         return language
 
 
+def remember_language(request, language):
+    """
+    Store the user's explicit choice of ``language`` in the session,
+    where `SessionLocaleNegotiator` will find it.
+    """
+    request.session['lang'] = language
+
+
+def vary_on_negotiated_locale(event):
+    """
+    Mark responses to requests which negotiated their locale as varying
+    on Accept-Language and Cookie (for the session's language), so that
+    shared caches do not serve one visitor's language to everybody.
+    """
+    if 'locale_name' not in event.request.__dict__:
+        return
+    response = event.response
+    vary = list(response.vary or ())
+    present = set(value.lower() for value in vary)
+    for header in ('Accept-Language', 'Cookie'):
+        if header.lower() not in present:
+            vary.append(header)
+    response.vary = tuple(vary)
+
+
+class TranslationCache(object):
+    """
+    Localizers for each locale name, and the translations they have
+    made, keyed by locale, domain, msgid, default and mapping. At most
+    ``maxsize`` translations are remembered.
+
+    Translation directories are looked up in ``registry`` when a locale
+    is first used, since they are only registered once the
+    configuration is committed.
+    """
+    def __init__(self, registry, maxsize=10000):
+        self.registry = registry
+        self._localizers = {}
+        self._translations = LRUCache(maxsize)
+
+    def localizer(self, locale_name):
+        localizer = self._localizers.get(locale_name)
+        if localizer is None:
+            directories = self.registry.queryUtility(
+                ITranslationDirectories, default=[])
+            localizer = make_localizer(locale_name, directories)
+            self._localizers[locale_name] = localizer
+        return localizer
+
+    def translate(self, locale_name, term, domain=None, mapping=None):
+        if domain is None:
+            domain = getattr(term, 'domain', None)
+        if mapping is None:
+            mapping = getattr(term, 'mapping', None)
+        # A TranslationString defaults to its msgid, which is no
+        # different from the plain string the cache is warmed with
+        default = getattr(term, 'default', None)
+        if default == str(term):
+            default = None
+        try:
+            key = (
+                locale_name, domain, str(term), default,
+                getattr(term, 'context', None),
+                frozenset(mapping.items()) if mapping else None,
+            )
+            hash(key)
+        except TypeError:
+            # unhashable mapping values, so just translate it
+            return self.localizer(locale_name).translate(
+                term, domain=domain, mapping=mapping)
+        translation = self._translations.get(key)
+        if translation is None:
+            translation = self.localizer(locale_name).translate(
+                term, domain=domain, mapping=mapping)
+            self._translations.set(key, translation)
+        return translation
+
+    def pluralize(self, locale_name, singular, plural, n, domain=None,
+                  mapping=None):
+        return self.localizer(locale_name).pluralize(
+            singular, plural, n, domain=domain, mapping=mapping)
+
+    def warm(self, locale_names):
+        """
+        Load the localizers for ``locale_names`` and translate every
+        message in their catalogs.
+        """
+        for locale_name in locale_names:
+            translations = self.localizer(locale_name).translations
+            for domain, msgid in _catalog_messages(translations):
+                self.translate(locale_name, msgid, domain=domain)
+
+
+def _catalog_messages(translations):
+    """
+    Yield the domain and msgid of each message of ``translations``.
+
+    Neither Pyramid nor gettext has a public way to list them, so this
+    relies on the ``_domains`` of Pyramid's ``Translations`` and the
+    ``_catalog`` of gettext's ``GNUTranslations``. Should those change,
+    it yields nothing, and the cache only fills as messages are
+    translated.
+    """
+    domains = getattr(translations, '_domains', None)
+    if not isinstance(domains, dict):
+        return
+    for domain, catalog in domains.items():
+        messages = getattr(catalog, '_catalog', None)
+        if not isinstance(messages, dict):
+            continue
+        for msgid in list(messages):
+            # plural forms are keyed by (msgid, n), and the empty msgid
+            # holds the catalog's metadata
+            if isinstance(msgid, str) and msgid:
+                yield domain, msgid
+
+
+class CachedGetText(object):
+    """
+    The ``gettext`` and ``ngettext`` functions for Jinja2 templates,
+    translating through the registry's `TranslationCache`. Used as the
+    ``jinja2.i18n.gettext`` setting.
+    """
+    def __init__(self, domain):
+        self.domain = domain
+
+    def gettext(self, message, mapping=None):
+        request = get_current_request()
+        return request.registry['translation_cache'].translate(
+            request.locale_name, message, domain=self.domain,
+            mapping=mapping)
+
+    def ngettext(self, singular, plural, n, mapping=None):
+        request = get_current_request()
+        return request.registry['translation_cache'].pluralize(
+            request.locale_name, singular, plural, n, domain=self.domain,
+            mapping=mapping)
+
+
 def includeme(config):
     config.registry.setdefault('default_locale_name', 'en')
     config.add_translation_dirs(
@@ -55,13 +214,25 @@ def includeme(config):
         'deform:locale',
     )
 
-    available = ['en', 'de']
+    available = config.registry['available_languages'] = ['en', 'de']
+    cache_size = int(config.registry.settings.get(
+        'paildocket.i18n.accept_language_cache_size', 1000))
     locale_negotiator = SessionLocaleNegotiator(
-        AcceptLanguageLocaleNegotiator(available))
+        AcceptLanguageLocaleNegotiator(available, cache_size=cache_size))
     config.set_locale_negotiator(locale_negotiator)
+    config.add_subscriber(vary_on_negotiated_locale, NewResponse)
+
+    translation_cache = config.registry['translation_cache'] = (
+        TranslationCache(config.registry, int(config.registry.settings.get(
+            'paildocket.i18n.translation_cache_size', 10000))))
+
+    def warm_translation_cache(event):
+        translation_cache.warm(available)
+    config.add_subscriber(warm_translation_cache, ApplicationCreated)
 
     def translator(term):
-        return get_localizer(get_current_request()).translate(term)
+        request = get_current_request()
+        return translation_cache.translate(request.locale_name, term)
 
     deform_template_dir = resource_filename('deform', 'templates/')
     zpt_renderer = deform.ZPTRendererFactory(
@@ -0,0 +1,77 @@
+"""
+Autocompletion of users, for choosing whom to share a checklist with.
+
+Lookups match the start of usernames and emails, and also similar ones
+if the ``pg_trgm`` extension is installed (or as forced by
+``paildocket.user_lookup.fuzzy``). Results are limited to
+``paildocket.user_lookup.max_results`` and cached for
+``paildocket.user_lookup.cache_ttl`` seconds, so the bursts of requests
+sent while someone types mostly hit the cache.
+"""
+from pyramid.settings import asbool
+
+from paildocket.cache import LRUCache
+from paildocket.models import User, has_extension
+
+
+class UserLookup(object):
+    """
+    Looks up users by the start of their username or email, or, if
+    ``fuzzy``, by similarity too. If ``fuzzy`` is None, whether
+    ``pg_trgm`` is installed decides on the first lookup.
+
+    Terms shorter than ``min_length`` match nothing, since they would
+    match too many users to be useful or fast.
+    """
+    def __init__(self, min_length=2, max_results=10, fuzzy=None,
+                 cache_size=1000, cache_ttl=30):
+        self.min_length = min_length
+        self.max_results = max_results
+        self.fuzzy = fuzzy
+        self.cache_ttl = cache_ttl
+        if cache_size and cache_ttl:
+            self._cache = LRUCache(cache_size, ttl=cache_ttl)
+        else:
+            self._cache = None
+
+    def lookup(self, db_session, term, limit=None):
+        """
+        Return a list of at most ``limit`` (or ``max_results``) dicts,
+        with the encoded userid and username of the matching users.
+        Emails are left out, since the results are not limited to the
+        users one already knows.
+        """
+        term = term.strip().lower()
+        if len(term) < self.min_length:
+            return []
+        if limit is None or not 0 < limit <= self.max_results:
+            limit = self.max_results
+        key = (term, limit)
+        if self._cache is not None:
+            results = self._cache.get(key)
+            if results is not None:
+                return results
+        if self.fuzzy is None:
+            self.fuzzy = has_extension(db_session, 'pg_trgm')
+        users = User.lookup_query(db_session, term, fuzzy=self.fuzzy)
+        results = [
+            {'id': user.encoded_userid, 'username': user.username}
+            for user in users.limit(limit)
+        ]
+        if self._cache is not None:
+            self._cache.set(key, results)
+        return results
+
+
+def includeme(config):
+    settings = config.registry.settings
+    fuzzy = settings.get('paildocket.user_lookup.fuzzy', 'auto')
+    config.registry['user_lookup'] = UserLookup(
+        min_length=int(settings.get('paildocket.user_lookup.min_length', 2)),
+        max_results=int(settings.get(
+            'paildocket.user_lookup.max_results', 10)),
+        fuzzy=None if fuzzy == 'auto' else asbool(fuzzy),
+        cache_size=int(settings.get(
+            'paildocket.user_lookup.cache_size', 1000)),
+        cache_ttl=int(settings.get('paildocket.user_lookup.cache_ttl', 30)),
+    )
@@ -9,11 +9,16 @@ from sqlalchemy import engine_from_config
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import make_url
 from pyramid.paster import get_appsettings, setup_logging
+from passlib.context import CryptContext
 from zope.sqlalchemy import mark_changed
 import transaction
 
+from paildocket.assets import build_assets
 from paildocket.models import Base, User
-from paildocket.security import create_password_context
+from paildocket.rehash import count_password_hashes
+from paildocket.security import (
+    create_password_context, password_policy_from_settings
+)
 from paildocket.tests import fixtures
 
 
@@ -70,6 +75,16 @@ class InitializeDatabaseCommand(BaseCommand):
             'psql', '-d', db_name,
             '-c', 'CREATE EXTENSION IF NOT EXISTS "uuid-ossp"'
         ])
+        # pg_trgm (from postgresql-contrib) enables the fuzzy matches
+        # and trigram indexes of user autocompletion.
+        logger.info('Installing optional database extensions')
+        if subprocess.call([
+            'psql', '-d', db_name,
+            '-c', 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+        ]):
+            logger.warning(
+                'Could not install pg_trgm, user lookups will only match '
+                'prefixes')
         engine = engine_from_config(settings, 'sqlalchemy.', echo=args.verbose)
         logger.info('Creating all tables')
         Base.metadata.create_all(engine)
@@ -106,6 +121,68 @@ class AddUserCommand(BaseCommand):
 add_user = AddUserCommand()
 
 
+class PasswordStatusCommand(BaseCommand):
+    """
+    Report how many password hashes the configured policy would
+    upgrade, to follow the progress of a policy change.
+    """
+    name = 'paildocket-password-status'
+
+    def configure_parser(self):
+        pass
+
+    def run(self, args):
+        settings = get_appsettings(self.config_uri)
+        engine = engine_from_config(settings, 'sqlalchemy.')
+        session = sessionmaker(bind=engine)()
+        pwctx = CryptContext(**password_policy_from_settings(settings))
+
+        hashes = session.query(User.password_hash).yield_per(1000)
+        rows = count_password_hashes(pwctx, (h for h, in hashes))
+        session.close()
+
+        print('{0:<12} {1:>8} {2:>10}  {3}'.format(
+            'scheme', 'rounds', 'users', 'status'))
+        for row in rows:
+            print('{0:<12} {1:>8} {2:>10}  {3}'.format(
+                row.scheme or 'unknown',
+                '-' if row.rounds is None else row.rounds,
+                row.count,
+                'upgrade at next login' if row.needs_update else 'current',
+            ))
+        total = sum(row.count for row in rows)
+        current = sum(row.count for row in rows if not row.needs_update)
+        print('{0} of {1} password hashes current ({2:.0%})'.format(
+            current, total, current / total if total else 1))
+
+
+password_status = PasswordStatusCommand()
+
+
+class BuildAssetsCommand(BaseCommand):
+    """
+    Build the fingerprinted and precompressed static assets into the
+    configured ``paildocket.assets.directory``.
+    """
+    name = 'paildocket-build-assets'
+
+    def configure_parser(self):
+        pass
+
+    def run(self, args):
+        settings = get_appsettings(self.config_uri)
+        directory = settings.get('paildocket.assets.directory')
+        if not directory:
+            logger.error('paildocket.assets.directory is not configured')
+            sys.exit(1)
+        os.makedirs(directory, exist_ok=True)
+        manifest = build_assets(directory)
+        for spec, built_name in sorted(manifest.items()):
+            print('{0} -> {1}'.format(spec, built_name))
+
+
+build_assets_command = BuildAssetsCommand()
+
 
 # This is broken, needs reimplementation.
 # This shouldn't be here anyway since it touches the test code, and fixtures
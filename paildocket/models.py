@@ -8,20 +8,30 @@ Glossary:
 """
 import logging
 from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import chain
 from uuid import UUID
 
 
 from sqlalchemy import (
-    Column, UniqueConstraint, CheckConstraint,
-    Integer, String, Boolean, ForeignKey,
-    or_, and_, not_, text,
-    engine_from_config
+    Table, Column, UniqueConstraint, CheckConstraint, Index,
+    Integer, String, Boolean, Float, ForeignKey,
+    or_, and_, not_, text, case, bindparam, exists, select, union_all, func,
+    cast, engine_from_config, event, DDL, FetchedValue
 )
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import (
+    relationship, sessionmaker, deferred, undefer,
+    object_session, Session
+)
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.ext import baked
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-from zope.sqlalchemy import register as zope_sqla_register
+from sqlalchemy.dialects.postgresql import (
+    UUID as PG_UUID, TSVECTOR, DOUBLE_PRECISION
+)
+from zope.sqlalchemy import register as zope_sqla_register, mark_changed
+
+from paildocket.pagination import ordered_keyset_page
 
 
 logger = logging.getLogger(__name__)
@@ -30,6 +40,17 @@ logger = logging.getLogger(__name__)
 Base = declarative_base()
 
 
+# Cache of compiled queries for the hot lookups below. Each baked query
+# is keyed on the code of the lambdas that build it, so the lambdas
+# must only vary in their bound parameters.
+bakery = baked.bakery()
+
+
+# The role a user has on a checklist, as reported by list queries.
+EDIT_ROLE = 'edit'
+VIEW_ROLE = 'view'
+
+
 def userid_to_encoded_userid(userid):
     return urlsafe_b64encode(userid.bytes).decode('ascii').rstrip('=')
 
@@ -55,6 +76,10 @@ class User(Base):
     username = Column(String, nullable=False, unique=True)
     password_hash = Column(String, nullable=False)
     admin = Column(Boolean, nullable=False, default=False)
+    # Bumped whenever the list of checklists the user can see, or how
+    # it renders, may have changed; see `bump_permissions_generation`.
+    permissions_generation = Column(
+        Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         attrs = ['id', 'username', 'email']
@@ -76,8 +101,7 @@ class User(Base):
         user = None
         if userid is not None:
             logger.debug('Found userid {0!r}'.format(userid))
-            q = request.db_session.query(cls).filter(cls.id == userid)
-            user = q.one()
+            user = request.user_identity_map.get(userid)
         return user
 
     @classmethod
@@ -87,7 +111,20 @@ class User(Base):
 
     @classmethod
     def from_userid(cls, db_session, userid):
-        return db_session.query(cls).filter(cls.id == userid).first()
+        bq = bakery(lambda s: s.query(cls))
+        bq += lambda q: q.filter(cls.id == bindparam('userid'))
+        return bq(db_session).params(userid=userid).first()
+
+    @classmethod
+    def existing_userids(cls, db_session, userids):
+        """
+        Return the set of the ``userids`` which belong to a user.
+        """
+        userids = set(userids)
+        if not userids:
+            return set()
+        q = db_session.query(cls.id).filter(cls.id.in_(userids))
+        return set(userid for userid, in q)
 
     @classmethod
     def from_identity(cls, db_session, identity):
@@ -97,9 +134,208 @@ class User(Base):
 
         ``identity`` is either the username or the email.
         """
+        bq = bakery(lambda s: s.query(cls))
+        bq += lambda q: q.filter(or_(
+            cls.username == bindparam('identity'),
+            cls.email == bindparam('identity'),
+        ))
+        return bq(db_session).params(identity=identity).first()
+
+    @classmethod
+    def from_identities(cls, db_session, identities):
+        """
+        Return a dict mapping those of ``identities`` (usernames or
+        emails, as for `from_identity`) which identify a user to the
+        user, with one query.
+        """
+        identities = set(identities)
+        if not identities:
+            return {}
+        q = db_session.query(cls).filter(or_(
+            cls.username.in_(identities), cls.email.in_(identities)))
+        found = {}
+        for user in q:
+            for identity in (user.username, user.email):
+                if identity in identities:
+                    found[identity] = user
+        return found
+
+    @classmethod
+    def lookup_query(cls, db_session, term, fuzzy=False):
+        """
+        Return a query for the users whose lowercased username or email
+        starts with ``term``, best matches first, for autocompletion.
+
+        If ``fuzzy``, which needs the ``pg_trgm`` extension, users whose
+        username or email is merely similar to ``term`` match as well,
+        after the prefix matches and by decreasing similarity.
+        """
+        term = term.lower()
+        username, email = func.lower(cls.username), func.lower(cls.email)
+        pattern = _escape_like(term) + '%'
+        prefix = or_(
+            username.like(pattern, escape='\\'),
+            email.like(pattern, escape='\\'))
+        q = db_session.query(cls)
+        if not fuzzy:
+            return q.filter(prefix).order_by(cls.username)
+        # pg_trgm's similarity operator is ``%``, doubled for psycopg2's
+        # parameter formatting.
+        similar = or_(
+            username.op('%%')(term), email.op('%%')(term))
+        similarity = func.greatest(
+            func.similarity(username, term), func.similarity(email, term))
+        return q.filter(or_(prefix, similar)).order_by(
+            prefix.desc(), similarity.desc(), cls.username)
+
+
+def has_extension(connection, name):
+    """
+    Return True if the extension ``name`` is installed in the database
+    of ``connection`` (a connection or a session).
+    """
+    return connection.execute(text(
+        'SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = :name)'
+    ), {'name': name}).scalar()
+
+
+def _has_pg_trgm(ddl, target, bind, **kw):
+    return has_extension(bind, 'pg_trgm')
+
+
+def _escape_like(value):
+    return (value.replace('\\', '\\\\')
+            .replace('%', '\\%').replace('_', '\\_'))
+
+
+# Lowercased ``text_pattern_ops`` indexes serve the prefix matches of
+# `User.lookup_query`, and trigram indexes its fuzzy matches, when the
+# ``pg_trgm`` extension is installed.
+for _column in ('username', 'email'):
+    event.listen(User.__table__, 'after_create', DDL(
+        'CREATE INDEX ix_%(table)s_{0}_prefix '
+        'ON %(table)s (lower({0}) text_pattern_ops)'.format(_column)))
+    event.listen(User.__table__, 'after_create', DDL(
+        'CREATE INDEX ix_%(table)s_{0}_trgm '
+        'ON %(table)s USING gin (lower({0}) gin_trgm_ops)'.format(_column)
+    ).execute_if(callable_=_has_pg_trgm))
+
+
+class UserIdentityMap(object):
+    """
+    Request-scoped cache of users looked up by userid.
+
+    The authentication callback and ``request.user`` both need the
+    authenticated user; sending both through the same map means the
+    ``users`` row is queried at most once per request. Missing users
+    are remembered as None as well.
+
+    ``saved_lookups`` counts the lookups answered without a query.
+    """
+    def __init__(self, db_session):
+        self._db_session = db_session
+        self._users = {}
+        self.saved_lookups = 0
+
+    def get(self, userid):
+        """
+        Return the user with the given ``userid`` or None if the
+        user was not found.
+        """
+        key = str(userid)
+        try:
+            user = self._users[key]
+        except KeyError:
+            user = User.from_userid(self._db_session, userid)
+            self._users[key] = user
+        else:
+            self.saved_lookups += 1
+        return user
+
+    def add(self, userid, user):
+        """
+        Remember ``user`` (or None, if there is no such user) as the
+        user with the given ``userid``, when it was loaded some other
+        way.
+        """
+        self._users[str(userid)] = user
+
+
+# The users directly in each group
+group_members = Table(
+    'group_members', Base.metadata,
+    Column(
+        'group_id', ForeignKey('groups.id', ondelete='CASCADE'),
+        primary_key=True),
+    Column(
+        'user_id', ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True),
+    Index('ix_group_members_user_id_group_id', 'user_id', 'group_id'),
+)
+
+# The groups directly in each group
+group_subgroups = Table(
+    'group_subgroups', Base.metadata,
+    Column(
+        'group_id', ForeignKey('groups.id', ondelete='CASCADE'),
+        primary_key=True),
+    Column(
+        'subgroup_id', ForeignKey('groups.id', ondelete='CASCADE'),
+        primary_key=True),
+    CheckConstraint('group_id <> subgroup_id', name='group_not_own_subgroup'),
+    Index(
+        'ix_group_subgroups_subgroup_id_group_id', 'subgroup_id', 'group_id'),
+)
+
+# Every group each user is in, directly or through subgroups, kept up
+# to date from the two tables above (see `refresh_group_closure`) so
+# that checking a user's permissions never walks the nesting.
+group_closure = Table(
+    'group_closure', Base.metadata,
+    Column(
+        'user_id', ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True),
+    Column(
+        'group_id', ForeignKey('groups.id', ondelete='CASCADE'),
+        primary_key=True),
+    # Finding the users of a group
+    Index('ix_group_closure_group_id_user_id', 'group_id', 'user_id'),
+)
+
+
+class Group(Base):
+    """
+    A named group of users and other groups, which checklists can be
+    shared with (see `ChecklistGroupPermission`).
+    """
+    __tablename__ = 'groups'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    members = relationship(
+        'User', secondary=group_members, collection_class=set,
+        passive_deletes=True,
+    )
+    subgroups = relationship(
+        'Group', secondary=group_subgroups, collection_class=set,
+        primaryjoin=lambda: Group.id == group_subgroups.c.group_id,
+        secondaryjoin=lambda: Group.id == group_subgroups.c.subgroup_id,
+        passive_deletes=True,
+    )
+
+    def __repr__(self):
+        return '<Group(id={0!r}, name={1!r})>'.format(self.id, self.name)
+
+    @classmethod
+    def for_user_query(cls, db_session, user):
+        """
+        Return a query for the groups ``user`` is in, directly or
+        through subgroups.
+        """
         q = db_session.query(cls)
-        q = q.filter(or_(User.username == identity, User.email == identity))
-        return q.first()
+        q = q.join(group_closure, group_closure.c.group_id == cls.id)
+        q = q.filter(group_closure.c.user_id == user.id)
+        return q
 
 
 def _viewer_only_permission_join():
@@ -118,12 +354,96 @@ def _editor_permission_join():
     return exp
 
 
+def _viewer_only_group_permission_join():
+    return and_(
+        Checklist.id == ChecklistGroupPermission.checklist_id,
+        ChecklistGroupPermission.view, not_(ChecklistGroupPermission.edit),
+    )
+
+
+def _editor_group_permission_join():
+    return and_(
+        Checklist.id == ChecklistGroupPermission.checklist_id,
+        ChecklistGroupPermission.edit,
+    )
+
+
+def _user_has(user_id, checklist_id, flag):
+    """
+    Return a clause true if the user has the permission ``flag``
+    (``'view'`` or ``'edit'``) on the checklist, either directly or
+    through one of their groups.
+
+    Both lookups only need indexes: ``user_id`` and ``checklist_id``
+    find the user's own permission, and the group closure leads from
+    the user to their groups' permissions.
+    """
+    direct = exists().where(and_(
+        ChecklistPermission.user_id == user_id,
+        ChecklistPermission.checklist_id == checklist_id,
+        getattr(ChecklistPermission, flag),
+    ))
+    through_group = exists().where(and_(
+        group_closure.c.user_id == user_id,
+        ChecklistGroupPermission.group_id == group_closure.c.group_id,
+        ChecklistGroupPermission.checklist_id == checklist_id,
+        getattr(ChecklistGroupPermission, flag),
+    ))
+    return or_(direct, through_group)
+
+
+def _role(user_id, checklist_id):
+    """
+    Return the user's role on the checklist, `EDIT_ROLE`, `VIEW_ROLE`
+    or NULL, as an SQL expression.
+    """
+    return case([
+        (_user_has(user_id, checklist_id, 'edit'), EDIT_ROLE),
+        (_user_has(user_id, checklist_id, 'view'), VIEW_ROLE),
+    ], else_=None)
+
+
+# Text search configuration of the search vectors and queries
+SEARCH_CONFIG = 'english'
+
+# The columns of the rows of `Checklist.export_query`
+EXPORT_COLUMNS = [
+    'checklist_id', 'checklist_title', 'checklist_description',
+    'item_id', 'item_title', 'item_description',
+]
+
+
+def _search_vector_column():
+    # Set by the trigger of `_create_search_trigger`
+    return deferred(Column(
+        TSVECTOR, server_default=FetchedValue(),
+        server_onupdate=FetchedValue()))
+
+
+def _search_rank(search_vector, search_query):
+    # As double precision, so that ranks survive the round trip through
+    # page keys unchanged.
+    return cast(func.ts_rank(search_vector, search_query), DOUBLE_PRECISION)
+
+
 class Checklist(Base):
     __tablename__ = 'checklists'
+    __table_args__ = (
+        Index(
+            'ix_checklists_search_vector', 'search_vector',
+            postgresql_using='gin'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
-    description = Column(String, nullable=False, default='')
+    # Up to 10k characters and not needed by list views, so only
+    # loaded on access (or with ``undefer``).
+    description = deferred(Column(String, nullable=False, default=''))
+    # Incremented on every change to the checklist or its items, see
+    # `bump_checklist_version`; served as the JSON view's ETag.
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # Title and description, for `search_query`
+    search_vector = _search_vector_column()
     viewer_permissions = relationship(
         'ChecklistPermission',
         primaryjoin=_viewer_only_permission_join,
@@ -142,29 +462,281 @@ class Checklist(Base):
         'editor_permissions', 'user',
         creator=(lambda u: ChecklistPermission.from_editor_user(u))
     )
+    viewer_group_permissions = relationship(
+        'ChecklistGroupPermission',
+        primaryjoin=_viewer_only_group_permission_join,
+        collection_class=set,
+    )
+    editor_group_permissions = relationship(
+        'ChecklistGroupPermission',
+        primaryjoin=_editor_group_permission_join,
+        collection_class=set,
+    )
+    viewer_groups = association_proxy(
+        'viewer_group_permissions', 'group',
+        creator=(lambda g: ChecklistGroupPermission.from_viewer_group(g))
+    )
+    editor_groups = association_proxy(
+        'editor_group_permissions', 'group',
+        creator=(lambda g: ChecklistGroupPermission.from_editor_group(g))
+    )
+
+    @classmethod
+    def from_id(cls, db_session, checklist_id):
+        bq = bakery(lambda s: s.query(cls))
+        bq += lambda q: q.filter(cls.id == bindparam('checklist_id'))
+        return bq(db_session).params(checklist_id=checklist_id).first()
+
+    @classmethod
+    def with_role_for_user(cls, db_session, user_id, checklist_id,
+                           with_description=False):
+        """
+        Return the user with the given ``user_id``, the checklist with
+        the given ``checklist_id`` (including its deferred
+        ``description`` if ``with_description`` is true) and the
+        user's role on it, `EDIT_ROLE`, `VIEW_ROLE` or None, with a
+        single query, as a ``(user, checklist, role)`` tuple.
+
+        The checklist is None if there is no such checklist, and all
+        three are None if there is no such user.
+        """
+        bq = bakery(lambda s: s.query(
+            User, cls, _role(User.id, cls.id).label('role')))
+        bq += lambda q: q.outerjoin(
+            cls, cls.id == bindparam('checklist_id'),
+        ).filter(User.id == bindparam('user_id'))
+        if with_description:
+            bq += lambda q: q.options(undefer(cls.description))
+        result = bq(db_session).params(
+            user_id=user_id, checklist_id=checklist_id)
+        row = result.first()
+        if row is None:
+            return None, None, None
+        return tuple(row)
 
     @classmethod
     def editable_by_user_query(cls, db_session, user):
         q = db_session.query(cls)
-        q = q.join(*cls.editors.attr)
-        q = q.filter(ChecklistPermission.user == user)
+        q = q.filter(_user_has(user.id, cls.id, 'edit'))
         return q
 
+    @classmethod
+    def ids_editable_by_user(cls, db_session, user, checklist_ids):
+        """
+        Return the set of the ``checklist_ids`` of checklists which
+        ``user`` can edit.
+        """
+        checklist_ids = set(checklist_ids)
+        if not checklist_ids:
+            return set()
+        q = cls.editable_by_user_query(db_session, user).with_entities(cls.id)
+        q = q.filter(cls.id.in_(checklist_ids))
+        return set(checklist_id for checklist_id, in q)
+
     @classmethod
     def only_viewable_by_user_query(cls, db_session, user):
         q = db_session.query(cls)
-        q = q.join(*cls.viewers.attr)
-        q = q.filter(ChecklistPermission.user == user)
+        q = q.filter(
+            _user_has(user.id, cls.id, 'view'),
+            not_(_user_has(user.id, cls.id, 'edit')),
+        )
         return q
 
+    @classmethod
+    def export_query(cls, db_session, user_id, checklist_id=None):
+        """
+        Return a query for the rows exporting the checklists the user
+        with ``user_id`` can view (only the one with ``checklist_id``,
+        if given) with their items, ordered by checklist then item.
+
+        Each row has the `EXPORT_COLUMNS`; a checklist without items
+        gets one row, whose item columns are None.
+        """
+        item = ChecklistItem
+        q = db_session.query(
+            cls.id.label('checklist_id'),
+            cls.title.label('checklist_title'),
+            cls.description.label('checklist_description'),
+            item.id.label('item_id'),
+            item.title.label('item_title'),
+            item.description.label('item_description'),
+        )
+        q = q.outerjoin(item, item.checklist_id == cls.id)
+        # Checked again, since an export is read after the request's
+        # transaction has ended.
+        q = q.filter(_user_has(user_id, cls.id, 'view'))
+        if checklist_id is not None:
+            q = q.filter(cls.id == checklist_id)
+        return q.order_by(cls.id, item.id)
+
+    @classmethod
+    def visible_to_user_query(cls, db_session, user):
+        """
+        Return a query for the ``id``, ``title`` and ``role`` of every
+        checklist the user can view, directly or through their groups,
+        where ``role`` is `EDIT_ROLE` or `VIEW_ROLE`.
+        """
+        direct = ChecklistPermission.__table__
+        group = ChecklistGroupPermission.__table__
+        grants = union_all(
+            select([direct.c.checklist_id, direct.c.edit])
+            .where(direct.c.user_id == user.id)
+            .where(direct.c.view),
+            select([group.c.checklist_id, group.c.edit])
+            .select_from(group_closure.join(
+                group, group.c.group_id == group_closure.c.group_id))
+            .where(group_closure.c.user_id == user.id)
+            .where(group.c.view),
+        ).alias('grants')
+        role = case(
+            [(func.bool_or(grants.c.edit), EDIT_ROLE)], else_=VIEW_ROLE)
+        q = db_session.query(cls.id, cls.title, role.label('role'))
+        q = q.join(grants, cls.id == grants.c.checklist_id)
+        q = q.group_by(cls.id, cls.title)
+        return q
+
+    @classmethod
+    def search_page(cls, db_session, user, terms, page_size,
+                    after=None, before=None):
+        """
+        Return a `KeysetPage` of the ``id``, ``title``, ``role`` and
+        ``rank`` of the checklists the user can view whose title or
+        description, or the title or description of one of whose
+        items, matches the web search style query ``terms``. Rows are
+        ordered by descending rank and then id, and keyed by
+        ``(rank, id)``.
+
+        A checklist's rank is that of its best match. The matches are
+        found through the search vectors' indexes, and those the user
+        cannot view are dropped before being ranked and grouped, so
+        only the user's own matches are ranked.
+        """
+        search_query = func.websearch_to_tsquery(SEARCH_CONFIG, terms)
+        items = ChecklistItem.__table__
+        checklists = cls.__table__
+        matches = union_all(
+            select([
+                checklists.c.id.label('checklist_id'),
+                _search_rank(checklists.c.search_vector, search_query)
+                .label('rank'),
+            ]).where(and_(
+                checklists.c.search_vector.op('@@')(search_query),
+                _user_has(user.id, checklists.c.id, 'view'),
+            )),
+            select([
+                items.c.checklist_id,
+                _search_rank(items.c.search_vector, search_query),
+            ]).where(and_(
+                items.c.search_vector.op('@@')(search_query),
+                _user_has(user.id, items.c.checklist_id, 'view'),
+            )),
+        ).alias('matches')
+        best = select([
+            matches.c.checklist_id, func.max(matches.c.rank).label('rank'),
+        ]).group_by(matches.c.checklist_id).alias('best')
+        role = case(
+            [(_user_has(user.id, cls.id, 'edit'), EDIT_ROLE)],
+            else_=VIEW_ROLE)
+        q = db_session.query(
+            cls.id, cls.title, role.label('role'), best.c.rank)
+        q = q.join(best, cls.id == best.c.checklist_id)
+        return ordered_keyset_page(
+            q, [best.c.rank.desc(), cls.id], page_size,
+            after=after, before=before)
+
 
 class ChecklistItem(Base):
     __tablename__ = 'checklist_items'
+    __table_args__ = (
+        # Reads the items of checklists in order, as exports do
+        Index('ix_checklist_items_checklist_id', 'checklist_id', 'id'),
+        Index(
+            'ix_checklist_items_search_vector', 'search_vector',
+            postgresql_using='gin'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
-    description = Column(String, nullable=False, default='')
+    description = deferred(Column(String, nullable=False, default=''))
     checklist_id = Column(ForeignKey('checklists.id'))
+    # Title and description, for `Checklist.search_query`
+    search_vector = _search_vector_column()
+
+
+# Keeps the ``search_vector`` of a row with a title and description up
+# to date, weighting the title above the description.
+_SEARCH_VECTOR_FUNCTION = DDL("""
+CREATE OR REPLACE FUNCTION paildocket_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{0}', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('{0}', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""".format(SEARCH_CONFIG))
+
+_SEARCH_VECTOR_TRIGGER = DDL("""
+CREATE TRIGGER %(table)s_search_vector
+BEFORE INSERT OR UPDATE OF title, description ON %(table)s
+FOR EACH ROW EXECUTE PROCEDURE paildocket_search_vector()
+""")
+
+for _table in (Checklist.__table__, ChecklistItem.__table__):
+    event.listen(_table, 'after_create', _SEARCH_VECTOR_FUNCTION)
+    event.listen(_table, 'after_create', _SEARCH_VECTOR_TRIGGER)
+event.listen(Base.metadata, 'after_drop', DDL(
+    'DROP FUNCTION IF EXISTS paildocket_search_vector()'))
+
+
+# Grant each (checklist, user) pair of the arrays view, and edit where
+# ``edits`` is true. Existing permissions are only ever widened, and
+# rows which already had the permission are left alone (and so are not
+# returned).
+_GRANT_PERMISSIONS_SQL = text("""
+INSERT INTO checklists_permissions AS permission
+    (checklist_id, user_id, view, edit)
+SELECT checklist_id, user_id, true, edit
+FROM unnest(
+    CAST(:checklist_ids AS integer[]),
+    CAST(:user_ids AS uuid[]),
+    CAST(:edits AS boolean[])
+) AS grants (checklist_id, user_id, edit)
+ON CONFLICT (checklist_id, user_id) DO UPDATE SET
+    view = true,
+    edit = permission.edit OR EXCLUDED.edit
+WHERE NOT permission.view OR (EXCLUDED.edit AND NOT permission.edit)
+RETURNING permission.user_id
+""")
+
+# Delete the permissions of the (checklist, user) pairs of the
+# ``view_*`` arrays, and take edit away from the ``edit_*`` pairs.
+_REVOKE_PERMISSIONS_SQL = text("""
+WITH deleted AS (
+    DELETE FROM checklists_permissions AS permission
+    USING unnest(
+        CAST(:view_checklist_ids AS integer[]),
+        CAST(:view_user_ids AS uuid[])
+    ) AS revokes (checklist_id, user_id)
+    WHERE permission.checklist_id = revokes.checklist_id
+    AND permission.user_id = revokes.user_id
+    RETURNING permission.user_id
+), updated AS (
+    UPDATE checklists_permissions AS permission
+    SET edit = false
+    FROM unnest(
+        CAST(:edit_checklist_ids AS integer[]),
+        CAST(:edit_user_ids AS uuid[])
+    ) AS revokes (checklist_id, user_id)
+    WHERE permission.checklist_id = revokes.checklist_id
+    AND permission.user_id = revokes.user_id
+    AND permission.edit
+    RETURNING permission.user_id
+)
+SELECT user_id FROM deleted
+UNION ALL
+SELECT user_id FROM updated
+""")
 
 
 class ChecklistPermission(Base):
@@ -173,11 +745,17 @@ class ChecklistPermission(Base):
         # Single permission per checklist/user combination
         UniqueConstraint('checklist_id', 'user_id'),
         # Edit implies view
-        CheckConstraint('NOT edit OR view', name='edit_implies_view')
+        CheckConstraint('NOT edit OR view', name='edit_implies_view'),
+        # Listing a user's checklists; with the flags, permission
+        # checks are answered from the index alone
+        Index(
+            'ix_checklists_permissions_user_id_checklist_id',
+            'user_id', 'checklist_id', 'view', 'edit'),
     )
 
     id = Column(Integer, primary_key=True)
     checklist_id = Column(ForeignKey('checklists.id'), nullable=False)
+    checklist = relationship('Checklist')
     user_id = Column(ForeignKey('users.id'), nullable=False)
     user = relationship('User')
     view = Column(Boolean, nullable=False)
@@ -193,9 +771,478 @@ class ChecklistPermission(Base):
 
     @classmethod
     def for_user_and_checklist(cls, db_session, user_id, checklist_id):
-        q = db_session.query(cls)
-        q = q.filter(cls.user_id == user_id, cls.checklist_id == checklist_id)
-        return q.first()
+        bq = bakery(lambda s: s.query(cls))
+        bq += lambda q: q.filter(
+            cls.user_id == bindparam('user_id'),
+            cls.checklist_id == bindparam('checklist_id'),
+        )
+        result = bq(db_session).params(
+            user_id=user_id, checklist_id=checklist_id)
+        return result.first()
+
+    @classmethod
+    def grant_many(cls, db_session, grants):
+        """
+        Grant every ``(checklist_id, user_id, role)`` of ``grants``
+        with one statement, where ``role`` is `EDIT_ROLE` or
+        `VIEW_ROLE`. Nobody loses a permission: granting view to an
+        editor leaves them an editor.
+
+        Return the number of permissions created or widened.
+        """
+        pairs = {}
+        for checklist_id, user_id, role in grants:
+            key = (checklist_id, str(user_id))
+            pairs[key] = pairs.get(key, False) or role == EDIT_ROLE
+        if not pairs:
+            return 0
+        checklist_ids, user_ids = _unzip_pairs(pairs)
+        return _change_permissions(db_session, _GRANT_PERMISSIONS_SQL, {
+            'checklist_ids': checklist_ids,
+            'user_ids': user_ids,
+            'edits': list(pairs.values()),
+        })
+
+    @classmethod
+    def revoke_many(cls, db_session, revocations):
+        """
+        Revoke every ``(checklist_id, user_id, role)`` of
+        ``revocations`` with one statement. Revoking `VIEW_ROLE`
+        removes the permission altogether; revoking `EDIT_ROLE` leaves
+        the user a viewer.
+
+        Return the number of permissions removed or narrowed.
+        """
+        pairs = {}
+        for checklist_id, user_id, role in revocations:
+            key = (checklist_id, str(user_id))
+            pairs[key] = pairs.get(key, False) or role == VIEW_ROLE
+        if not pairs:
+            return 0
+        view_checklist_ids, view_user_ids = _unzip_pairs(
+            key for key, remove in pairs.items() if remove)
+        edit_checklist_ids, edit_user_ids = _unzip_pairs(
+            key for key, remove in pairs.items() if not remove)
+        return _change_permissions(db_session, _REVOKE_PERMISSIONS_SQL, {
+            'view_checklist_ids': view_checklist_ids,
+            'view_user_ids': view_user_ids,
+            'edit_checklist_ids': edit_checklist_ids,
+            'edit_user_ids': edit_user_ids,
+        })
+
+
+def _unzip_pairs(pairs):
+    checklist_ids = []
+    user_ids = []
+    for checklist_id, user_id in pairs:
+        checklist_ids.append(checklist_id)
+        user_ids.append(user_id)
+    return checklist_ids, user_ids
+
+
+def _change_permissions(db_session, statement, params):
+    """
+    Execute ``statement``, which changes permissions outside the ORM
+    and returns the ``user_id`` of each row it changed, and bring the
+    session and permissions generations up to date. Return the number
+    of rows changed.
+    """
+    # Pending ORM changes to the same rows go first
+    db_session.flush()
+    user_ids = [row.user_id for row in db_session.execute(statement, params)]
+    mark_changed(db_session)
+    connection = db_session.connection()
+    bumped = set(
+        str(user_id) for user_id in
+        bump_permissions_generation(connection, user_ids))
+    for obj in list(db_session.identity_map.values()):
+        if isinstance(obj, ChecklistPermission):
+            db_session.expire(obj)
+        elif isinstance(obj, Checklist):
+            db_session.expire(
+                obj, ['viewer_permissions', 'editor_permissions'])
+        elif isinstance(obj, User) and str(obj.id) in bumped:
+            db_session.expire(obj, ['permissions_generation'])
+    return len(user_ids)
+
+
+class ChecklistGroupPermission(Base):
+    """
+    A group's permission on a checklist, which every user in the group,
+    directly or through subgroups, has.
+    """
+    __tablename__ = 'checklists_group_permissions'
+    __table_args__ = (
+        # Single permission per checklist/group combination
+        UniqueConstraint('checklist_id', 'group_id'),
+        # Edit implies view
+        CheckConstraint('NOT edit OR view', name='group_edit_implies_view'),
+        # Resolving a user's permissions from their groups, without
+        # visiting the table
+        Index(
+            'ix_checklists_group_permissions_group_id_checklist_id',
+            'group_id', 'checklist_id', 'view', 'edit'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    checklist_id = Column(ForeignKey('checklists.id'), nullable=False)
+    checklist = relationship('Checklist')
+    group_id = Column(
+        ForeignKey('groups.id', ondelete='CASCADE'), nullable=False)
+    group = relationship('Group')
+    view = Column(Boolean, nullable=False)
+    edit = Column(Boolean, nullable=False)
+
+    @classmethod
+    def from_viewer_group(cls, viewer_group):
+        return cls(group=viewer_group, view=True, edit=False)
+
+    @classmethod
+    def from_editor_group(cls, editor_group):
+        return cls(group=editor_group, view=True, edit=True)
+
+
+# Every user directly in one of the groups, or in one of their
+# subgroups at any depth.
+_USERS_BELOW_GROUPS_SQL = text("""
+WITH RECURSIVE below (group_id) AS (
+    SELECT unnest(CAST(:group_ids AS integer[]))
+    UNION
+    SELECT subgroups.subgroup_id
+    FROM group_subgroups AS subgroups
+    JOIN below ON subgroups.group_id = below.group_id
+)
+SELECT DISTINCT members.user_id
+FROM group_members AS members
+JOIN below ON members.group_id = below.group_id
+""")
+
+# Insert the group closure rows of the users, walking up from the
+# groups they are directly in. UNION rather than UNION ALL stops at
+# groups already seen, should the groups be nested in a cycle.
+_INSERT_GROUP_CLOSURE_SQL = text("""
+WITH RECURSIVE memberships (user_id, group_id) AS (
+    SELECT user_id, group_id
+    FROM group_members
+    WHERE user_id = ANY(CAST(:user_ids AS uuid[]))
+    UNION
+    SELECT memberships.user_id, subgroups.group_id
+    FROM memberships
+    JOIN group_subgroups AS subgroups
+    ON subgroups.subgroup_id = memberships.group_id
+)
+INSERT INTO group_closure (user_id, group_id)
+SELECT user_id, group_id FROM memberships
+""")
+
+
+def users_below_groups(connection, group_ids):
+    """
+    Return the ids of the users in the groups with the given ids,
+    directly or through subgroups, using ``connection``.
+    """
+    group_ids = list(set(group_ids))
+    if not group_ids:
+        return set()
+    result = connection.execute(_USERS_BELOW_GROUPS_SQL, group_ids=group_ids)
+    return set(UUID(str(row.user_id)) for row in result)
+
+
+def refresh_group_closure(connection, user_ids):
+    """
+    Rebuild the `group_closure` rows of the users with the given ids
+    from `group_members` and `group_subgroups`, using ``connection``.
+    Return the ids of the users refreshed.
+
+    The ORM does this whenever it flushes changes to groups. Anything
+    changing memberships or nesting outside the ORM must call this for
+    the users affected (see `users_below_groups`), and bump their
+    permissions generation.
+    """
+    user_ids = set(user_id for user_id in user_ids if user_id is not None)
+    if user_ids:
+        connection.execute(
+            group_closure.delete()
+            .where(group_closure.c.user_id.in_(user_ids)))
+        connection.execute(
+            _INSERT_GROUP_CLOSURE_SQL,
+            user_ids=[str(user_id) for user_id in user_ids])
+    return user_ids
+
+
+def _group_user_ids(connection, group_ids):
+    """Return the ids of the users in the group closure of the groups."""
+    group_ids = set(group_ids)
+    if not group_ids:
+        return set()
+    result = connection.execute(
+        select([group_closure.c.user_id])
+        .where(group_closure.c.group_id.in_(group_ids)))
+    return set(row.user_id for row in result)
+
+
+def _increment(connection, column, key_column, keys):
+    keys = set(key for key in keys if key is not None)
+    if keys:
+        connection.execute(
+            column.table.update()
+            .where(key_column.in_(keys))
+            .values({column: column + 1})
+        )
+    return keys
+
+
+def bump_permissions_generation(connection, user_ids):
+    """
+    Increment the ``permissions_generation`` of the users with the
+    given ids, using ``connection``. Anything which changes which
+    checklists a user can see, their role on them, or their titles
+    must call this for the affected users.
+    """
+    table = User.__table__
+    return _increment(
+        connection, table.c.permissions_generation, table.c.id, user_ids)
+
+
+def bump_checklist_version(connection, checklist_ids):
+    """
+    Increment the ``version`` of the checklists with the given ids,
+    using ``connection``. Anything which changes a checklist or its
+    items outside the ORM must call this.
+    """
+    table = Checklist.__table__
+    return _increment(connection, table.c.version, table.c.id, checklist_ids)
+
+
+# session.info key for the counters bumped during a flush, as a dict of
+# (model, attribute name) to primary keys
+_STALE_COUNTERS = 'paildocket.stale_counters'
+
+
+def _bump_in_flush(target, connection, model, attribute, keys):
+    bump = {
+        User: bump_permissions_generation,
+        Checklist: bump_checklist_version,
+    }[model]
+    keys = bump(connection, keys)
+    _expire_after_flush(object_session(target), model, attribute, keys)
+
+
+def _expire_after_flush(session, model, attribute, keys):
+    # Loaded instances now hold stale counters; expire them once the
+    # flush is over.
+    stale = session.info.setdefault(_STALE_COUNTERS, {})
+    stale.setdefault((model, attribute), set()).update(keys)
+
+
+@event.listens_for(ChecklistPermission, 'after_insert')
+@event.listens_for(ChecklistPermission, 'after_delete')
+def _permission_inserted_or_deleted(mapper, connection, target):
+    _bump_in_flush(
+        target, connection, User, 'permissions_generation', [target.user_id])
+
+
+@event.listens_for(ChecklistPermission, 'after_update')
+def _permission_updated(mapper, connection, target):
+    histories = [
+        get_history(target, name)
+        for name in ('user_id', 'checklist_id', 'view', 'edit')
+    ]
+    if any(history.has_changes() for history in histories):
+        # old and new user, should it have changed
+        _bump_in_flush(
+            target, connection, User, 'permissions_generation',
+            histories[0].sum())
+
+
+@event.listens_for(ChecklistGroupPermission, 'after_insert')
+@event.listens_for(ChecklistGroupPermission, 'after_delete')
+def _group_permission_inserted_or_deleted(mapper, connection, target):
+    _bump_in_flush(
+        target, connection, User, 'permissions_generation',
+        _group_user_ids(connection, [target.group_id]))
+
+
+@event.listens_for(ChecklistGroupPermission, 'after_update')
+def _group_permission_updated(mapper, connection, target):
+    histories = [
+        get_history(target, name)
+        for name in ('group_id', 'checklist_id', 'view', 'edit')
+    ]
+    if any(history.has_changes() for history in histories):
+        # users of the old and new group, should it have changed
+        _bump_in_flush(
+            target, connection, User, 'permissions_generation',
+            _group_user_ids(connection, histories[0].sum()))
+
+
+# session.info key for what a flush changes about groups: the ids of
+# users in deleted groups, and the users and groups added to or removed
+# from groups (instances, as new ones have no id yet).
+_GROUP_CHANGES = 'paildocket.group_changes'
+
+
+@event.listens_for(Session, 'before_flush')
+def _groups_changing(session, flush_context, instances):
+    user_ids, users, subgroups = session.info.setdefault(
+        _GROUP_CHANGES, (set(), set(), set()))
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Group)]
+    if deleted:
+        # Their closure rows are gone once the groups are deleted
+        user_ids.update(_group_user_ids(session.connection(), deleted))
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Group):
+            history = get_history(obj, 'members')
+            users.update(chain(history.added, history.deleted))
+            history = get_history(obj, 'subgroups')
+            subgroups.update(chain(history.added, history.deleted))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_group_changes(session, previous_transaction):
+    session.info.pop(_GROUP_CHANGES, None)
+
+
+# Registered before `_expire_stale_counters`, which expires the
+# generations bumped here. (The after_flush event would be simpler,
+# but with SQLAlchemy 1.0 class level listeners for it are lost once
+# zope.sqlalchemy listens to it on the sessionmaker.)
+@event.listens_for(Session, 'after_flush_postexec')
+def _groups_flushed(session, flush_context):
+    changes = session.info.pop(_GROUP_CHANGES, None)
+    if changes is None:
+        return
+    user_ids, users, subgroups = changes
+    user_ids.update(user.id for user in users)
+    if not user_ids and not subgroups:
+        return
+    connection = session.connection()
+    user_ids.update(users_below_groups(
+        connection, [group.id for group in subgroups]))
+    user_ids = refresh_group_closure(connection, user_ids)
+    _expire_after_flush(
+        session, User, 'permissions_generation',
+        bump_permissions_generation(connection, user_ids))
+
+
+@event.listens_for(Checklist, 'before_update')
+def _checklist_changing(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        # Assigning an expression makes the ORM expire it after the flush
+        target.version = Checklist.version + 1
+
+
+@event.listens_for(Checklist, 'after_update')
+def _checklist_updated(mapper, connection, target):
+    if not get_history(target, 'title').has_changes():
+        return
+    permissions = ChecklistPermission.__table__
+    users = connection.execute(
+        permissions.select()
+        .with_only_columns([permissions.c.user_id])
+        .where(permissions.c.checklist_id == target.id)
+    )
+    group_permissions = ChecklistGroupPermission.__table__
+    groups = connection.execute(
+        group_permissions.select()
+        .with_only_columns([group_permissions.c.group_id])
+        .where(group_permissions.c.checklist_id == target.id)
+    )
+    user_ids = set(row.user_id for row in users)
+    user_ids.update(
+        _group_user_ids(connection, [row.group_id for row in groups]))
+    _bump_in_flush(
+        target, connection, User, 'permissions_generation', user_ids)
+
+
+@event.listens_for(ChecklistItem, 'after_insert')
+@event.listens_for(ChecklistItem, 'after_delete')
+def _item_inserted_or_deleted(mapper, connection, target):
+    _bump_in_flush(
+        target, connection, Checklist, 'version', [target.checklist_id])
+
+
+@event.listens_for(ChecklistItem, 'after_update')
+def _item_updated(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        # old and new checklist, should it have changed
+        checklist_ids = get_history(target, 'checklist_id').sum()
+        _bump_in_flush(target, connection, Checklist, 'version', checklist_ids)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_stale_counters(session, flush_context):
+    stale = session.info.pop(_STALE_COUNTERS, None)
+    if not stale:
+        return
+    for obj in list(session.identity_map.values()):
+        for (model, attribute), keys in stale.items():
+            if isinstance(obj, model) and obj.id in keys:
+                session.expire(obj, [attribute])
+
+
+# Refill the bucket for the time since its last update, then take a
+# token if there is one. When there is none, the WHERE clause skips the
+# update and no row is returned.
+_CONSUME_TOKEN_SQL = text("""
+INSERT INTO login_throttle_buckets AS bucket (key, tokens, updated)
+VALUES (:key, :capacity - 1, EXTRACT(EPOCH FROM clock_timestamp()))
+ON CONFLICT (key) DO UPDATE SET
+    tokens = LEAST(
+        :capacity,
+        bucket.tokens + (EXCLUDED.updated - bucket.updated) * :rate
+    ) - 1,
+    updated = EXCLUDED.updated
+WHERE LEAST(
+    :capacity,
+    bucket.tokens + (EXCLUDED.updated - bucket.updated) * :rate
+) >= 1
+RETURNING tokens
+""")
+
+# Buckets of the given key prefix not updated for ``full_after``
+# seconds have refilled to capacity, and so are the same as no bucket.
+_PRUNE_BUCKETS_SQL = text("""
+DELETE FROM login_throttle_buckets
+WHERE left(key, length(:prefix)) = :prefix
+AND updated < EXTRACT(EPOCH FROM clock_timestamp()) - :full_after
+""")
+
+
+class LoginThrottleBucket(Base):
+    """
+    A login throttling token bucket shared between processes, see
+    `paildocket.throttle.DatabaseTokenBuckets`.
+    """
+    __tablename__ = 'login_throttle_buckets'
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Seconds since the epoch, by the database clock
+    updated = Column(Float, nullable=False)
+
+    @classmethod
+    def consume(cls, connection, key, capacity, rate):
+        """
+        Atomically take a token from the bucket for ``key`` and return
+        True, or return False if the bucket is empty.
+
+        ``connection`` should be autocommitting, so the bucket's row is
+        not kept locked until some longer transaction ends.
+        """
+        params = {'key': key, 'capacity': capacity, 'rate': rate}
+        result = connection.execute(_CONSUME_TOKEN_SQL, params)
+        return result.first() is not None
+
+    @classmethod
+    def prune(cls, connection, prefix, capacity, rate):
+        """
+        Delete the buckets whose key starts with ``prefix`` which have
+        refilled to ``capacity`` at ``rate``, and return their number.
+        """
+        result = connection.execute(_PRUNE_BUCKETS_SQL, {
+            'prefix': prefix, 'full_after': capacity / rate})
+        return result.rowcount
 
 
 def includeme(config):
@@ -210,4 +1257,7 @@ def includeme(config):
     config.registry['db_sessionmaker'] = maker
     config.add_request_method(
         lambda request: maker(), 'db_session', reify=True)
+    config.add_request_method(
+        lambda request: UserIdentityMap(request.db_session),
+        'user_identity_map', reify=True)
     config.add_request_method(User.from_request, 'user', reify=True)
@@ -0,0 +1,131 @@
+"""
+Keyset ("seek method") pagination for SQLAlchemy queries.
+
+Pages are addressed by the key of the row just outside them rather
+than by an offset, so fetching page N costs the same as fetching the
+first page.
+"""
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+
+class KeysetPage(object):
+    """
+    One page of rows, and the keys to pass as ``after``/``before``
+    to fetch the following/preceding page (None if there is none).
+    """
+    def __init__(self, rows, next_key=None, previous_key=None):
+        self.rows = rows
+        self.next_key = next_key
+        self.previous_key = previous_key
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def keyset_page(query, key_column, page_size, after=None, before=None):
+    """
+    Return a `KeysetPage` of at most ``page_size`` rows from ``query``
+    ordered by ``key_column``, which must be unique and be loaded by
+    the query under its own name.
+
+    Rows come after the key ``after`` if given, otherwise before the
+    key ``before`` if given, otherwise from the start.
+    """
+    key_name = key_column.key
+    if before is not None and after is None:
+        q = query.filter(key_column < before).order_by(key_column.desc())
+        rows = q.limit(page_size + 1).all()
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        has_next = True
+    else:
+        q = query
+        if after is not None:
+            q = q.filter(key_column > after)
+        q = q.order_by(key_column)
+        rows = q.limit(page_size + 1).all()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after is not None
+
+    if not rows:
+        return KeysetPage(rows)
+    next_key = getattr(rows[-1], key_name) if has_next else None
+    previous_key = getattr(rows[0], key_name) if has_previous else None
+    return KeysetPage(rows, next_key=next_key, previous_key=previous_key)
+
+
+def _split_ordering(ordering):
+    """Return the column of ``ordering`` and whether it is descending."""
+    if isinstance(ordering, UnaryExpression):
+        if ordering.modifier is operators.desc_op:
+            return ordering.element, True
+        if ordering.modifier is operators.asc_op:
+            return ordering.element, False
+    return ordering, False
+
+
+def _beyond(columns, key, backwards):
+    """
+    Return a clause selecting the rows which come after ``key`` in the
+    order of ``columns``, or before it if ``backwards``.
+    """
+    clauses = []
+    for index, (column, descending) in enumerate(columns):
+        if descending != backwards:
+            beyond = column < key[index]
+        else:
+            beyond = column > key[index]
+        equal = [
+            previous == value
+            for (previous, d), value in zip(columns[:index], key)
+        ]
+        clauses.append(and_(*(equal + [beyond])))
+    return or_(*clauses)
+
+
+def ordered_keyset_page(query, order_by, page_size, after=None, before=None):
+    """
+    Like `keyset_page`, but for rows ordered by several columns:
+    ``order_by`` is a sequence of columns, each possibly wrapped in
+    ``desc()``, whose values together are unique and which are each
+    loaded by the query under their own names. The keys are tuples of
+    the values of those columns.
+    """
+    columns = [_split_ordering(ordering) for ordering in order_by]
+    if before is not None and after is None:
+        q = query.filter(_beyond(columns, before, backwards=True))
+        q = q.order_by(*[
+            column.asc() if descending else column.desc()
+            for column, descending in columns])
+        rows = q.limit(page_size + 1).all()
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        has_next = True
+    else:
+        q = query
+        if after is not None:
+            q = q.filter(_beyond(columns, after, backwards=False))
+        q = q.order_by(*[
+            column.desc() if descending else column.asc()
+            for column, descending in columns])
+        rows = q.limit(page_size + 1).all()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after is not None
+
+    if not rows:
+        return KeysetPage(rows)
+
+    def key(row):
+        return tuple(getattr(row, column.key) for column, d in columns)
+    next_key = key(rows[-1]) if has_next else None
+    previous_key = key(rows[0]) if has_previous else None
+    return KeysetPage(rows, next_key=next_key, previous_key=previous_key)
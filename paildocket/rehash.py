@@ -0,0 +1,157 @@
+"""
+Background upgrades of password hashes.
+
+When the password policy changes (for example after raising
+``paildocket.password.bcrypt_min_rounds``) a user's hash is upgraded
+the next time they log in, which needs their password. Rehashing costs
+as much as the verification itself, so rather than doing it during the
+login request the password is handed to a worker thread which makes the
+new hash and stores it in the background.
+
+Passwords are only ever held in memory. Anything not upgraded (the
+queue was full, or the process exited first) still fails
+``needs_update`` and is queued again at the user's next login.
+"""
+import logging
+import queue
+import threading
+from collections import Counter, namedtuple
+
+from pyramid.settings import asbool
+from sqlalchemy.orm import Session
+
+from paildocket.models import User
+from paildocket.security import PasswordHashingUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordRehasher(object):
+    """
+    Upgrades password hashes in a worker thread, using
+    ``password_context`` to make the new hashes and the registry's
+    ``db_sessionmaker`` to find the database.
+
+    At most ``maxsize`` upgrades wait in the queue; further ones are
+    dropped until it drains.
+    """
+    def __init__(self, password_context, registry, maxsize=1000):
+        self.password_context = password_context
+        self.registry = registry
+        self._queue = queue.Queue(maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def enqueue(self, user, password):
+        """
+        Queue an upgrade of ``user``'s hash to one of ``password``.
+        Return True if it was queued, False if one is already pending
+        or the queue is full.
+        """
+        userid = user.id
+        with self._lock:
+            if userid in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((userid, password, user.password_hash))
+            except queue.Full:
+                logger.warning(
+                    'Password rehash queue full, not upgrading {0!r}'.format(
+                        user))
+                return False
+            self._pending.add(userid)
+            # Started on first use rather than at configuration time, so
+            # each process forked by the server gets its own worker.
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='paildocket-rehash', daemon=True)
+                self._worker.start()
+        return True
+
+    def join(self):
+        """Block until every queued upgrade has been processed."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            userid, password, old_hash = self._queue.get()
+            try:
+                self.rehash(userid, password, old_hash)
+            except Exception:
+                logger.exception(
+                    'Failed to upgrade password hash for user {0}'.format(
+                        userid))
+            finally:
+                with self._lock:
+                    self._pending.discard(userid)
+                self._queue.task_done()
+
+    def rehash(self, userid, password, old_hash):
+        """
+        Store a new hash of ``password`` for the user, unless their hash
+        has changed from ``old_hash`` in the meantime (say, because they
+        changed their password). Return True if the hash was replaced.
+        """
+        try:
+            new_hash = self.password_context.encrypt(password)
+        except PasswordHashingUnavailable:
+            logger.info(
+                'Password hashing busy, not upgrading user {0}'.format(userid))
+            return False
+        bind = self.registry['db_sessionmaker'].kw['bind']
+        # Deliberately outside the transaction manager, which belongs to
+        # the request threads.
+        db_session = Session(bind=bind)
+        try:
+            table = User.__table__
+            result = db_session.execute(
+                table.update()
+                .where(table.c.id == userid)
+                .where(table.c.password_hash == old_hash)
+                .values(password_hash=new_hash)
+            )
+            db_session.commit()
+        finally:
+            db_session.close()
+        if result.rowcount:
+            logger.info('Upgraded password hash for user {0}'.format(userid))
+        return bool(result.rowcount)
+
+
+HashCount = namedtuple('HashCount', 'scheme rounds count needs_update')
+
+
+def count_password_hashes(password_context, password_hashes):
+    """
+    Tally ``password_hashes`` by scheme and rounds, and return a list
+    of `HashCount` tuples, noting whether ``password_context`` would
+    upgrade hashes made that way.
+    """
+    counts = Counter()
+    for password_hash in password_hashes:
+        scheme = password_context.identify(password_hash)
+        if scheme is None:
+            counts[(None, None, True)] += 1
+            continue
+        handler = password_context.handler(scheme)
+        rounds = getattr(handler.from_string(password_hash), 'rounds', None)
+        needs_update = password_context.needs_update(password_hash)
+        counts[(scheme, rounds, needs_update)] += 1
+    return sorted(
+        (HashCount(scheme, rounds, count, needs_update)
+         for (scheme, rounds, needs_update), count in counts.items()),
+        key=lambda row: (row.scheme or '', row.rounds or 0),
+    )
+
+
+def includeme(config):
+    settings = config.registry.settings
+    if asbool(settings.get('paildocket.password.rehash_in_background', True)):
+        maxsize = int(settings.get(
+            'paildocket.password.rehash_queue_size', 1000))
+        config.registry['password_rehasher'] = PasswordRehasher(
+            config.registry['password_context'], config.registry, maxsize)
+    else:
+        config.registry['password_rehasher'] = None
@@ -0,0 +1,163 @@
+"""
+A JSON renderer replacing Pyramid's default ``json`` renderer.
+
+It encodes with orjson when that is installed (or the standard library
+``json`` module otherwise, or when configured to), and encodes UUIDs,
+dates and datetimes as strings, as well as objects with a ``__json__``
+method as Pyramid's renderer does.
+
+Views returning a `JSONStream` somewhere in their value, either as the
+value itself or as a value of a top level dict, get a response whose
+``app_iter`` encodes the stream one item at a time and yields chunks
+of about ``chunk_size`` bytes, so the whole document is never held in
+memory. The stream is consumed after the view has returned, and so
+after ``pyramid_tm`` has committed and closed the request's session:
+anything it lazily loads from the database must use its own session.
+"""
+import datetime
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JSONStream(object):
+    """
+    Wraps an iterable to be rendered as a JSON array, item by item.
+    """
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+
+def _make_default(request):
+    def default(obj):
+        if hasattr(obj, '__json__'):
+            return obj.__json__(request)
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+            return obj.isoformat()
+        raise TypeError('{0!r} is not JSON serializable'.format(obj))
+    return default
+
+
+def _stdlib_dumps(value, default):
+    return json.dumps(
+        value, default=default, ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+
+
+def _orjson_dumps(value, default):
+    return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Each backend takes the value and a ``default`` function for types it
+# cannot encode, and returns UTF-8 encoded bytes.
+BACKENDS = {'stdlib': _stdlib_dumps}
+if orjson is not None:
+    BACKENDS['orjson'] = _orjson_dumps
+
+
+def get_backend(name):
+    """
+    Return the dumps function of the backend called ``name``, where
+    ``auto`` picks the fastest one installed.
+    """
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in BACKENDS else 'stdlib'
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError('Unknown or unavailable JSON backend {0!r}'.format(
+            name))
+
+
+class JSONRenderer(object):
+    """
+    Pyramid renderer factory for JSON, encoding with ``backend`` (see
+    `get_backend`) and streaming `JSONStream` values in chunks of about
+    ``chunk_size`` bytes.
+    """
+    def __init__(self, backend='auto', chunk_size=64 * 1024):
+        self.dumps = get_backend(backend)
+        self.chunk_size = chunk_size
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            default = _make_default(request)
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = 'application/json'
+                    response.charset = 'UTF-8'
+                if _is_streamed(value):
+                    response.app_iter = self.iter_chunks(value, default)
+                    return None
+            return self.dumps(value, default)
+        return _render
+
+    def iter_chunks(self, value, default):
+        """
+        Yield the encoding of ``value`` in chunks of about `chunk_size`
+        bytes.
+        """
+        return iter_chunks(self._iter_encode(value, default), self.chunk_size)
+
+    def _iter_encode(self, value, default):
+        dumps = self.dumps
+        if isinstance(value, JSONStream):
+            separator = b'['
+            for item in value:
+                yield separator
+                yield dumps(item, default)
+                separator = b','
+            yield b'[]' if separator == b'[' else b']'
+        elif _is_streamed(value):
+            separator = b'{'
+            for key, item in value.items():
+                yield separator + dumps(key, default) + b':'
+                yield from self._iter_encode(item, default)
+                separator = b','
+            yield b'}'
+        else:
+            yield dumps(value, default)
+
+
+def iter_chunks(parts, chunk_size):
+    """
+    Join the byte strings of ``parts`` into chunks of about
+    ``chunk_size`` bytes, for a streamed ``app_iter``.
+    """
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def _is_streamed(value):
+    if isinstance(value, JSONStream):
+        return True
+    return isinstance(value, dict) and any(
+        isinstance(item, JSONStream) for item in value.values())
+
+
+def includeme(config):
+    settings = config.registry.settings
+    config.add_renderer('json', JSONRenderer(
+        backend=settings.get('paildocket.json.backend', 'auto'),
+        chunk_size=int(settings.get('paildocket.json.chunk_size', 64 * 1024)),
+    ))
@@ -5,6 +5,7 @@ import colander
 import deform.widget
 
 from paildocket.i18n import _
+from paildocket.models import EDIT_ROLE, VIEW_ROLE, encoded_userid_to_userid
 
 
 def OnlyCharacters(characters, msg=_('Invalid character(s)')):
@@ -88,3 +89,60 @@ class ChecklistSchema(colander.MappingSchema):
         title=_('Description'),
         validator=colander.Length(0, 10000),
     )
+
+
+class EncodedUserId(colander.String):
+    """
+    A userid, serialized as its encoded userid (see
+    `paildocket.models`).
+    """
+    def deserialize(self, node, cstruct):
+        value = super().deserialize(node, cstruct)
+        if value is colander.null:
+            return value
+        try:
+            return encoded_userid_to_userid(value)
+        except ValueError:
+            raise colander.Invalid(node, _('Invalid user id'))
+
+
+class PermissionChangeSchema(colander.MappingSchema):
+    checklist = colander.SchemaNode(
+        colander.Integer(),
+        validator=colander.Range(min=1),
+    )
+    user = colander.SchemaNode(EncodedUserId())
+    role = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf([EDIT_ROLE, VIEW_ROLE]),
+    )
+
+
+class PermissionChangesSchema(colander.SequenceSchema):
+    change = PermissionChangeSchema()
+
+
+class BulkPermissionsSchema(colander.MappingSchema):
+    """
+    Permissions to grant and revoke, as lists of
+    ``{"checklist": id, "user": encoded userid, "role": role}``.
+    """
+    grant = PermissionChangesSchema(
+        missing=[], validator=colander.Length(max=10000))
+    revoke = PermissionChangesSchema(
+        missing=[], validator=colander.Length(max=10000))
+
+
+class IdentitiesSchema(colander.SequenceSchema):
+    identity = colander.SchemaNode(
+        colander.String(),
+        validator=colander.Length(min=1, max=1000),
+    )
+
+
+class ResolveIdentitiesSchema(colander.MappingSchema):
+    """
+    Usernames or emails to resolve to users, as
+    ``{"identities": [identity, ...]}``.
+    """
+    identities = IdentitiesSchema(validator=colander.Length(max=200))
@@ -9,13 +9,20 @@ Glossary:
 
 """
 import logging
+import threading
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
 
 from pyramid.authorization import ACLAuthorizationPolicy
 from pyramid.authentication import AuthTktAuthenticationPolicy
 from pyramid.security import Authenticated
 from pyramid.settings import asbool
 from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 
+from paildocket.cache import LRUCache
 from paildocket.models import User
 
 
@@ -29,13 +36,107 @@ PASSWORD_CONTEXT_DEFAULT_POLICY = {
 }
 
 
-def create_password_context(**replacement_kwargs):
+def create_password_policy(**replacement_kwargs):
     for key, value in list(replacement_kwargs.items()):
         if value is None:
             del replacement_kwargs[key]
     kwargs = PASSWORD_CONTEXT_DEFAULT_POLICY.copy()
     kwargs.update(replacement_kwargs)
-    return CryptContext(**kwargs)
+    return kwargs
+
+
+def password_policy_from_settings(settings):
+    """
+    Return the password policy configured by ``settings``. Hashes made
+    with fewer than ``bcrypt_min_rounds`` rounds need updating.
+    """
+    return create_password_policy(
+        bcrypt__default_rounds=settings.get(
+            'paildocket.password.bcrypt_rounds'),
+        bcrypt__min_rounds=settings.get(
+            'paildocket.password.bcrypt_min_rounds'),
+    )
+
+
+def create_password_context(**replacement_kwargs):
+    return CryptContext(**create_password_policy(**replacement_kwargs))
+
+
+def create_dummy_hash(password_context):
+    """
+    Return a hash of a random password, made with ``password_context``'s
+    default scheme and cost. Verifying a password against it takes as
+    long as verifying against a real user's hash, and never succeeds.
+    """
+    return password_context.encrypt(uuid.uuid4().hex)
+
+
+class PasswordHashingUnavailable(Exception):
+    """
+    Raised by `PooledPasswordContext` when too many password
+    operations are pending, or one did not finish in time.
+    """
+
+
+# CryptContexts built in pool worker processes, keyed by policy items.
+_worker_contexts = {}
+
+
+def _call_in_worker(policy_items, method_name, *args):
+    context = _worker_contexts.get(policy_items)
+    if context is None:
+        context = CryptContext(**dict(policy_items))
+        _worker_contexts[policy_items] = context
+    return getattr(context, method_name)(*args)
+
+
+class PooledPasswordContext(object):
+    """
+    Stands in for the ``CryptContext`` built from ``policy``, but runs
+    hashing and verification in ``executor`` (normally a process pool)
+    so that bcrypt does not hold the GIL of the WSGI worker.
+
+    At most ``max_pending`` operations may be queued or running at
+    once, and callers wait at most ``timeout`` seconds for a result;
+    otherwise `PasswordHashingUnavailable` is raised.
+    """
+    def __init__(self, policy, executor, max_pending, timeout):
+        self._policy_items = tuple(sorted(policy.items()))
+        self._context = CryptContext(**policy)
+        self._executor = executor
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._timeout = timeout
+
+    def encrypt(self, secret):
+        return self._call('encrypt', secret)
+
+    def verify(self, secret, hash):
+        return self._call('verify', secret, hash)
+
+    def verify_and_update(self, secret, hash):
+        return self._call('verify_and_update', secret, hash)
+
+    def needs_update(self, hash):
+        # Only inspects the hash's settings, cheap enough to do inline.
+        return self._context.needs_update(hash)
+
+    def _call(self, method_name, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingUnavailable(
+                'Too many pending password operations')
+        try:
+            future = self._executor.submit(
+                _call_in_worker, self._policy_items, method_name, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHashingUnavailable(
+                'Password operation timed out')
 
 
 Administrator = 'paildocket.Administrator'
@@ -45,33 +146,132 @@ EditAndViewPermission = (ViewPermission, EditPermission)
 
 
 def _get_principals(userid, request):
-    user = User.from_userid(request.db_session, userid)
+    user = request.user_identity_map.get(userid)
     if user is None:
         return None
+    return _make_principals(user.admin, user.principal)
+
+
+def _make_principals(admin, principal):
     principals = [Authenticated]
-    if user.admin:
+    if admin:
         principals.append(Administrator)
-    principals.append(user.principal)
+    principals.append(principal)
     return principals
 
 
+# Every live PrincipalCache, so model events can evict from all of them.
+_principal_caches = weakref.WeakSet()
+
+
+class PrincipalCache(object):
+    """
+    An authentication callback which remembers the admin flag and
+    principal of each userid across requests, in a bounded LRU cache
+    whose entries expire after ``ttl`` seconds.
+
+    Entries are evicted in this process when ``User.admin`` or
+    ``User.email`` changes (see `invalidate_cached_principals`);
+    other processes pick up the change once the entry expires.
+    """
+    def __init__(self, maxsize, ttl):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+        _principal_caches.add(self)
+
+    def __call__(self, userid, request):
+        key = str(userid)
+        entry = self._cache.get(key)
+        if entry is None:
+            user = request.user_identity_map.get(userid)
+            if user is None:
+                return None
+            entry = (user.admin, user.principal)
+            self._cache.set(key, entry)
+        admin, principal = entry
+        return _make_principals(admin, principal)
+
+    def discard(self, userid):
+        self._cache.discard(str(userid))
+
+
+def invalidate_cached_principals(userid):
+    """
+    Evict ``userid`` from every principal cache in this process.
+    """
+    for cache in list(_principal_caches):
+        cache.discard(userid)
+
+
+_INVALIDATIONS_KEY = 'paildocket.principal_invalidations'
+
+
+@event.listens_for(User.admin, 'set')
+@event.listens_for(User.email, 'set')
+def _principal_attribute_set(target, value, oldvalue, initiator):
+    if target.id is None or value == oldvalue:
+        return
+    invalidate_cached_principals(target.id)
+    # Evict again after commit, in case a concurrent request cached the
+    # old values before this transaction became visible.
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_INVALIDATIONS_KEY, set()).add(target.id)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    invalidate_cached_principals(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_principals(session):
+    for userid in session.info.pop(_INVALIDATIONS_KEY, ()):
+        invalidate_cached_principals(userid)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_principals(session, previous_transaction):
+    session.info.pop(_INVALIDATIONS_KEY, None)
+
+
 MINUTE = 60
 HOUR = 60 * MINUTE
 DAY = 24 * HOUR
 
 
 def includeme(config):
-    bcrypt_rounds = config.registry.settings.get(
-        'paildocket.password.bcrypt_rounds')
-    config.registry['password_context'] = create_password_context(
-        bcrypt__default_rounds=bcrypt_rounds
-    )
+    _password_policy = password_policy_from_settings(config.registry.settings)
+    _pool_workers = int(config.registry.settings.get(
+        'paildocket.password.pool_workers', 0))
+    if _pool_workers:
+        _max_pending = int(config.registry.settings.get(
+            'paildocket.password.pool_max_pending', 4 * _pool_workers))
+        _timeout = float(config.registry.settings.get(
+            'paildocket.password.pool_timeout', 10))
+        config.registry['password_context'] = PooledPasswordContext(
+            _password_policy,
+            ProcessPoolExecutor(max_workers=_pool_workers),
+            max_pending=_max_pending,
+            timeout=_timeout,
+        )
+    else:
+        config.registry['password_context'] = CryptContext(**_password_policy)
+    config.registry['password_dummy_hash'] = create_dummy_hash(
+        CryptContext(**_password_policy))
 
     _auth_debug = asbool(
         config.registry.settings.get('paildocket.authentication.debug', False))
+    _principal_cache_size = int(config.registry.settings.get(
+        'paildocket.authentication.principal_cache_size', 0))
+    if _principal_cache_size:
+        _principal_cache_ttl = float(config.registry.settings.get(
+            'paildocket.authentication.principal_cache_ttl', 5 * MINUTE))
+        _callback = PrincipalCache(_principal_cache_size, _principal_cache_ttl)
+    else:
+        _callback = _get_principals
     _authn_policy = AuthTktAuthenticationPolicy(
         secret=config.registry.settings['paildocket.authentication.secret'],
-        callback=_get_principals,
+        callback=_callback,
         timeout=14 * DAY,
         reissue_time=1 * DAY,
         max_age=30 * DAY,
@@ -2,9 +2,13 @@ from pyramid.session import SignedCookieSessionFactory
 from webob.cookies import JSONSerializer
 
 
+SESSION_COOKIE_NAME = 'session'
+
+
 def includeme(config):
     _session_factory = SignedCookieSessionFactory(
         config.registry.settings['paildocket.session.secret'],
+        cookie_name=SESSION_COOKIE_NAME,
         httponly=False,  # ensure AJAX can send session
         max_age=864000,
         timeout=864000,
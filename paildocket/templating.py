@@ -0,0 +1,84 @@
+"""
+Compilation of the Jinja2 templates when the application starts.
+
+Templates are otherwise compiled by whichever request first renders
+them. Combined with pyramid_jinja2's ``jinja2.bytecode_caching``
+settings, a restarted worker only has to load the compiled code.
+"""
+import logging
+import os
+import time
+
+from jinja2 import meta
+from pyramid.events import ApplicationCreated
+from pyramid.path import AssetResolver
+from pyramid.settings import asbool
+from pyramid_jinja2 import IJinja2Environment
+
+
+logger = logging.getLogger(__name__)
+
+
+TEMPLATES_SPEC = 'paildocket:templates/'
+
+
+def iter_template_names(directory, extension='.jinja2'):
+    """
+    Yield the names, relative to ``directory`` and with ``/`` as the
+    separator, of the template files below it.
+    """
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(extension):
+                path = os.path.join(dirpath, filename)
+                relative = os.path.relpath(path, directory)
+                yield relative.replace(os.sep, '/')
+
+
+def precompile_templates(environment, directory):
+    """
+    Load every template below ``directory`` into ``environment``, along
+    with the templates each one extends, includes or imports, under
+    the same names rendering would load them by. Return the number of
+    templates loaded.
+    """
+    loaded = set()
+    for name in iter_template_names(directory):
+        _load_template(environment, name, None, loaded)
+    return len(loaded)
+
+
+def _load_template(environment, name, parent, loaded):
+    if parent is not None:
+        joined_name = environment.join_path(name, parent)
+    else:
+        joined_name = name
+    if joined_name in loaded:
+        return
+    environment.get_template(name, parent=parent)
+    loaded.add(joined_name)
+    source = environment.loader.get_source(environment, joined_name)[0]
+    for reference in meta.find_referenced_templates(environment.parse(source)):
+        # None stands for a name only known while rendering
+        if reference is not None:
+            _load_template(environment, reference, joined_name, loaded)
+
+
+def includeme(config):
+    settings = config.registry.settings
+    reload_templates = asbool(settings.get('pyramid.reload_templates', False))
+    precompile = asbool(settings.get(
+        'paildocket.templates.precompile', not reload_templates))
+    if not precompile:
+        return
+
+    def precompile_on_startup(event):
+        environment = event.app.registry.getUtility(
+            IJinja2Environment, name='.jinja2')
+        directory = AssetResolver().resolve(TEMPLATES_SPEC).abspath()
+        started = time.perf_counter()
+        count = precompile_templates(environment, directory)
+        logger.info('Precompiled {0} templates in {1:.0f} ms'.format(
+            count, (time.perf_counter() - started) * 1e3))
+    config.add_subscriber(precompile_on_startup, ApplicationCreated)
@@ -34,6 +34,11 @@ def fresh_database(request):
         'psql', '-d', db_name,
         '-c', 'CREATE EXTENSION IF NOT EXISTS "uuid-ossp"'
     ])
+    # Optional: the fuzzy user lookup tests are skipped without it
+    subprocess.call([
+        'psql', '-d', db_name,
+        '-c', 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+    ])
 
     engine = create_engine(db_url)
     Base.metadata.create_all(engine)
@@ -123,10 +128,22 @@ def db_session(request, app_config_models_included):
 
 
 @pytest.fixture
-def testapp(request):
+def testapp_settings():
+    """
+    Settings of `testapp` overriding those of the test ini file; a test
+    changes them by parametrizing this fixture.
+    """
+    return {}
+
+
+@pytest.fixture
+def testapp(request, testapp_settings):
     import transaction
-    from pyramid.paster import get_app
-    app = get_app(TESTS_INI)
+    from pyramid.paster import get_appsettings
+    from paildocket.wsgi import main
+    settings = get_appsettings(TESTS_INI)
+    settings.update(testapp_settings)
+    app = main({}, **settings)
 
     maker = app.registry['db_sessionmaker']
     engine = maker.kw['bind']
@@ -0,0 +1,131 @@
+import gzip
+import os
+
+import pytest
+
+
+CSS = b'body { color: black; }\n' * 100
+
+
+@pytest.fixture
+def source_tree(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('css', 'style.css').write_binary(CSS, ensure=True)
+    source.join('img', 'logo.png').write_binary(b'\x89PNG' * 100, ensure=True)
+    return source
+
+
+def _build(tmpdir, source_tree):
+    from paildocket.assets import build_assets
+    output = tmpdir.join('output').ensure(dir=True)
+    trees = [(str(source_tree) + '/', 'test')]
+    return str(output), build_assets(str(output), trees=trees)
+
+
+def test_build_assets(tmpdir, source_tree):
+    from paildocket.assets import brotli, load_manifest
+    output, manifest = _build(tmpdir, source_tree)
+    built_name = manifest[str(source_tree) + '/']
+    assert built_name.startswith('test-')
+    assert load_manifest(output) == manifest
+
+    built = os.path.join(output, built_name)
+    with open(os.path.join(built, 'css', 'style.css'), 'rb') as f:
+        assert f.read() == CSS
+    with gzip.open(os.path.join(built, 'css', 'style.css.gz')) as f:
+        assert f.read() == CSS
+    assert os.path.isfile(os.path.join(built, 'css', 'style.css.br')) is (
+        brotli is not None)
+    assert not os.path.exists(os.path.join(built, 'img', 'logo.png.gz'))
+
+
+def test_build_assets_changes_name_with_content(tmpdir, source_tree):
+    output, first = _build(tmpdir, source_tree)
+    output, unchanged = _build(tmpdir, source_tree)
+    assert unchanged == first
+    source_tree.join('css', 'style.css').write_binary(CSS + b'p {}\n')
+    output, changed = _build(tmpdir, source_tree)
+    assert changed != first
+    # the previous build is kept for pages which still refer to it
+    assert os.path.isdir(os.path.join(output, *first.values()))
+
+
+def test_load_manifest_missing(tmpdir):
+    from paildocket.assets import load_manifest
+    assert load_manifest(str(tmpdir)) is None
+
+
+@pytest.fixture
+def asset_app(tmpdir, source_tree):
+    from pyramid.paster import get_appsettings
+    from webtest import TestApp
+    from paildocket.assets import build_assets
+    from paildocket.tests.support import TESTS_INI
+    from paildocket.wsgi import main
+    output = str(tmpdir.mkdir('output'))
+    manifest = build_assets(output, trees=[
+        ('paildocket:static/', 'paildocket'),
+        (str(source_tree) + '/', 'test'),
+    ])
+    settings = get_appsettings(TESTS_INI)
+    settings['paildocket.assets.directory'] = output
+    app = TestApp(main({}, **settings))
+    app.manifest = manifest
+    app.built_name = manifest[str(source_tree) + '/']
+    return app
+
+
+@pytest.mark.functional
+class TestServeAsset(object):
+    def _path(self, app, name='css/style.css'):
+        return '/assets/{0}/{1}'.format(app.built_name, name)
+
+    def test_asset_url(self, asset_app):
+        res = asset_app.get('/', status=200)
+        path = '/assets/{0}/css/style.css'.format(
+            asset_app.manifest['paildocket:static/'])
+        assert path in res.text
+        asset_app.get(path, status=200)
+
+    @pytest.mark.parametrize('accept_encoding,content_encoding', [
+        (None, None),
+        ('identity', None),
+        ('gzip', 'gzip'),
+        ('gzip, br', 'br'),
+        ('gzip, br;q=0.5', 'gzip'),
+    ])
+    def test_serves_precompressed_variant(
+            self, asset_app, accept_encoding, content_encoding):
+        from paildocket.assets import brotli
+        if content_encoding == 'br' and brotli is None:
+            pytest.skip('brotli is not installed')
+        from webob import Request
+        headers = {}
+        if accept_encoding is not None:
+            headers['Accept-Encoding'] = accept_encoding
+        # Not through the TestApp, which would decode the body
+        request = Request.blank(self._path(asset_app), headers=headers)
+        res = request.get_response(asset_app.app)
+        assert res.status_int == 200
+        assert res.headers.get('Content-Encoding') == content_encoding
+        if content_encoding == 'gzip':
+            assert gzip.decompress(res.body) == CSS
+        assert res.content_type == 'text/css'
+        assert res.headers['Vary'] == 'Accept-Encoding'
+        assert 'immutable' in res.headers['Cache-Control']
+
+    @pytest.mark.parametrize('name', [
+        'css/missing.css', 'css/style.css.gz', '../manifest.json',
+    ])
+    def test_not_found(self, asset_app, name):
+        asset_app.get(self._path(asset_app, name), status=404)
+
+
+def test_asset_url_falls_back_to_static_url():
+    from pyramid.testing import DummyRequest
+    from paildocket.assets import asset_url
+    request = DummyRequest()
+    request.registry['asset_manifest'] = None
+    request.static_url = lambda spec: 'static ' + spec
+    assert asset_url(request, 'paildocket:static/css/style.css') == (
+        'static paildocket:static/css/style.css')
@@ -0,0 +1,65 @@
+import pytest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(object):
+    def _make_cache(self, maxsize=2, ttl=None, clock=None):
+        from paildocket.cache import LRUCache
+        clock = FakeClock() if clock is None else clock
+        return LRUCache(maxsize, ttl=ttl, clock=clock)
+
+    def test_maxsize_must_be_positive(self):
+        with pytest.raises(ValueError):
+            self._make_cache(maxsize=0)
+
+    def test_get_missing_returns_default(self):
+        cache = self._make_cache()
+        assert cache.get('a') is None
+        assert cache.get('a', 'default') == 'default'
+
+    def test_set_and_get(self):
+        cache = self._make_cache()
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert 'a' in cache
+        assert len(cache) == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = self._make_cache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = self._make_cache(ttl=10, clock=clock)
+        cache.set('a', 1)
+        clock.now = 9.9
+        assert cache.get('a') == 1
+        clock.now = 10
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_discard(self):
+        cache = self._make_cache()
+        cache.set('a', 1)
+        cache.discard('a')
+        cache.discard('missing')
+        assert 'a' not in cache
+
+    def test_clear(self):
+        cache = self._make_cache()
+        cache.set('a', 1)
+        cache.clear()
+        assert len(cache) == 0
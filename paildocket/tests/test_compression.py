@@ -0,0 +1,112 @@
+import gzip
+
+import pytest
+from webob import Request, Response
+
+
+BODY = b'<p>Hello, world</p>\n' * 100
+
+
+def _compressor(**kwargs):
+    from paildocket.compression import Compressor
+    return Compressor(**kwargs)
+
+
+def _request(accept_encoding=None):
+    headers = {}
+    if accept_encoding is not None:
+        headers['Accept-Encoding'] = accept_encoding
+    return Request.blank('/', headers=headers)
+
+
+def _response(body=BODY, content_type='text/html', **kwargs):
+    return Response(body=body, content_type=content_type, **kwargs)
+
+
+@pytest.mark.parametrize('accept_encoding,content_encoding', [
+    (None, None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('gzip, br', 'br'),
+    ('gzip, br;q=0.5', 'gzip'),
+])
+def test_compress(accept_encoding, content_encoding):
+    from paildocket.compression import brotli
+    if content_encoding == 'br' and brotli is None:
+        pytest.skip('brotli is not installed')
+    response = _response()
+    _compressor()(_request(accept_encoding), response)
+    assert response.content_encoding == content_encoding
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    if content_encoding is None:
+        assert response.body == BODY
+    elif content_encoding == 'gzip':
+        assert gzip.decompress(response.body) == BODY
+    else:
+        assert brotli.decompress(response.body) == BODY
+
+
+def test_compress_weakens_etag():
+    response = _response()
+    response.etag = '3'
+    _compressor()(_request('gzip'), response)
+    assert response.headers['ETag'] == 'W/"3"'
+
+
+def test_compress_keeps_existing_vary():
+    response = _response()
+    response.vary = ('Cookie',)
+    _compressor()(_request('gzip'), response)
+    assert response.headers['Vary'] == 'Cookie, Accept-Encoding'
+
+
+@pytest.mark.parametrize('response', [
+    _response(body=b'small'),
+    _response(content_type='image/png'),
+    _response(cache_control='no-transform'),
+    _response(content_encoding='br'),
+    Response(app_iter=iter([BODY]), content_type='text/html'),
+], ids=['small', 'content-type', 'no-transform', 'encoded', 'streamed'])
+def test_not_compressed(response):
+    body = response.app_iter
+    _compressor()(_request('gzip'), response)
+    assert response.app_iter is body
+    assert response.headers.get('Content-Encoding') != 'gzip'
+
+
+def test_not_compressed_if_no_smaller():
+    import os
+    response = _response(body=os.urandom(4096))
+    body = response.body
+    _compressor()(_request('gzip'), response)
+    assert response.content_encoding is None
+    assert response.body == body
+
+
+@pytest.mark.functional
+def test_compression_tween():
+    from pyramid.paster import get_appsettings
+    from paildocket.tests.support import TESTS_INI
+    from paildocket.wsgi import main
+    settings = get_appsettings(TESTS_INI)
+    settings['paildocket.compression.enabled'] = 'true'
+    settings['paildocket.compression.min_size'] = '100'
+    app = main({}, **settings)
+    # Not through a TestApp, which would decode the body
+    plain = Request.blank('/').get_response(app)
+    res = Request.blank('/', headers={'Accept-Encoding': 'gzip'}).get_response(
+        app)
+    assert res.status_int == 200
+    assert res.content_encoding == 'gzip'
+    assert 'Accept-Encoding' in res.headers['Vary']
+    assert gzip.decompress(res.body) == plain.body
+
+
+def test_head_varies_but_is_not_compressed():
+    request = _request('gzip')
+    request.method = 'HEAD'
+    response = _response()
+    _compressor()(request, response)
+    assert response.content_encoding is None
+    assert response.body == BODY
+    assert 'Accept-Encoding' in response.vary
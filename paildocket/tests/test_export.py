@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+
+import pytest
+
+
+def _make_checklists(db_session):
+    from paildocket.models import User, Checklist, ChecklistItem
+
+    alice = User(
+        username='alice', email='alice@example.com', password_hash='x')
+    groceries = Checklist(title='Groceries', description='For, "the" party')
+    empty = Checklist(title='Empty')
+    hidden = Checklist(title='Hidden')
+    groceries.editors.add(alice)
+    empty.viewers.add(alice)
+    db_session.add_all([groceries, empty, hidden])
+    db_session.flush()
+    db_session.add_all([
+        ChecklistItem(title=title, checklist_id=checklist.id)
+        for checklist in [groceries, hidden]
+        for title in ['Bread', 'Milk']
+    ])
+    db_session.flush()
+    return alice, groceries, empty
+
+
+def test_iter_rows(db_session):
+    from paildocket.export import iter_rows
+
+    alice, groceries, empty = _make_checklists(db_session)
+    rows = [tuple(row) for row in iter_rows(
+        db_session.bind, alice.id, batch_size=1)]
+    assert [row[0] for row in rows] == [groceries.id] * 2 + [empty.id]
+    assert [row[4] for row in rows] == ['Bread', 'Milk', None]
+
+    rows = list(iter_rows(db_session.bind, alice.id, empty.id))
+    assert [tuple(row) for row in rows] == [
+        (empty.id, 'Empty', '', None, None, None)]
+
+
+def test_iter_rows_uses_server_side_cursor(db_session):
+    from sqlalchemy import event
+    from paildocket.export import iter_rows
+
+    alice, groceries, empty = _make_checklists(db_session)
+    streamed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        streamed.append(context.execution_options.get('stream_results'))
+    engine = db_session.bind.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        rows = iter_rows(db_session.bind, alice.id)
+        assert streamed == []
+        next(rows)
+        assert streamed == [True]
+        rows.close()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_iter_csv():
+    from paildocket.export import iter_csv
+    from paildocket.models import EXPORT_COLUMNS
+
+    rows = [(1, 'Groceries', 'For, "the" party', 2, 'Bread', '')]
+    lines = list(iter_csv(rows))
+    assert len(lines) == 1
+    parsed = list(csv.reader(io.StringIO(lines[0].decode('utf-8'))))
+    assert parsed == [EXPORT_COLUMNS, [str(value) for value in rows[0]]]
+
+    assert list(iter_csv([])) == [
+        ','.join(EXPORT_COLUMNS).encode('utf-8') + b'\r\n']
+
+
+def test_iter_jsonl():
+    from paildocket.export import iter_jsonl
+    from paildocket.renderers import get_backend
+
+    rows = [(1, 'Einkäufe', '', None, None, None), (2, 'b', '', 3, 'c', 'd')]
+    lines = list(iter_jsonl(rows, get_backend('stdlib')))
+    assert all(line.endswith(b'\n') for line in lines)
+    assert json.loads(lines[0].decode('utf-8'))['checklist_title'] == (
+        'Einkäufe')
+    assert json.loads(lines[1].decode('utf-8'))['item_id'] == 3
+
+
+@pytest.mark.functional
+def test_export_views(testapp):
+    import transaction
+    from paildocket.tests.test_views import log_in_with_checklists
+    from paildocket.models import ChecklistItem
+
+    checklist_id, = log_in_with_checklists(testapp, edited=['Groceries'])
+    db_session = testapp.app.registry['db_sessionmaker']()
+    item = ChecklistItem(title='Bread', checklist_id=checklist_id)
+    db_session.add(item)
+    db_session.flush()
+    item_id = item.id
+    transaction.commit()
+
+    res = testapp.get('/list/export', status=200)
+    assert res.content_type == 'text/csv'
+    assert 'checklists.csv' in res.headers['Content-Disposition']
+    assert res.text.splitlines()[1] == '{0},Groceries,,{1},Bread,'.format(
+        checklist_id, item_id)
+
+    res = testapp.get(
+        '/list/{0}/export'.format(checklist_id), {'format': 'jsonl'},
+        status=200)
+    assert res.content_type == 'application/x-ndjson'
+    assert json.loads(res.text)['item_title'] == 'Bread'
+    testapp.get('/list/export', {'format': 'xml'}, status=400)
+    testapp.get('/list/{0}/export'.format(checklist_id + 1), status=403)
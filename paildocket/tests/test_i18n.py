@@ -1,3 +1,6 @@
+import pytest
+
+
 def pytest_generate_tests(metafunc):
     if 'module_for_i18n_test' in metafunc.fixturenames:
         modules = list(generate_paildocket_modules())
@@ -89,12 +92,36 @@ class TestAcceptLanguageLocaleNegotiator(object):
         request = self.make_request_accepting_language('de-DE;q=0.9, en;q=0.8')
         assert negotiator(request) == 'de'
 
+    def test_match_is_cached_by_header(self):
+        negotiator = self.make_negotiator(['en', 'de'])
+        request = self.make_request_accepting_language('de;q=0.9, en;q=0.8')
+        assert negotiator(request) == 'de'
+        assert negotiator._matches.get('de;q=0.9, en;q=0.8') == 'de'
+        negotiator._matches.set('de;q=0.9, en;q=0.8', 'en')
+        assert negotiator(request) == 'en'
+
+    def test_no_match_is_cached(self):
+        negotiator = self.make_negotiator(['en'])
+        request = self.make_request_accepting_language('pt')
+        assert negotiator(request) is None
+        assert 'pt' in negotiator._matches
+
+    def test_cache_is_bounded(self):
+        negotiator = self.make_negotiator(['en'])
+        negotiator._matches.maxsize = 2
+        for header in ['en', 'de', 'pt']:
+            negotiator(self.make_request_accepting_language(header))
+        assert len(negotiator._matches) == 2
+
 
 class TestSessionLocaleNegotiator(object):
-    def make_request(self, session_language=None):
+    def make_request(self, session_language=None, session_cookie=True):
         from pyramid.testing import DummyRequest
+        from paildocket.session import SESSION_COOKIE_NAME
         request = DummyRequest()
         request.session = {}
+        if session_cookie:
+            request.cookies[SESSION_COOKIE_NAME] = 'cookie value'
         if session_language is not None:
             request.session['lang'] = session_language
         return request
@@ -117,14 +144,119 @@ class TestSessionLocaleNegotiator(object):
         assert negotiator.fallback_negotiator.called
         assert negotiator.fallback_negotiator.args[0] is request
 
-    def test_session_falls_back_setting_value_in_session(self):
+    def test_session_falls_back_without_setting_value_in_session(self):
         negotiator = self.make_negotiator(fallback_value='value')
         request = self.make_request(session_language=None)
         negotiator(request)
-        assert request.session['lang'] == 'value'
-
-    def test_session_falls_back_no_session_if_fallback_returns_none(self):
-        negotiator = self.make_negotiator(fallback_value=None)
-        request = self.make_request(session_language=None)
-        assert negotiator(request) is None
         assert request.session == {}
+
+    def test_session_not_loaded_without_cookie(self):
+        negotiator = self.make_negotiator(fallback_value='value')
+        request = self.make_request(session_cookie=False)
+        del request.session
+        assert negotiator(request) == 'value'
+
+
+def test_remember_language():
+    from pyramid.testing import DummyRequest
+    from paildocket.i18n import remember_language
+    request = DummyRequest()
+    request.session = {}
+    remember_language(request, 'de')
+    assert request.session['lang'] == 'de'
+
+
+class CountingLocalizer(object):
+    def __init__(self):
+        self.translated = []
+
+    def translate(self, term, domain=None, mapping=None):
+        self.translated.append((term, domain, mapping))
+        return 'translated ' + term
+
+
+class TestTranslationCache(object):
+    def make_cache(self, registry=None):
+        from paildocket.i18n import TranslationCache
+        return TranslationCache(registry)
+
+    def make_cache_with_localizer(self):
+        cache = self.make_cache()
+        localizer = cache._localizers['de'] = CountingLocalizer()
+        return cache, localizer
+
+    def test_translation_is_cached(self):
+        cache, localizer = self.make_cache_with_localizer()
+        assert cache.translate('de', 'Log In') == 'translated Log In'
+        assert cache.translate('de', 'Log In') == 'translated Log In'
+        assert len(localizer.translated) == 1
+
+    def test_cache_distinguishes_domain_and_mapping(self):
+        from paildocket.i18n import _
+        cache, localizer = self.make_cache_with_localizer()
+        cache.translate('de', 'Log In')
+        cache.translate('de', 'Log In', domain='deform')
+        cache.translate('de', _('Log In'))
+        cache.translate('de', _('Log In', mapping={'a': 1}))
+        cache.translate('de', _('Log In', mapping={'a': 2}))
+        cache.translate('de', _('Log In', mapping={'a': 2}))
+        assert len(localizer.translated) == 5
+
+    def test_unhashable_mapping_is_not_cached(self):
+        cache, localizer = self.make_cache_with_localizer()
+        cache.translate('de', 'Log In', mapping={'a': []})
+        cache.translate('de', 'Log In', mapping={'a': []})
+        assert len(localizer.translated) == 2
+        assert len(cache._translations) == 0
+
+    def test_localizer_uses_registered_translation_directories(
+            self, app_config):
+        from paildocket.i18n import _
+        app_config.add_translation_dirs('paildocket:locale')
+        app_config.commit()
+        cache = self.make_cache(app_config.registry)
+        assert cache.translate('de', _('Log In')) == 'Anmelden'
+        assert cache.localizer('de') is cache.localizer('de')
+
+    def test_warm(self, app_config):
+        app_config.add_translation_dirs('paildocket:locale')
+        app_config.commit()
+        cache = self.make_cache(app_config.registry)
+        from paildocket.i18n import _
+        cache.warm(['en', 'de'])
+        warmed = len(cache._translations)
+        assert warmed
+        assert cache.translate('de', _('Log In')) == 'Anmelden'
+        assert len(cache._translations) == warmed
+
+    def test_warm_without_catalog_internals(self):
+        cache, localizer = self.make_cache_with_localizer()
+        localizer.translations = object()
+        cache.warm(['de'])
+        assert len(localizer.translated) == 0
+
+
+def test_cached_gettext_passes_mapping(app_config):
+    from pyramid.testing import DummyRequest
+    from paildocket.i18n import CachedGetText, TranslationCache
+
+    app_config.add_translation_dirs('paildocket:locale')
+    app_config.commit()
+    app_config.registry['translation_cache'] = TranslationCache(
+        app_config.registry)
+    request = DummyRequest(locale_name='en')
+    app_config.begin(request)
+    gettext = CachedGetText('paildocket')
+    assert gettext.gettext('Hello ${name}', mapping={'name': 'Bob'}) == (
+        'Hello Bob')
+    assert gettext.ngettext(
+        '${n} list', '${n} lists', 2, mapping={'n': 2}) == '2 lists'
+
+
+@pytest.mark.functional
+def test_templates_translate_through_cache(testapp):
+    res = testapp.get('/', headers={'Accept-Language': 'de'}, status=200)
+    assert 'Anmelden' in res.text
+    cache = testapp.app.registry['translation_cache']
+    key = ('de', 'paildocket', 'Log In', None, None, None)
+    assert cache._translations.get(key) == 'Anmelden'
@@ -0,0 +1,56 @@
+import pytest
+
+
+class TestUserLookup(object):
+    def _make_users(self, db_session):
+        from paildocket.models import User
+
+        users = [
+            User(username=username, password_hash='x', email=email)
+            for username, email in [
+                ('Alice', 'alice@example.com'),
+                ('alicia', 'ally@example.com'),
+                ('bob', 'robert@alice.example.com'),
+                ('al_bundy', 'al@example.com'),
+            ]
+        ]
+        db_session.add_all(users)
+        db_session.flush()
+        return users
+
+    def test_lookup_query_matches_prefixes(self, db_session):
+        from paildocket.models import User
+
+        alice, alicia, bob, al_bundy = self._make_users(db_session)
+        assert User.lookup_query(db_session, 'ALI').all() == [alice, alicia]
+        assert User.lookup_query(db_session, 'ally@').all() == [alicia]
+        # LIKE wildcards match literally
+        assert User.lookup_query(db_session, 'al_').all() == [al_bundy]
+        assert User.lookup_query(db_session, '%').all() == []
+
+    def test_lookup_query_fuzzy(self, db_session):
+        from paildocket.models import User, has_extension
+
+        if not has_extension(db_session, 'pg_trgm'):
+            pytest.skip('pg_trgm is not installed')
+        alice, alicia, bob, al_bundy = self._make_users(db_session)
+        found = User.lookup_query(db_session, 'alicee', fuzzy=True).all()
+        assert alice in found
+        assert al_bundy not in found
+
+    def test_lookup_limits_and_caches(self, db_session):
+        from paildocket.lookup import UserLookup
+
+        alice, alicia, bob, al_bundy = self._make_users(db_session)
+        user_lookup = UserLookup(max_results=1, fuzzy=False)
+        assert user_lookup.lookup(db_session, 'a') == []
+        results = user_lookup.lookup(db_session, ' Ali ', limit=5)
+        assert results == [
+            {'id': alice.encoded_userid, 'username': 'Alice'}]
+        db_session.delete(alice)
+        db_session.flush()
+        assert user_lookup.lookup(db_session, 'ali') is results
+
+        assert UserLookup(cache_ttl=0, fuzzy=False).lookup(
+            db_session, 'ali', limit=5) == [
+            {'id': alicia.encoded_userid, 'username': 'alicia'}]
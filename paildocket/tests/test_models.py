@@ -73,7 +73,7 @@ class TestUserModel(object):
             db_session.flush()
 
     def test_from_request(self, db_session):
-        from paildocket.models import User
+        from paildocket.models import User, UserIdentityMap
 
         alice = User(
             username=ALICE,
@@ -84,7 +84,7 @@ class TestUserModel(object):
         db_session.flush()
 
         fake_request = DummyObject()
-        fake_request.db_session = db_session
+        fake_request.user_identity_map = UserIdentityMap(db_session)
         fake_request.authenticated_userid = alice.id
 
         returned = User.from_request(fake_request)
@@ -99,6 +99,18 @@ class TestUserModel(object):
         returned = User.from_request(fake_request)
         assert returned is None
 
+    def test_from_userid(self, db_session):
+        from paildocket.models import User
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        db_session.add(alice)
+        db_session.flush()
+
+        assert User.from_userid(db_session, alice.id) is alice
+        assert User.from_userid(db_session, str(alice.id)) is alice
+        assert User.from_userid(db_session, UUID_USERID) is None
+
     def test_from_identity(self, db_session):
         from paildocket.models import User
 
@@ -112,6 +124,526 @@ class TestUserModel(object):
         by_email = User.from_identity(db_session, ALICE_EMAIL)
         assert alice is by_email
 
+    def test_from_identities(self, db_session):
+        from paildocket.models import User
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        bob = User(username='bob', password_hash='x', email='bob@example.com')
+        db_session.add_all([alice, bob])
+        db_session.flush()
+
+        found = User.from_identities(
+            db_session, [ALICE, ALICE_EMAIL, 'bob@example.com', 'carol'])
+        assert found == {ALICE: alice, ALICE_EMAIL: alice,
+                         'bob@example.com': bob}
+        assert User.from_identities(db_session, []) == {}
+
+
+class TestChecklistModel(object):
+    def test_visible_to_user_query(self, db_session):
+        from paildocket.models import User, Checklist
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        editable = Checklist(title='editable')
+        editable.editors.add(alice)
+        viewable = Checklist(title='viewable')
+        viewable.viewers.add(alice)
+        hidden = Checklist(title='hidden')
+        db_session.add_all([editable, viewable, hidden])
+        db_session.flush()
+
+        q = Checklist.visible_to_user_query(db_session, alice)
+        rows = q.order_by(Checklist.id).all()
+        assert [(r.id, r.title, r.role) for r in rows] == [
+            (editable.id, 'editable', 'edit'),
+            (viewable.id, 'viewable', 'view'),
+        ]
+
+    def test_from_id(self, db_session):
+        from paildocket.models import Checklist
+
+        checklist = Checklist(title='title')
+        db_session.add(checklist)
+        db_session.flush()
+        assert Checklist.from_id(db_session, checklist.id) is checklist
+        assert Checklist.from_id(db_session, checklist.id + 1) is None
+
+    @pytest.mark.parametrize('model_name', ['Checklist', 'ChecklistItem'])
+    def test_description_is_deferred(self, db_session, model_name):
+        from sqlalchemy import inspect
+        from paildocket import models
+
+        model = getattr(models, model_name)
+        db_session.add(model(title='title', description='long text'))
+        db_session.flush()
+        db_session.expunge_all()
+
+        loaded = db_session.query(model).one()
+        assert 'description' in inspect(loaded).unloaded
+        assert loaded.description == 'long text'
+
+
+class TestGroups(object):
+    def _make_users(self, db_session, *usernames):
+        from paildocket.models import User
+
+        users = [
+            User(
+                username=username, password_hash='hash',
+                email='{0}@example.com'.format(username))
+            for username in usernames
+        ]
+        db_session.add_all(users)
+        return users
+
+    def _closure(self, db_session):
+        from paildocket.models import group_closure, Group, User
+
+        rows = db_session.query(User.username, Group.name).join(
+            group_closure, group_closure.c.user_id == User.id).join(
+            Group, Group.id == group_closure.c.group_id)
+        return set(rows)
+
+    def _make_nested_groups(self, db_session):
+        from paildocket.models import Group
+
+        alice, bob = self._make_users(db_session, ALICE, 'bob')
+        company = Group(name='company')
+        engineering = Group(name='engineering')
+        backend = Group(name='backend')
+        company.subgroups.add(engineering)
+        engineering.subgroups.add(backend)
+        engineering.members.add(alice)
+        backend.members.add(bob)
+        db_session.add_all([company, engineering, backend])
+        db_session.flush()
+        return alice, bob, company, engineering, backend
+
+    def test_closure_flattens_nesting(self, db_session):
+        self._make_nested_groups(db_session)
+        assert self._closure(db_session) == {
+            (ALICE, 'company'), (ALICE, 'engineering'),
+            ('bob', 'company'), ('bob', 'engineering'), ('bob', 'backend'),
+        }
+
+    def test_closure_follows_removed_subgroup(self, db_session):
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        company.subgroups.remove(engineering)
+        db_session.flush()
+        assert self._closure(db_session) == {
+            (ALICE, 'engineering'),
+            ('bob', 'engineering'), ('bob', 'backend'),
+        }
+
+    def test_closure_follows_removed_member(self, db_session):
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        engineering.members.remove(alice)
+        backend.members.add(alice)
+        db_session.flush()
+        assert (ALICE, 'backend') in self._closure(db_session)
+
+    def test_closure_follows_deleted_group(self, db_session):
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        db_session.delete(engineering)
+        db_session.flush()
+        # backend is no longer in company
+        assert self._closure(db_session) == {('bob', 'backend')}
+
+    def test_cycle(self, db_session):
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        backend.subgroups.add(company)
+        db_session.flush()
+        assert (ALICE, 'backend') in self._closure(db_session)
+
+    def test_for_user_query(self, db_session):
+        from paildocket.models import Group
+
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        groups = Group.for_user_query(db_session, alice).all()
+        assert set(groups) == {company, engineering}
+
+    def test_membership_bumps_generation(self, db_session):
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        generation = bob.permissions_generation
+        company.subgroups.remove(engineering)
+        db_session.flush()
+        assert bob.permissions_generation == generation + 1
+
+    def test_group_permissions(self, db_session):
+        from paildocket.models import Checklist, EDIT_ROLE, VIEW_ROLE
+
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        charles, = self._make_users(db_session, 'charles')
+        handbook = Checklist(title='Handbook')
+        handbook.viewer_groups.add(company)
+        deploys = Checklist(title='Deploys')
+        deploys.editor_groups.add(backend)
+        deploys.viewers.add(alice)
+        db_session.add_all([handbook, deploys])
+        db_session.flush()
+        generation = bob.permissions_generation
+
+        def visible(user):
+            q = Checklist.visible_to_user_query(db_session, user)
+            return set((row.title, row.role) for row in q)
+        assert visible(alice) == {
+            ('Handbook', VIEW_ROLE), ('Deploys', VIEW_ROLE)}
+        assert visible(bob) == {
+            ('Handbook', VIEW_ROLE), ('Deploys', EDIT_ROLE)}
+        assert visible(charles) == set()
+        assert Checklist.editable_by_user_query(db_session, bob).all() == [
+            deploys]
+        assert Checklist.only_viewable_by_user_query(
+            db_session, bob).all() == [handbook]
+        assert Checklist.ids_editable_by_user(
+            db_session, alice, [handbook.id, deploys.id]) == set()
+
+        for user, checklist, role in [
+                (alice, handbook, VIEW_ROLE),
+                (bob, deploys, EDIT_ROLE),
+                (charles, deploys, None)]:
+            assert Checklist.with_role_for_user(
+                db_session, user.id, checklist.id) == (user, checklist, role)
+
+        deploys.title = 'Releases'
+        db_session.flush()
+        assert bob.permissions_generation == generation + 1
+
+    def test_with_role_for_user_missing(self, db_session):
+        from paildocket.tests.support import UUID_USERID
+        from paildocket.models import Checklist
+
+        alice, = self._make_users(db_session, ALICE)
+        db_session.flush()
+        assert Checklist.with_role_for_user(db_session, alice.id, 1) == (
+            alice, None, None)
+        assert Checklist.with_role_for_user(db_session, UUID_USERID, 1) == (
+            None, None, None)
+
+    def test_group_permission_bumps_generation(self, db_session):
+        from paildocket.models import Checklist
+
+        alice, bob, company, engineering, backend = (
+            self._make_nested_groups(db_session))
+        generation = bob.permissions_generation
+        checklist = Checklist(title='Handbook')
+        checklist.viewer_groups.add(company)
+        db_session.add(checklist)
+        db_session.flush()
+        assert bob.permissions_generation == generation + 1
+
+
+class TestChecklistSearch(object):
+    def _make_checklists(self, db_session):
+        from paildocket.models import User, Checklist, ChecklistItem
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        titled = Checklist(title='Groceries for the party')
+        described = Checklist(
+            title='Shopping', description='Groceries and flowers')
+        with_item = Checklist(title='Errands')
+        hidden = Checklist(title='Secret groceries')
+        unrelated = Checklist(title='Chores')
+        for checklist in [titled, described, with_item, unrelated]:
+            checklist.viewers.add(alice)
+        db_session.add_all([titled, described, with_item, hidden, unrelated])
+        db_session.flush()
+        db_session.add_all([
+            ChecklistItem(
+                title='Collect groceries', checklist_id=with_item.id),
+            ChecklistItem(title='Hide groceries', checklist_id=hidden.id),
+        ])
+        db_session.flush()
+        return alice, titled, described, with_item
+
+    def test_search_page(self, db_session):
+        from paildocket.models import Checklist
+
+        alice, titled, described, with_item = self._make_checklists(
+            db_session)
+        page = Checklist.search_page(db_session, alice, 'grocery', 10)
+        assert set(row.id for row in page) == {
+            titled.id, described.id, with_item.id}
+        # a title match outranks a description match
+        ids = [row.id for row in page]
+        assert ids.index(titled.id) < ids.index(described.id)
+        ranks = [row.rank for row in page]
+        assert ranks == sorted(ranks, reverse=True)
+        assert all(row.role == 'view' for row in page)
+
+    def test_search_pages(self, db_session):
+        from paildocket.models import Checklist
+
+        alice, titled, described, with_item = self._make_checklists(
+            db_session)
+        everything = Checklist.search_page(db_session, alice, 'grocery', 10)
+        first = Checklist.search_page(db_session, alice, 'grocery', 2)
+        assert list(first) == list(everything)[:2]
+        second = Checklist.search_page(
+            db_session, alice, 'grocery', 2, after=first.next_key)
+        assert list(second) == list(everything)[2:]
+        assert second.next_key is None
+        assert second.previous_key == (
+            everything.rows[2].rank, everything.rows[2].id)
+
+    def test_search_vector_follows_changes(self, db_session):
+        from paildocket.models import Checklist
+
+        alice, titled, described, with_item = self._make_checklists(
+            db_session)
+        titled.title = 'Party'
+        db_session.flush()
+        page = Checklist.search_page(db_session, alice, 'grocery', 10)
+        assert titled.id not in [row.id for row in page]
+        page = Checklist.search_page(db_session, alice, 'party', 10)
+        assert [row.id for row in page] == [titled.id]
+
+
+class TestPermissionsGeneration(object):
+    def _make_users_and_checklist(self, db_session):
+        from paildocket.models import User, Checklist
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        bob = User(
+            username='bob', password_hash='bobhash', email='bob@example.com')
+        db_session.add_all([alice, bob])
+        db_session.flush()
+        checklist = Checklist(title='Groceries')
+        checklist.editors.add(alice)
+        db_session.add(checklist)
+        db_session.flush()
+        return checklist, alice, bob
+
+    def test_granting_bumps_generation(self, db_session):
+        checklist, alice, bob = self._make_users_and_checklist(db_session)
+        assert alice.permissions_generation == 1
+        assert bob.permissions_generation == 0
+
+        checklist.viewers.add(bob)
+        db_session.flush()
+        assert bob.permissions_generation == 1
+        assert alice.permissions_generation == 1
+
+    def test_changing_role_bumps_generation(self, db_session):
+        from paildocket.models import ChecklistPermission
+
+        checklist, alice, bob = self._make_users_and_checklist(db_session)
+        permission = ChecklistPermission.for_user_and_checklist(
+            db_session, alice.id, checklist.id)
+        permission.edit = False
+        db_session.flush()
+        assert alice.permissions_generation == 2
+
+    def test_revoking_bumps_generation(self, db_session):
+        from paildocket.models import ChecklistPermission
+
+        checklist, alice, bob = self._make_users_and_checklist(db_session)
+        permission = ChecklistPermission.for_user_and_checklist(
+            db_session, alice.id, checklist.id)
+        db_session.delete(permission)
+        db_session.flush()
+        assert alice.permissions_generation == 2
+
+    def test_title_change_bumps_generation_of_users_with_access(
+            self, db_session):
+        checklist, alice, bob = self._make_users_and_checklist(db_session)
+        checklist.title = 'Shopping'
+        db_session.flush()
+        assert alice.permissions_generation == 2
+        assert bob.permissions_generation == 0
+
+    def test_description_change_does_not_bump_generation(self, db_session):
+        checklist, alice, bob = self._make_users_and_checklist(db_session)
+        checklist.description = 'For the weekend'
+        db_session.flush()
+        assert alice.permissions_generation == 1
+
+
+class TestBulkPermissions(object):
+    def _make_users_and_checklists(self, db_session):
+        from paildocket.models import User, Checklist
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        bob = User(
+            username='bob', password_hash='bobhash', email='bob@example.com')
+        groceries = Checklist(title='Groceries')
+        chores = Checklist(title='Chores')
+        groceries.editors.add(alice)
+        db_session.add_all([alice, bob, groceries, chores])
+        db_session.flush()
+        return alice, bob, groceries, chores
+
+    def _roles(self, db_session):
+        from paildocket.models import ChecklistPermission
+        return set(
+            (p.checklist.title, p.user.username, p.view, p.edit)
+            for p in db_session.query(ChecklistPermission))
+
+    def test_grant_many(self, db_session):
+        from paildocket.models import ChecklistPermission, EDIT_ROLE, VIEW_ROLE
+
+        alice, bob, groceries, chores = self._make_users_and_checklists(
+            db_session)
+        granted = ChecklistPermission.grant_many(db_session, [
+            (groceries.id, bob.id, VIEW_ROLE),
+            (groceries.id, bob.id, VIEW_ROLE),
+            (chores.id, bob.id, VIEW_ROLE),
+            (chores.id, bob.id, EDIT_ROLE),
+            # alice already edits groceries, and keeps doing so
+            (groceries.id, alice.id, VIEW_ROLE),
+        ])
+        assert granted == 2
+        assert self._roles(db_session) == {
+            ('Groceries', ALICE, True, True),
+            ('Groceries', 'bob', True, False),
+            ('Chores', 'bob', True, True),
+        }
+        assert bob.permissions_generation == 1
+        assert alice.permissions_generation == 1
+        assert groceries.viewers == {bob}
+
+    def test_grant_many_widens(self, db_session):
+        from paildocket.models import ChecklistPermission, EDIT_ROLE
+
+        alice, bob, groceries, chores = self._make_users_and_checklists(
+            db_session)
+        groceries.viewers.add(bob)
+        granted = ChecklistPermission.grant_many(
+            db_session, [(groceries.id, bob.id, EDIT_ROLE)])
+        assert granted == 1
+        assert ('Groceries', 'bob', True, True) in self._roles(db_session)
+
+    def test_revoke_many(self, db_session):
+        from paildocket.models import ChecklistPermission, EDIT_ROLE, VIEW_ROLE
+
+        alice, bob, groceries, chores = self._make_users_and_checklists(
+            db_session)
+        chores.editors.add(alice)
+        chores.editors.add(bob)
+        db_session.flush()
+        revoked = ChecklistPermission.revoke_many(db_session, [
+            (groceries.id, alice.id, VIEW_ROLE),
+            (chores.id, alice.id, EDIT_ROLE),
+            (chores.id, bob.id, EDIT_ROLE),
+            (chores.id, bob.id, VIEW_ROLE),
+            # nothing to revoke
+            (groceries.id, bob.id, EDIT_ROLE),
+        ])
+        assert revoked == 3
+        assert self._roles(db_session) == {('Chores', ALICE, True, False)}
+        assert alice.permissions_generation == 3
+        assert bob.permissions_generation == 2
+
+    def test_nothing_to_change(self, db_session):
+        from paildocket.models import ChecklistPermission
+
+        assert ChecklistPermission.grant_many(db_session, []) == 0
+        assert ChecklistPermission.revoke_many(db_session, []) == 0
+
+
+class TestChecklistVersion(object):
+    def _make_checklist(self, db_session):
+        from paildocket.models import Checklist, ChecklistItem
+
+        checklist = Checklist(title='Groceries')
+        db_session.add(checklist)
+        db_session.flush()
+        item = ChecklistItem(title='Milk', checklist_id=checklist.id)
+        db_session.add(item)
+        db_session.flush()
+        return checklist, item
+
+    def test_adding_item_bumps_version(self, db_session):
+        checklist, item = self._make_checklist(db_session)
+        assert checklist.version == 2
+
+    @pytest.mark.parametrize('attribute', ['title', 'description'])
+    def test_changing_checklist_bumps_version(self, db_session, attribute):
+        checklist, item = self._make_checklist(db_session)
+        setattr(checklist, attribute, 'changed')
+        db_session.flush()
+        assert checklist.version == 3
+
+    def test_changing_item_bumps_version(self, db_session):
+        checklist, item = self._make_checklist(db_session)
+        item.description = 'Semi-skimmed'
+        db_session.flush()
+        assert checklist.version == 3
+
+    def test_deleting_item_bumps_version(self, db_session):
+        checklist, item = self._make_checklist(db_session)
+        db_session.delete(item)
+        db_session.flush()
+        assert checklist.version == 3
+
+    def test_sharing_does_not_bump_version(self, db_session):
+        from paildocket.models import User
+
+        checklist, item = self._make_checklist(db_session)
+        checklist.viewers.add(User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL))
+        db_session.flush()
+        assert checklist.version == 2
+
+
+class TestUserIdentityMap(object):
+    def _make_alice(self, db_session):
+        from paildocket.models import User
+
+        alice = User(
+            username=ALICE, password_hash=ALICE_HASH, email=ALICE_EMAIL)
+        db_session.add(alice)
+        db_session.flush()
+        return alice
+
+    def test_get_returns_user(self, db_session):
+        from paildocket.models import UserIdentityMap
+
+        alice = self._make_alice(db_session)
+        identity_map = UserIdentityMap(db_session)
+        assert identity_map.get(alice.id) is alice
+        assert identity_map.saved_lookups == 0
+
+    def test_repeated_get_does_not_query(self, db_session):
+        from paildocket.models import UserIdentityMap
+
+        alice = self._make_alice(db_session)
+        identity_map = UserIdentityMap(db_session)
+        identity_map.get(alice.id)
+        db_session.delete(alice)
+        db_session.flush()
+        assert identity_map.get(alice.id) is alice
+        assert identity_map.saved_lookups == 1
+
+    def test_string_and_uuid_userids_share_entry(self, db_session):
+        from paildocket.models import UserIdentityMap
+
+        alice = self._make_alice(db_session)
+        identity_map = UserIdentityMap(db_session)
+        identity_map.get(str(alice.id))
+        assert identity_map.get(alice.id) is alice
+        assert identity_map.saved_lookups == 1
+
+    def test_missing_user_is_remembered(self, db_session):
+        from paildocket.models import UserIdentityMap
+
+        identity_map = UserIdentityMap(db_session)
+        assert identity_map.get(UUID_USERID) is None
+        assert identity_map.get(UUID_USERID) is None
+        assert identity_map.saved_lookups == 1
+
 
 @pytest.mark.parametrize(
     'input,expected',
@@ -0,0 +1,106 @@
+import pytest
+
+
+@pytest.fixture
+def checklist_ids(db_session):
+    from paildocket.models import Checklist
+    checklists = [Checklist(title=str(n)) for n in range(7)]
+    db_session.add_all(checklists)
+    db_session.flush()
+    return sorted(c.id for c in checklists)
+
+
+def _page(db_session, **kwargs):
+    from paildocket.models import Checklist
+    from paildocket.pagination import keyset_page
+    query = db_session.query(Checklist.id, Checklist.title)
+    return keyset_page(query, Checklist.id, 3, **kwargs)
+
+
+def _ids(page):
+    return [row.id for row in page]
+
+
+def test_first_page(db_session, checklist_ids):
+    page = _page(db_session)
+    assert _ids(page) == checklist_ids[:3]
+    assert page.next_key == checklist_ids[2]
+    assert page.previous_key is None
+
+
+def test_middle_page_after_key(db_session, checklist_ids):
+    page = _page(db_session, after=checklist_ids[2])
+    assert _ids(page) == checklist_ids[3:6]
+    assert page.next_key == checklist_ids[5]
+    assert page.previous_key == checklist_ids[3]
+
+
+def test_last_page_has_no_next(db_session, checklist_ids):
+    page = _page(db_session, after=checklist_ids[5])
+    assert _ids(page) == checklist_ids[6:]
+    assert page.next_key is None
+    assert page.previous_key == checklist_ids[6]
+
+
+def test_page_before_key(db_session, checklist_ids):
+    page = _page(db_session, before=checklist_ids[6])
+    assert _ids(page) == checklist_ids[3:6]
+    assert page.next_key == checklist_ids[5]
+    assert page.previous_key == checklist_ids[3]
+
+
+def test_first_page_before_key_has_no_previous(db_session, checklist_ids):
+    page = _page(db_session, before=checklist_ids[3])
+    assert _ids(page) == checklist_ids[:3]
+    assert page.previous_key is None
+    assert page.next_key == checklist_ids[2]
+
+
+def test_empty_page(db_session):
+    page = _page(db_session)
+    assert len(page) == 0
+    assert page.next_key is None
+    assert page.previous_key is None
+
+
+@pytest.fixture
+def titled_checklists(db_session):
+    from paildocket.models import Checklist
+    # Ordered by title descending then id: c, c, b, b, a, a, a
+    checklists = [Checklist(title=title) for title in 'aabbcca']
+    db_session.add_all(checklists)
+    db_session.flush()
+    return sorted(
+        ((c.title, c.id) for c in checklists),
+        key=lambda key: (-ord(key[0]), key[1]))
+
+
+def _ordered_page(db_session, **kwargs):
+    from paildocket.models import Checklist
+    from paildocket.pagination import ordered_keyset_page
+    query = db_session.query(Checklist.id, Checklist.title)
+    return ordered_keyset_page(
+        query, [Checklist.title.desc(), Checklist.id], 3, **kwargs)
+
+
+def _keys(page):
+    return [(row.title, row.id) for row in page]
+
+
+def test_ordered_pages(db_session, titled_checklists):
+    first = _ordered_page(db_session)
+    assert _keys(first) == titled_checklists[:3]
+    assert first.previous_key is None
+    second = _ordered_page(db_session, after=first.next_key)
+    assert _keys(second) == titled_checklists[3:6]
+    assert second.previous_key == titled_checklists[3]
+    last = _ordered_page(db_session, after=second.next_key)
+    assert _keys(last) == titled_checklists[6:]
+    assert last.next_key is None
+
+
+def test_ordered_page_before_key(db_session, titled_checklists):
+    page = _ordered_page(db_session, before=titled_checklists[5])
+    assert _keys(page) == titled_checklists[2:5]
+    assert page.previous_key == titled_checklists[2]
+    assert page.next_key == titled_checklists[4]
@@ -0,0 +1,105 @@
+import pytest
+
+from paildocket.tests.support import (
+    insecure_but_fast_password_context, insecure_hash_password
+)
+
+
+def _upgrading_password_context():
+    from paildocket.security import create_password_context
+    return create_password_context(
+        bcrypt__default_rounds=5, bcrypt__min_rounds=5)
+
+
+def _add_user(db_session, password='password'):
+    from paildocket.models import User
+    user = User(
+        username='alice',
+        email='alice@example.com',
+        password_hash=insecure_hash_password(password),
+    )
+    db_session.add(user)
+    db_session.flush()
+    return user
+
+
+@pytest.fixture
+def rehasher(db_session, app_config_models_included):
+    from paildocket.rehash import PasswordRehasher
+    return PasswordRehasher(
+        _upgrading_password_context(), app_config_models_included.registry)
+
+
+class TestPasswordRehasher(object):
+    def test_rehash(self, db_session, rehasher):
+        user = _add_user(db_session)
+        old_hash = user.password_hash
+        assert rehasher.rehash(user.id, 'password', old_hash)
+        db_session.expire(user)
+        assert user.password_hash.startswith('$2a$05$')
+        assert rehasher.password_context.verify('password', user.password_hash)
+
+    def test_rehash_skips_changed_hash(self, db_session, rehasher):
+        user = _add_user(db_session)
+        old_hash = user.password_hash
+        user.password_hash = new_hash = insecure_hash_password('changed')
+        db_session.flush()
+        assert not rehasher.rehash(user.id, 'password', old_hash)
+        db_session.expire(user)
+        assert user.password_hash == new_hash
+
+    def test_enqueue_upgrades_in_background(self, db_session, rehasher):
+        user = _add_user(db_session)
+        assert rehasher.enqueue(user, 'password')
+        rehasher.join()
+        db_session.expire(user)
+        assert not rehasher.password_context.needs_update(user.password_hash)
+
+    def test_enqueue_refuses_when_full(self, app_config):
+        from paildocket.rehash import PasswordRehasher
+        from paildocket.tests.support import DummyObject
+        rehasher = PasswordRehasher(None, app_config.registry, maxsize=1)
+        rehasher._queue.put_nowait(None)
+        user = DummyObject()
+        user.id = 1
+        user.password_hash = 'hash'
+        assert not rehasher.enqueue(user, 'password')
+        assert not rehasher._pending
+
+    def test_enqueue_refuses_duplicate(self, app_config):
+        from paildocket.rehash import PasswordRehasher
+        from paildocket.tests.support import DummyObject
+        rehasher = PasswordRehasher(None, app_config.registry)
+        user = DummyObject()
+        user.id = 1
+        rehasher._pending.add(user.id)
+        assert not rehasher.enqueue(user, 'password')
+
+
+def test_count_password_hashes():
+    from paildocket.rehash import HashCount, count_password_hashes
+    hashes = [
+        insecure_hash_password('a'),
+        insecure_hash_password('b'),
+        _upgrading_password_context().encrypt('c'),
+        'not a hash',
+    ]
+    assert count_password_hashes(_upgrading_password_context(), hashes) == [
+        HashCount(None, None, 1, True),
+        HashCount('bcrypt', 4, 2, True),
+        HashCount('bcrypt', 5, 1, False),
+    ]
+    assert not any(
+        row.needs_update
+        for row in count_password_hashes(
+            insecure_but_fast_password_context, hashes[:3])
+    )
+
+
+def test_includeme_disabled(app_config):
+    from paildocket.security import create_password_context
+    settings = app_config.registry.settings
+    settings['paildocket.password.rehash_in_background'] = 'false'
+    app_config.registry['password_context'] = create_password_context()
+    app_config.include('paildocket.rehash')
+    assert app_config.registry['password_rehasher'] is None
@@ -0,0 +1,133 @@
+import datetime
+import json
+import uuid
+
+import pytest
+
+from paildocket.renderers import BACKENDS
+
+
+VALUE = {
+    'id': uuid.UUID('ccd6a2d7-a22a-4487-97a4-9afef9d77718'),
+    'created': datetime.datetime(2015, 3, 1, 12, 30),
+    'due': datetime.date(2015, 3, 2),
+    'title': 'Einkäufe',
+    'items': [1, 2],
+}
+
+EXPECTED = {
+    'id': 'ccd6a2d7-a22a-4487-97a4-9afef9d77718',
+    'created': '2015-03-01T12:30:00',
+    'due': '2015-03-02',
+    'title': 'Einkäufe',
+    'items': [1, 2],
+}
+
+
+class JSONable(object):
+    def __json__(self, request):
+        return {'request': request.marker}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    return request.param
+
+
+def _render(renderer, value, request=None):
+    from pyramid.testing import DummyRequest
+    request = DummyRequest() if request is None else request
+    result = renderer(None)(value, {'request': request})
+    return result, request.response
+
+
+def _make_renderer(backend, chunk_size=64 * 1024):
+    from paildocket.renderers import JSONRenderer
+    return JSONRenderer(backend=backend, chunk_size=chunk_size)
+
+
+def test_render(backend):
+    result, response = _render(_make_renderer(backend), VALUE)
+    assert json.loads(result.decode('utf-8')) == EXPECTED
+    assert response.content_type == 'application/json'
+
+
+def test_render_json_method(backend):
+    from pyramid.testing import DummyRequest
+    request = DummyRequest()
+    request.marker = 'marker'
+    result, response = _render(
+        _make_renderer(backend), [JSONable()], request=request)
+    assert json.loads(result.decode('utf-8')) == [{'request': 'marker'}]
+
+
+def test_render_unserializable_raises(backend):
+    with pytest.raises(TypeError):
+        _render(_make_renderer(backend), {'a': object()})
+
+
+def test_render_keeps_explicit_content_type(backend):
+    from pyramid.testing import DummyRequest
+    request = DummyRequest()
+    request.response.content_type = 'application/vnd.api+json'
+    _render(_make_renderer(backend), VALUE, request=request)
+    assert request.response.content_type == 'application/vnd.api+json'
+
+
+@pytest.mark.parametrize('value', [
+    [],
+    [VALUE],
+    [VALUE] * 50,
+])
+def test_stream(backend, value):
+    from paildocket.renderers import JSONStream
+    renderer = _make_renderer(backend, chunk_size=100)
+    result, response = _render(renderer, JSONStream(iter(value)))
+    assert result is None
+    chunks = list(response.app_iter)
+    assert all(len(chunk) < 100 + 200 for chunk in chunks)
+    body = b''.join(chunks).decode('utf-8')
+    assert json.loads(body) == [EXPECTED] * len(value)
+
+
+def test_stream_in_dict(backend):
+    from paildocket.renderers import JSONStream
+    renderer = _make_renderer(backend, chunk_size=10)
+    value = {'id': VALUE['id'], 'items': JSONStream(range(100))}
+    result, response = _render(renderer, value)
+    assert result is None
+    body = b''.join(response.app_iter).decode('utf-8')
+    assert json.loads(body) == {
+        'id': EXPECTED['id'], 'items': list(range(100))}
+
+
+def test_stream_is_consumed_lazily():
+    from paildocket.renderers import JSONStream
+    consumed = []
+
+    def items():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    renderer = _make_renderer('stdlib', chunk_size=1)
+    result, response = _render(renderer, JSONStream(items()))
+    assert consumed == []
+    next(iter(response.app_iter))
+    assert len(consumed) < 10
+
+
+def test_get_backend():
+    from paildocket.renderers import get_backend
+    assert get_backend('stdlib') is BACKENDS['stdlib']
+    assert get_backend('auto') in BACKENDS.values()
+    with pytest.raises(ValueError):
+        get_backend('nonexistent')
+
+
+@pytest.mark.functional
+def test_json_views_use_renderer(testapp):
+    from paildocket.renderers import JSONRenderer
+    from pyramid.interfaces import IRendererFactory
+    factory = testapp.app.registry.getUtility(IRendererFactory, name='json')
+    assert isinstance(factory, JSONRenderer)
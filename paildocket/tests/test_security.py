@@ -1,5 +1,189 @@
 import pytest
 
-from paildocket.tests.support import ENCODED_USERID, UUID_USERID
+from paildocket.tests.support import DummyObject, UUID_USERID
 
-# TODO: Add tests for security module!
+
+class TestGetPrincipals(object):
+    def _make_request(self, db_session):
+        from paildocket.models import UserIdentityMap
+
+        request = DummyObject()
+        request.user_identity_map = UserIdentityMap(db_session)
+        return request
+
+    def _make_user(self, db_session, admin=False):
+        from paildocket.models import User
+
+        user = User(
+            username='alice', email='alice@example.com',
+            password_hash='alicehash', admin=admin)
+        db_session.add(user)
+        db_session.flush()
+        return user
+
+    def test_unknown_userid_returns_none(self, db_session):
+        from paildocket.security import _get_principals
+
+        request = self._make_request(db_session)
+        assert _get_principals(UUID_USERID, request) is None
+
+    def test_user_principals(self, db_session):
+        from pyramid.security import Authenticated
+        from paildocket.security import _get_principals
+
+        user = self._make_user(db_session)
+        request = self._make_request(db_session)
+        principals = _get_principals(str(user.id), request)
+        assert principals == [Authenticated, 'alice@example.com']
+
+    def test_admin_principals(self, db_session):
+        from pyramid.security import Authenticated
+        from paildocket.security import _get_principals, Administrator
+
+        user = self._make_user(db_session, admin=True)
+        request = self._make_request(db_session)
+        principals = _get_principals(str(user.id), request)
+        assert principals == [
+            Authenticated, Administrator, 'alice@example.com']
+
+    def test_shares_identity_map_with_request_user(self, db_session):
+        from paildocket.models import User
+        from paildocket.security import _get_principals
+
+        user = self._make_user(db_session)
+        request = self._make_request(db_session)
+        request.authenticated_userid = str(user.id)
+        _get_principals(str(user.id), request)
+        assert User.from_request(request) is user
+        assert request.user_identity_map.saved_lookups == 1
+
+
+class TestPrincipalCache(TestGetPrincipals):
+    def _make_cache(self):
+        from paildocket.security import PrincipalCache
+        return PrincipalCache(maxsize=10, ttl=60)
+
+    def test_cached_principals_skip_lookup(self, db_session):
+        from pyramid.security import Authenticated
+
+        user = self._make_user(db_session)
+        cache = self._make_cache()
+        cache(str(user.id), self._make_request(db_session))
+        request = DummyObject()  # no identity map, lookup would fail
+        principals = cache(str(user.id), request)
+        assert principals == [Authenticated, 'alice@example.com']
+
+    def test_unknown_userid_is_not_cached(self, db_session):
+        cache = self._make_cache()
+        assert cache(UUID_USERID, self._make_request(db_session)) is None
+        user = self._make_user(db_session)
+        assert cache(user.id, self._make_request(db_session)) is not None
+
+    @pytest.mark.parametrize('attribute,value,expected_principal', [
+        ('admin', True, 'paildocket.Administrator'),
+        ('email', 'alice2@example.com', 'alice2@example.com'),
+    ])
+    def test_changed_user_is_evicted(self, db_session, attribute, value,
+                                     expected_principal):
+        user = self._make_user(db_session)
+        cache = self._make_cache()
+        cache(str(user.id), self._make_request(db_session))
+        setattr(user, attribute, value)
+        principals = cache(str(user.id), self._make_request(db_session))
+        assert expected_principal in principals
+
+    def test_changed_user_is_evicted_again_after_commit(self, db_session):
+        import transaction
+
+        user = self._make_user(db_session)
+        userid = str(user.id)
+        cache = self._make_cache()
+        user.admin = True
+        # A concurrent request caches the old state before commit.
+        cache._cache.set(userid, (False, 'alice@example.com'))
+        transaction.commit()
+        principals = cache(userid, self._make_request(db_session))
+        assert 'paildocket.Administrator' in principals
+
+    def test_deleted_user_is_evicted(self, db_session):
+        user = self._make_user(db_session)
+        cache = self._make_cache()
+        cache(str(user.id), self._make_request(db_session))
+        db_session.delete(user)
+        db_session.flush()
+        assert cache(str(user.id), self._make_request(db_session)) is None
+
+
+class NeverFinishingExecutor(object):
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        return Future()
+
+
+class TestPooledPasswordContext(object):
+    def _make_context(self, executor=None, max_pending=2, timeout=10,
+                      **policy_kwargs):
+        from concurrent.futures import ThreadPoolExecutor
+        from paildocket.security import (
+            PooledPasswordContext, create_password_policy
+        )
+        executor = ThreadPoolExecutor(1) if executor is None else executor
+        policy_kwargs.setdefault('bcrypt__default_rounds', 4)
+        policy = create_password_policy(**policy_kwargs)
+        return PooledPasswordContext(
+            policy, executor, max_pending=max_pending, timeout=timeout)
+
+    def test_encrypt_and_verify(self):
+        context = self._make_context()
+        password_hash = context.encrypt('password')
+        assert context.verify('password', password_hash)
+        assert not context.verify('wrong', password_hash)
+
+    def test_verify_and_update(self):
+        from paildocket.tests.support import insecure_hash_password
+        context = self._make_context()
+        password_hash = insecure_hash_password('password')
+        assert context.verify_and_update('password', password_hash) == (
+            True, None)
+
+    def test_needs_update(self):
+        from paildocket.tests.support import insecure_hash_password
+        context = self._make_context(
+            bcrypt__default_rounds=5, bcrypt__min_rounds=5)
+        assert context.needs_update(insecure_hash_password('password'))
+
+    def test_process_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(1)
+        try:
+            context = self._make_context(executor=executor)
+            assert context.verify('password', context.encrypt('password'))
+        finally:
+            executor.shutdown()
+
+    def test_saturated_pool_raises(self):
+        from paildocket.security import PasswordHashingUnavailable
+        context = self._make_context(max_pending=0)
+        with pytest.raises(PasswordHashingUnavailable):
+            context.encrypt('password')
+
+    def test_timeout_raises_and_frees_slot(self):
+        from paildocket.security import PasswordHashingUnavailable
+        context = self._make_context(
+            executor=NeverFinishingExecutor(), max_pending=1, timeout=0.01)
+        with pytest.raises(PasswordHashingUnavailable):
+            context.encrypt('password')
+        # The cancelled call released its slot, so this one times out too
+        # instead of being refused.
+        with pytest.raises(PasswordHashingUnavailable) as excinfo:
+            context.encrypt('password')
+        assert 'timed out' in str(excinfo.value)
+
+
+def test_create_dummy_hash_uses_configured_cost():
+    from paildocket.security import create_dummy_hash
+    from paildocket.tests.support import insecure_but_fast_password_context
+    dummy_hash = create_dummy_hash(insecure_but_fast_password_context)
+    assert dummy_hash.startswith('$2a$04$')
+    assert not insecure_but_fast_password_context.needs_update(dummy_hash)
+    assert not insecure_but_fast_password_context.verify('', dummy_hash)
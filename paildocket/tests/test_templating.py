@@ -0,0 +1,71 @@
+import pytest
+
+
+def _write(directory, name, source):
+    path = directory.join(*name.split('/'))
+    path.write(source, ensure=True)
+
+
+@pytest.fixture
+def template_dir(tmpdir):
+    _write(tmpdir, 'base.jinja2', '{% block content %}{% endblock %}')
+    _write(tmpdir, 'page.jinja2',
+           '{% extends "base.jinja2" %}'
+           '{% block content %}{% include "sub/part.jinja2" %}{% endblock %}')
+    _write(tmpdir, 'sub/part.jinja2', 'part')
+    _write(tmpdir, 'notes.txt', 'not a template')
+    return tmpdir
+
+
+@pytest.fixture
+def environment(template_dir):
+    from jinja2 import Environment, FileSystemLoader
+    return Environment(loader=FileSystemLoader(str(template_dir)))
+
+
+def test_iter_template_names(template_dir):
+    from paildocket.templating import iter_template_names
+    assert list(iter_template_names(str(template_dir))) == [
+        'base.jinja2', 'page.jinja2', 'sub/part.jinja2']
+
+
+def test_precompile_templates(environment, template_dir):
+    from paildocket.templating import precompile_templates
+    assert precompile_templates(environment, str(template_dir)) == 3
+    cached_names = {name for loader, name in environment.cache.keys()}
+    assert cached_names == {'base.jinja2', 'page.jinja2', 'sub/part.jinja2'}
+    environment.get_template('page.jinja2').render()
+    assert len(environment.cache) == 3
+
+
+@pytest.mark.functional
+def test_requests_use_precompiled_templates():
+    from pyramid.paster import get_appsettings
+    from pyramid_jinja2 import IJinja2Environment
+    from webtest import TestApp
+    from paildocket.tests.support import TESTS_INI
+    from paildocket.wsgi import main
+    settings = get_appsettings(TESTS_INI)
+    settings['paildocket.templates.precompile'] = 'true'
+    app = main({}, **settings)
+    environment = app.registry.getUtility(IJinja2Environment, name='.jinja2')
+    precompiled = set(environment.cache.keys())
+    assert precompiled
+
+    TestApp(app).get('/', status=200)
+    assert set(environment.cache.keys()) == precompiled
+
+
+@pytest.mark.parametrize('settings,subscribed', [
+    ({'pyramid.reload_templates': 'false'}, True),
+    ({'pyramid.reload_templates': 'true'}, False),
+    ({'pyramid.reload_templates': 'true',
+      'paildocket.templates.precompile': 'true'}, True),
+])
+def test_includeme_precompiles_unless_reloading(
+        app_config, settings, subscribed):
+    app_config.registry.settings.update(settings)
+    app_config.include('paildocket.templating')
+    app_config.commit()
+    handlers = list(app_config.registry.registeredHandlers())
+    assert bool(handlers) == subscribed
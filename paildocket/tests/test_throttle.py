@@ -0,0 +1,224 @@
+import pytest
+
+from paildocket.tests.support import DummyObject
+from paildocket.tests.test_cache import FakeClock
+
+
+class TestMemoryTokenBuckets(object):
+    def _make_buckets(self, capacity=2, rate=1.0, maxsize=10):
+        from paildocket.throttle import MemoryTokenBuckets
+        clock = FakeClock()
+        return MemoryTokenBuckets(capacity, rate, maxsize, clock=clock), clock
+
+    def test_burst_then_refused(self):
+        buckets, clock = self._make_buckets(capacity=2)
+        assert buckets.consume('a')
+        assert buckets.consume('a')
+        assert not buckets.consume('a')
+
+    def test_buckets_are_independent(self):
+        buckets, clock = self._make_buckets(capacity=1)
+        assert buckets.consume('a')
+        assert buckets.consume('b')
+        assert not buckets.consume('a')
+
+    def test_refills_over_time(self):
+        buckets, clock = self._make_buckets(capacity=2, rate=0.5)
+        buckets.consume('a')
+        buckets.consume('a')
+        clock.now = 1
+        assert not buckets.consume('a')
+        clock.now = 2
+        assert buckets.consume('a')
+
+    def test_refill_is_capped_at_capacity(self):
+        buckets, clock = self._make_buckets(capacity=2, rate=1)
+        clock.now = 100
+        assert buckets.consume('a')
+        assert buckets.consume('a')
+        assert not buckets.consume('a')
+
+    def test_least_recently_used_bucket_is_forgotten(self):
+        buckets, clock = self._make_buckets(capacity=1, maxsize=2)
+        buckets.consume('a')
+        buckets.consume('b')
+        buckets.consume('c')
+        assert len(buckets) == 2
+        # 'a' was forgotten, so starts again from a full bucket
+        assert buckets.consume('a')
+        assert not buckets.consume('c')
+
+
+class TestDatabaseTokenBuckets(object):
+    def test_burst_then_refused(self, db_session):
+        from paildocket.throttle import DatabaseTokenBuckets
+        request = DummyObject()
+        request.db_session = db_session
+        buckets = DatabaseTokenBuckets(capacity=2, rate=0.001)
+        assert buckets.consume('a', request)
+        assert buckets.consume('a', request)
+        assert not buckets.consume('a', request)
+        assert buckets.consume('b', request)
+
+    def test_refills_over_time(self, db_session):
+        from paildocket.models import LoginThrottleBucket
+        from paildocket.throttle import DatabaseTokenBuckets
+        request = DummyObject()
+        request.db_session = db_session
+        buckets = DatabaseTokenBuckets(capacity=1, rate=1)
+        assert buckets.consume('a', request)
+        bucket = db_session.query(LoginThrottleBucket).get('a')
+        bucket.updated -= 1
+        db_session.flush()
+        assert buckets.consume('a', request)
+
+    def _age_buckets(self, db_session, seconds, *keys):
+        from paildocket.models import LoginThrottleBucket
+        for key in keys:
+            db_session.query(LoginThrottleBucket).get(key).updated -= seconds
+        db_session.flush()
+
+    def test_prune_deletes_refilled_buckets_of_prefix(self, db_session):
+        from paildocket.models import LoginThrottleBucket
+        from paildocket.throttle import DatabaseTokenBuckets
+        request = DummyObject()
+        request.db_session = db_session
+        buckets = DatabaseTokenBuckets(capacity=2, rate=1, prefix='id:')
+        for key in ['id:old', 'id:new', 'addr:old']:
+            buckets.consume(key, request)
+        self._age_buckets(db_session, 3, 'id:old', 'addr:old')
+        self._age_buckets(db_session, 1, 'id:new')
+
+        assert buckets.prune(db_session.connection()) == 1
+        db_session.expire_all()
+        keys = set(key for key, in db_session.query(LoginThrottleBucket.key))
+        assert keys == {'id:new', 'addr:old'}
+
+    def test_consume_prunes_every_so_often(self, db_session):
+        from paildocket.models import LoginThrottleBucket
+        from paildocket.throttle import DatabaseTokenBuckets
+        request = DummyObject()
+        request.db_session = db_session
+        buckets = DatabaseTokenBuckets(capacity=1, rate=1, prune_every=2)
+        buckets.consume('a', request)
+        self._age_buckets(db_session, 2, 'a')
+        buckets.consume('b', request)
+        db_session.expire_all()
+        keys = set(key for key, in db_session.query(LoginThrottleBucket.key))
+        assert keys == {'b'}
+
+    def test_consume_does_not_wait_for_open_requests(self, db_session):
+        import threading
+        from sqlalchemy.orm import Session
+        from paildocket.models import LoginThrottleBucket
+        from paildocket.throttle import DatabaseTokenBuckets
+
+        # Committed on real connections, unlike the rest of the tests
+        engine = db_session.bind.engine
+        buckets = DatabaseTokenBuckets(capacity=2, rate=0.001)
+        first, second = DummyObject(), DummyObject()
+        first.db_session = Session(bind=engine)
+        second.db_session = Session(bind=engine)
+        try:
+            # The first request's transaction stays open, as it does
+            # while the password is hashed
+            first.db_session.execute('SELECT 1')
+            assert buckets.consume('identity:shared', first)
+
+            results = []
+            thread = threading.Thread(target=lambda: results.append(
+                buckets.consume('identity:shared', second)))
+            thread.start()
+            thread.join(timeout=10)
+            assert results == [True]
+        finally:
+            first.db_session.close()
+            second.db_session.close()
+            with engine.connect() as connection:
+                connection.execute(
+                    LoginThrottleBucket.__table__.delete().where(
+                        LoginThrottleBucket.key == 'identity:shared'))
+
+
+class FakeBuckets(object):
+    def __init__(self, allowed):
+        self.allowed = allowed
+        self.keys = []
+
+    def consume(self, key, request):
+        self.keys.append(key)
+        return self.allowed
+
+
+class TestLoginThrottle(object):
+    def _make_request(self, remote_addr='192.0.2.1'):
+        request = DummyObject()
+        request.remote_addr = remote_addr
+        return request
+
+    def test_allowed(self):
+        from paildocket.throttle import LoginThrottle
+        identities, addresses = FakeBuckets(True), FakeBuckets(True)
+        throttle = LoginThrottle(identities, addresses)
+        assert throttle.allow(self._make_request(), ' Alice ')
+        assert identities.keys == ['identity:alice']
+        assert addresses.keys == ['address:192.0.2.1']
+
+    def test_refused_by_address_before_identity(self):
+        from paildocket.throttle import LoginThrottle
+        identities, addresses = FakeBuckets(True), FakeBuckets(False)
+        throttle = LoginThrottle(identities, addresses)
+        assert not throttle.allow(self._make_request(), 'alice')
+        assert identities.keys == []
+
+    def test_refused_by_identity(self):
+        from paildocket.throttle import LoginThrottle
+        throttle = LoginThrottle(FakeBuckets(False), FakeBuckets(True))
+        assert not throttle.allow(self._make_request(), 'alice')
+
+    def test_no_address(self):
+        from paildocket.throttle import LoginThrottle
+        identities, addresses = FakeBuckets(True), FakeBuckets(False)
+        throttle = LoginThrottle(identities, addresses)
+        assert throttle.allow(self._make_request(remote_addr=None), 'alice')
+
+    def test_without_address_buckets(self):
+        from paildocket.throttle import LoginThrottle
+        identities = FakeBuckets(True)
+        throttle = LoginThrottle(identities)
+        assert throttle.allow(self._make_request(), 'alice')
+        assert identities.keys == ['identity:alice']
+
+
+@pytest.mark.parametrize('backend,buckets_class', [
+    ('memory', 'MemoryTokenBuckets'),
+    ('database', 'DatabaseTokenBuckets'),
+])
+def test_includeme_backend(app_config, backend, buckets_class):
+    from paildocket import throttle
+    app_config.registry.settings['paildocket.login_throttle.backend'] = (
+        backend)
+    app_config.include('paildocket.throttle')
+    login_throttle = app_config.registry['login_throttle']
+    assert isinstance(
+        login_throttle.identity_buckets, getattr(throttle, buckets_class))
+    assert login_throttle.identity_buckets.rate == 2 / 60
+
+
+def test_includeme_without_address_buckets(app_config):
+    settings = app_config.registry.settings
+    settings['paildocket.login_throttle.address_burst'] = '0'
+    app_config.include('paildocket.throttle')
+    assert app_config.registry['login_throttle'].address_buckets is None
+
+
+def test_includeme_disabled(app_config):
+    app_config.registry.settings['paildocket.login_throttle.backend'] = 'none'
+    app_config.include('paildocket.throttle')
+    assert app_config.registry['login_throttle'] is None
+
+
+def test_includeme_unknown_backend(app_config):
+    app_config.registry.settings['paildocket.login_throttle.backend'] = 'x'
+    with pytest.raises(ValueError):
+        app_config.include('paildocket.throttle')
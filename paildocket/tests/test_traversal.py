@@ -111,3 +111,105 @@ def test_traversal__path_resource_attribute(path, attribute_name, value):
     t = traverse(root_resource, path)
     context = t['context']
     assert getattr(context, attribute_name) == value
+
+
+class TestChecklistResourceACL(object):
+    def _make_user(self, db_session, username):
+        from paildocket.models import User
+        user = User(
+            username=username, email='{0}@example.com'.format(username),
+            password_hash='hash')
+        db_session.add(user)
+        return user
+
+    def _make_resource(self, db_session, checklist, user, headers=None):
+        request = FakeRequest()
+        request.db_session = db_session
+        request.user = user
+        request.headers = {} if headers is None else headers
+        collection = ChecklistCollectionResource(RootResource(request))
+        return collection[str(checklist.id)]
+
+    def _make_shared_checklist(self, db_session):
+        from paildocket.models import Checklist
+        alice = self._make_user(db_session, 'alice')
+        bob = self._make_user(db_session, 'bob')
+        charles = self._make_user(db_session, 'charles')
+        checklist = Checklist(title='Shared')
+        checklist.editors.add(alice)
+        checklist.viewers.add(bob)
+        db_session.add(checklist)
+        db_session.flush()
+        db_session.expire_all()
+        return checklist, alice, bob, charles
+
+    def test_editor_can_edit_and_view(self, db_session):
+        from pyramid.security import Allow, DENY_ALL
+        from paildocket.security import EditAndViewPermission
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        resource = self._make_resource(db_session, checklist, alice)
+        assert resource.__acl__() == [
+            (Allow, alice.principal, EditAndViewPermission), DENY_ALL]
+
+    def test_viewer_can_view(self, db_session):
+        from pyramid.security import Allow, DENY_ALL
+        from paildocket.security import ViewPermission
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        resource = self._make_resource(db_session, checklist, bob)
+        assert resource.__acl__() == [
+            (Allow, bob.principal, ViewPermission), DENY_ALL]
+
+    def test_unshared_user_denied(self, db_session):
+        from pyramid.security import DENY_ALL
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        resource = self._make_resource(db_session, checklist, charles)
+        assert resource.__acl__() == [DENY_ALL]
+
+    def test_group_member_can_view(self, db_session):
+        from pyramid.security import Allow, DENY_ALL
+        from paildocket.models import Group
+        from paildocket.security import ViewPermission
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        team = Group(name='team')
+        team.members.add(charles)
+        checklist.viewer_groups.add(team)
+        db_session.flush()
+        resource = self._make_resource(db_session, checklist, charles)
+        assert resource.__acl__() == [
+            (Allow, charles.principal, ViewPermission), DENY_ALL]
+
+    def test_anonymous_denied(self, db_session):
+        from pyramid.security import DENY_ALL
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        resource = self._make_resource(db_session, checklist, None)
+        assert resource.__acl__() == [DENY_ALL]
+
+    def test_acl_does_not_load_permission_collections(self, db_session):
+        from sqlalchemy import inspect
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        resource = self._make_resource(db_session, checklist, alice)
+        resource.__acl__()
+        unloaded = inspect(resource.checklist).unloaded
+        assert 'editor_permissions' in unloaded
+        assert 'viewer_permissions' in unloaded
+
+    @pytest.mark.parametrize('headers,loaded', [
+        ({}, True),
+        ({'If-None-Match': '"1"'}, False),
+    ])
+    def test_description_loaded_unless_conditional(
+            self, db_session, headers, loaded):
+        from sqlalchemy import inspect
+        checklist, alice, bob, charles = self._make_shared_checklist(
+            db_session)
+        checklist.id, alice.id  # loaded before they are detached
+        db_session.expunge_all()
+        resource = self._make_resource(db_session, checklist, alice, headers)
+        unloaded = inspect(resource.checklist).unloaded
+        assert ('description' not in unloaded) is loaded
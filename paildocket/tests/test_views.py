@@ -2,6 +2,7 @@ from urllib.parse import urlparse
 
 import pytest
 from pyramid.testing import DummyRequest, DummyResource
+from webob import Request
 from paildocket.tests.support import DummyObject, ENCODED_USERID
 
 
@@ -28,6 +29,35 @@ def create_user_from_db_session(db_session, password_hasher=None):
     transaction.commit()
 
 
+def log_in_with_checklists(testapp, edited=(), viewed=(), unshared=()):
+    """
+    Create the test user with checklists titled ``edited`` and
+    ``viewed``, which they can edit and view, and ``unshared`` ones
+    they cannot see; commit and log them in. Return the ids of the
+    checklists, in that order.
+    """
+    import transaction
+    from paildocket.models import User, Checklist
+
+    create_user_in_testapp(testapp)
+    db_session = testapp.app.registry['db_sessionmaker']()
+    user = db_session.query(User).filter_by(username='testuser').one()
+    checklists = []
+    for titles, users in [
+            (edited, 'editors'), (viewed, 'viewers'), (unshared, None)]:
+        for title in titles:
+            checklist = Checklist(title=title)
+            if users is not None:
+                getattr(checklist, users).add(user)
+            checklists.append(checklist)
+    db_session.add_all(checklists)
+    db_session.flush()
+    checklist_ids = [checklist.id for checklist in checklists]
+    transaction.commit()
+    _login(testapp, 'testuser', 'testuserpass')
+    return checklist_ids
+
+
 def create_test_view_instance(view_class, context=None, request=None):
     context = DummyResource() if context is None else context
     request = DummyRequest() if request is None else request
@@ -51,6 +81,15 @@ def test_forbidden_view_without_user_returns_redirect_to_login():
     assert urlparse(response.location).path == '/login'
 
 
+def test_password_hashing_unavailable_returns_503():
+    from paildocket.security import PasswordHashingUnavailable
+    from paildocket.views.root import password_hashing_unavailable
+    exc = PasswordHashingUnavailable('Too many pending password operations')
+    response = password_hashing_unavailable(exc, DummyRequest())
+    assert response.status_int == 503
+    assert response.headers['Retry-After'] == '5'
+
+
 def test_root_view():
     from paildocket.views.root import RootViews
 
@@ -68,8 +107,41 @@ class TestLoginView(object):
 
     def test_display_returns_form(self):
         inst = self._make_inst()
+        inst.request.registry['form_cache'] = None
+        inst.form = DummyForm()
         result = inst.display()
-        assert result['form'] is inst.form
+        assert result['form_html'] == 'rendered form'
+
+    def test_display_serves_cached_form(self):
+        from paildocket.cache import LRUCache
+        form_cache = LRUCache(10)
+        inst = self._make_inst()
+        inst.request.registry['form_cache'] = form_cache
+        inst.form = DummyForm()
+        assert inst.display()['form_html'] == 'rendered form'
+        assert len(form_cache) == 1
+
+        inst = self._make_inst()
+        inst.request.registry['form_cache'] = form_cache
+        assert inst.display()['form_html'] == 'rendered form'
+        # served without building a form
+        assert 'form' not in vars(inst)
+
+    def test_cached_form_depends_on_locale(self):
+        from paildocket.cache import LRUCache
+        form_cache = LRUCache(10)
+        for locale_name in ['en', 'de']:
+            inst = self._make_inst()
+            inst.request.registry['form_cache'] = form_cache
+            inst.request.locale_name = locale_name
+            inst.form = DummyForm()
+            inst.display()
+        assert len(form_cache) == 2
+
+
+class DummyForm(object):
+    def render(self):
+        return 'rendered form'
 
 
 #
@@ -81,6 +153,70 @@ def test_test_app(testapp):
     assert b'This project is called paildocket' in res.body
 
 
+@pytest.mark.functional
+def test_login_form_is_rendered_once_per_locale(testapp):
+    form_cache = testapp.app.registry['form_cache']
+    first = testapp.get('/login', status=200)
+    assert len(form_cache) == 1
+    assert testapp.get('/login', status=200).body == first.body
+    assert len(form_cache) == 1
+    german = testapp.get(
+        '/login', headers={'Accept-Language': 'de'}, status=200)
+    assert len(form_cache) == 2
+    assert 'Anmelden' in german.text
+
+
+@pytest.mark.functional
+@pytest.mark.parametrize('path', ['/login', '/register'])
+def test_form_pages_link_deform_resources(testapp, path):
+    res = testapp.get(path, status=200)
+    assert 'http://localhost/deform_static/css/form.css' in res.text
+    assert 'http://localhost/deform_static/scripts/deform.js' in res.text
+
+
+@pytest.mark.functional
+def test_anonymous_page_sets_no_cookie(testapp):
+    res = testapp.get('/', headers={'Accept-Language': 'de'}, status=200)
+    assert 'Set-Cookie' not in res.headers
+    assert b'<html lang="de">' in res.body
+
+
+@pytest.mark.functional
+def test_negotiated_page_varies_on_language_and_cookie(testapp):
+    res = testapp.get('/', headers={'Accept-Language': 'de'}, status=200)
+    assert {'Accept-Language', 'Cookie'} <= set(res.vary)
+    res = testapp.get('/static/css/style.css', status=200)
+    assert 'Accept-Language' not in (res.vary or ())
+
+
+@pytest.mark.functional
+def test_chosen_language_overrides_accept_language(testapp):
+    testapp.post('/language', {'lang': 'de'}, status=302)
+    res = testapp.get('/', headers={'Accept-Language': 'en'}, status=200)
+    assert b'<html lang="de">' in res.body
+
+
+@pytest.mark.functional
+@pytest.mark.parametrize('referer,location', [
+    ('http://localhost/list', 'http://localhost/list'),
+    ('http://localhost', 'http://localhost'),
+    ('http://localhost.evil.example/', 'http://localhost/'),
+    ('https://evil.example/', 'http://localhost/'),
+    (None, 'http://localhost/'),
+])
+def test_language_redirects_only_to_local_referer(testapp, referer, location):
+    headers = {} if referer is None else {'Referer': referer}
+    res = testapp.post(
+        '/language', {'lang': 'de'}, headers=headers, status=302)
+    assert res.location == location
+
+
+@pytest.mark.functional
+def test_unavailable_language_is_not_remembered(testapp):
+    res = testapp.post('/language', {'lang': 'xx'}, status=302)
+    assert 'Set-Cookie' not in res.headers
+
+
 @pytest.mark.functional
 @pytest.mark.parametrize(
     'path', [
@@ -129,6 +265,44 @@ def test_login_failed(testapp, identity, password):
     assert b'Unknown username/email or incorrect password' in res.body
 
 
+@pytest.mark.functional
+def test_login_upgrades_password_hash_in_background(testapp):
+    from paildocket.models import User
+    from paildocket.rehash import PasswordRehasher
+    from paildocket.security import create_password_context
+    create_user_in_testapp(testapp)
+    registry = testapp.app.registry
+    password_context = create_password_context(
+        bcrypt__default_rounds=5, bcrypt__min_rounds=5)
+    registry['password_context'] = password_context
+    registry['password_rehasher'] = PasswordRehasher(
+        password_context, registry)
+
+    _login(testapp, 'testuser', 'testuserpass', status=302)
+    registry['password_rehasher'].join()
+
+    db_session = registry['db_sessionmaker']()
+    user = User.from_identity(db_session, 'testuser')
+    assert not password_context.needs_update(user.password_hash)
+    assert password_context.verify('testuserpass', user.password_hash)
+
+
+@pytest.mark.functional
+def test_throttled_login_fails_before_hashing(testapp):
+    from paildocket.throttle import LoginThrottle, MemoryTokenBuckets
+    create_user_in_testapp(testapp)
+    registry = testapp.app.registry
+    registry['login_throttle'] = LoginThrottle(
+        MemoryTokenBuckets(capacity=1, rate=0, maxsize=10),
+        MemoryTokenBuckets(capacity=10, rate=0, maxsize=10),
+    )
+    _login(testapp, 'testuser', 'wrongpass', status=200)
+
+    registry['password_context'] = None  # any hashing would now fail
+    res = _login(testapp, 'testuser', 'testuserpass', status=429)
+    assert b'Too many login attempts' in res.body
+
+
 def _login(testapp, identity, password, **kwargs):
     res = testapp.get('/login', status=200)
     form = res.forms['login_form']
@@ -162,4 +336,216 @@ def test_user_registration(testapp):
     assert password_context.verify('foobarfoobar', user.password_hash)
 
 
+@pytest.mark.functional
+def test_user_lookup_and_resolve(testapp):
+    import transaction
+    from paildocket.models import User
+
+    db_session = testapp.app.registry['db_sessionmaker']()
+    db_session.add(User(
+        username='testbob', email='bob@example.com', password_hash='x'))
+    transaction.commit()
+    log_in_with_checklists(testapp)
+
+    res = testapp.get('/user/lookup', {'q': 'TEST', 'limit': 1}, status=200)
+    assert [user['username'] for user in res.json['users']] == ['testbob']
+    assert 'max-age=' in res.headers['Cache-Control']
+    res = testapp.get('/user/lookup', {'q': 't'}, status=200)
+    assert res.json == {'users': []}
+
+    res = testapp.post_json('/user/resolve', {
+        'identities': ['testuser', 'bob@example.com', 'nobody'],
+    }, status=200)
+    assert set(res.json['users']) == {'testuser', 'bob@example.com'}
+    assert res.json['users']['bob@example.com']['username'] == 'testbob'
+    assert res.json['unknown'] == ['nobody']
+    res = testapp.post_json(
+        '/user/resolve', {'identities': ['x'] * 201}, status=400)
+    assert 'identities' in res.json['errors']
+
+
+@pytest.mark.functional
+@pytest.mark.parametrize('testapp_settings', [{
+    'paildocket.checklist.page_size': '2',
+}])
+def test_checklist_index_pages(testapp):
+    log_in_with_checklists(testapp, edited=['first', 'second', 'third'])
+
+    res = testapp.get('/list', status=200)
+    assert b'first' in res.body and b'second' in res.body
+    assert b'third' not in res.body
+    assert b'Previous' not in res.body
+    res = res.click('Next')
+    assert b'third' in res.body and b'second' not in res.body
+    assert b'Next' not in res.body
+    res = res.click('Previous')
+    assert b'first' in res.body and b'second' in res.body
+
+
+@pytest.mark.functional
+def test_checklist_create(testapp):
+    log_in_with_checklists(testapp)
+
+    res = testapp.get('/list/create', status=200)
+    form = res.forms['checklist_form']
+    form['title'] = 'Groceries'
+    form['description'] = 'For the weekend'
+    res = form.submit('submit', status=302)
+    res = res.follow(status=200)
+    assert res.json['title'] == 'Groceries'
+
+
+@pytest.mark.functional
+def test_checklist_index_is_served_from_fragment_cache(testapp):
+    import transaction
+    from paildocket.models import Checklist
+
+    checklist_id, = log_in_with_checklists(testapp, edited=['Groceries'])
+
+    fragment_cache = testapp.app.registry['fragment_cache']
+    assert b'Groceries' in testapp.get('/list', status=200).body
+    assert len(fragment_cache) == 1
+    assert b'Groceries' in testapp.get('/list', status=200).body
+    assert len(fragment_cache) == 1
+
+    db_session = testapp.app.registry['db_sessionmaker']()
+    Checklist.from_id(db_session, checklist_id).title = 'Shopping'
+    transaction.commit()
+    res = testapp.get('/list', status=200)
+    assert b'Shopping' in res.body and b'Groceries' not in res.body
+
+
+@pytest.mark.functional
+def test_checklist_json_conditional_get(testapp):
+    import transaction
+    from paildocket.models import Checklist
+
+    checklist_id, = log_in_with_checklists(testapp, edited=['Groceries'])
+    path = '/list/{0}'.format(checklist_id)
+
+    res = testapp.get(path, status=200)
+    etag = res.headers['ETag']
+    assert res.json['title'] == 'Groceries'
+    res = testapp.get(path, headers={'If-None-Match': etag}, status=304)
+    assert res.headers['ETag'] == etag
+    assert not res.body
+
+    db_session = testapp.app.registry['db_sessionmaker']()
+    Checklist.from_id(db_session, checklist_id).title = 'Shopping'
+    transaction.commit()
+    res = testapp.get(path, headers={'If-None-Match': etag}, status=200)
+    assert res.headers['ETag'] != etag
+    assert res.json['title'] == 'Shopping'
+
+
+@pytest.mark.functional
+@pytest.mark.parametrize('testapp_settings', [{
+    'paildocket.compression.enabled': 'true',
+    'paildocket.compression.min_size': '0',
+}])
+def test_checklist_json_conditional_get_compressed(testapp):
+    checklist_id, = log_in_with_checklists(
+        testapp, edited=['Groceries ' * 50])
+    headers = {
+        'Accept-Encoding': 'gzip',
+        'Cookie': '; '.join(
+            '{0}={1}'.format(name, value)
+            for name, value in testapp.cookies.items()),
+    }
+    # Not through the TestApp, which would decode the body
+    request = Request.blank('/list/{0}'.format(checklist_id), headers=headers)
+    res = request.get_response(testapp.app)
+    assert res.status_int == 200
+    assert res.content_encoding == 'gzip'
+    etag = res.headers['ETag']
+    assert etag.startswith('W/')
+    request.if_none_match = etag
+    res = request.get_response(testapp.app)
+    assert res.status_int == 304
+    assert res.headers['ETag'] == etag
+
+
+@pytest.mark.functional
+def test_checklist_json_is_one_query(testapp):
+    from sqlalchemy import event
+
+    checklist_id, = log_in_with_checklists(testapp, edited=['Groceries'])
+    path = '/list/{0}'.format(checklist_id)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = testapp.app.registry['db_sessionmaker'].kw['bind'].engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        res = testapp.get(path, status=200)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert res.json['title'] == 'Groceries'
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.functional
+def test_checklist_permissions_bulk_change(testapp):
+    import transaction
+    from paildocket.models import User, Checklist
+
+    db_session = testapp.app.registry['db_sessionmaker']()
+    bob = User(username='bob', email='bob@example.com', password_hash='x')
+    db_session.add(bob)
+    db_session.flush()
+    bob_id = bob.encoded_userid
+    transaction.commit()
+    owned_id, shared_id = log_in_with_checklists(
+        testapp, edited=['Groceries'], viewed=['Chores'])
+
+    res = testapp.post_json('/list/permissions', {
+        'grant': [{'checklist': owned_id, 'user': bob_id, 'role': 'edit'}],
+    }, status=200)
+    assert res.json == {'granted': 1, 'revoked': 0}
+    res = testapp.post_json('/list/permissions', {
+        'revoke': [{'checklist': owned_id, 'user': bob_id, 'role': 'edit'}],
+    }, status=200)
+    assert res.json == {'granted': 0, 'revoked': 1}
+    db_session = testapp.app.registry['db_sessionmaker']()
+    assert Checklist.from_id(db_session, owned_id).viewers == {
+        User.from_encoded_userid(db_session, bob_id)}
+    transaction.abort()
+
+    # Only viewing the checklist is not enough
+    res = testapp.post_json('/list/permissions', {
+        'grant': [{'checklist': shared_id, 'user': bob_id, 'role': 'view'}],
+    }, status=403)
+    assert str(shared_id) in res.json['errors']['checklist']
+
+    res = testapp.post_json('/list/permissions', {
+        'grant': [{'checklist': owned_id, 'user': 'nope', 'role': 'own'}],
+    }, status=400)
+    assert set(res.json['errors']) == {'grant.0.user', 'grant.0.role'}
+    testapp.post('/list/permissions', 'not json', status=400)
+
+
+@pytest.mark.functional
+@pytest.mark.parametrize('testapp_settings', [{
+    'paildocket.checklist.page_size': '2',
+}])
+def test_checklist_search(testapp):
+    log_in_with_checklists(
+        testapp, edited=['Groceries {0}'.format(n) for n in range(3)],
+        unshared=['Groceries, not shared'])
+
+    res = testapp.get('/list', status=200)
+    assert 'action="http://localhost/list/search"' in res.text
+    res = testapp.get('/list/search', {'q': 'groceries'}, status=200)
+    assert res.text.count('Groceries ') == 2
+    res = res.click(description='Next')
+    assert res.text.count('Groceries ') == 1
+    assert 'not shared' not in res.text
+    res = testapp.get('/list/search', {'q': 'nothing'}, status=200)
+    assert 'No lists found' in res.text
+    res = testapp.get('/list/search', status=200)
+    assert 'No lists found' not in res.text
+
+
 # TODO Add tests for other views
@@ -0,0 +1,175 @@
+"""
+Token bucket throttling of login attempts.
+
+Each attempt takes a token from the bucket of the identity it names
+and from the bucket of the client address it comes from. A bucket
+holds at most ``capacity`` tokens and regains ``rate`` tokens per
+second; an attempt finding either bucket empty is refused before any
+password is hashed.
+
+The address buckets are keyed on ``request.remote_addr``, which must
+be the client's own address. Behind a reverse proxy it is the proxy's
+unless the server is told to trust the proxy's X-Forwarded-For (with
+waitress's ``trusted_proxy`` settings, say); otherwise every client
+would share one bucket, and one attacker could lock everybody out. If
+that cannot be arranged, setting
+``paildocket.login_throttle.address_burst`` to 0 disables the address
+buckets, leaving only the identity ones.
+"""
+import logging
+import itertools
+import threading
+import time
+
+from paildocket.cache import LRUCache
+from paildocket.models import LoginThrottleBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryTokenBuckets(object):
+    """
+    Token buckets kept in this process, at most ``maxsize`` of them;
+    the least recently used bucket is forgotten when full. A bucket
+    left alone long enough to refill is forgotten as well.
+    """
+    def __init__(self, capacity, rate, maxsize, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self._clock = clock
+        # key -> (tokens, time of last update)
+        self._buckets = LRUCache(
+            maxsize, ttl=capacity / rate if rate else None, clock=clock)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, request=None):
+        """
+        Take a token from the bucket for ``key`` and return True, or
+        return False if the bucket is empty.
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets.set(key, (tokens, now))
+        return allowed
+
+
+class DatabaseTokenBuckets(object):
+    """
+    Token buckets stored in the ``login_throttle_buckets`` table, and
+    so shared by every process using the database.
+
+    Tokens are taken on a connection of their own, autocommitting, so
+    that concurrent attempts do not wait for each other's requests,
+    and their password hashing, to end. Every ``prune_every`` attempts,
+    the buckets of keys starting with ``prefix`` which have refilled
+    are deleted, keeping the table from growing without bound.
+    """
+    def __init__(self, capacity, rate, prefix='', prune_every=1000):
+        self.capacity = capacity
+        self.rate = rate
+        self.prefix = prefix
+        self.prune_every = prune_every
+        self._attempts = itertools.count(1)
+
+    def consume(self, key, request):
+        bind = request.db_session.bind
+        with bind.connect() as connection:
+            connection = connection.execution_options(autocommit=True)
+            if self.prune_every and (
+                    next(self._attempts) % self.prune_every == 0):
+                self.prune(connection)
+            return LoginThrottleBucket.consume(
+                connection, key, self.capacity, self.rate)
+
+    def prune(self, connection):
+        """Delete the refilled buckets, returning how many there were."""
+        if not self.rate:
+            return 0
+        pruned = LoginThrottleBucket.prune(
+            connection, self.prefix, self.capacity, self.rate)
+        logger.debug('Pruned {0} {1!r} login throttle buckets'.format(
+            pruned, self.prefix))
+        return pruned
+
+
+# Bucket keys are the identity or address after one of these
+IDENTITY_PREFIX = 'identity:'
+ADDRESS_PREFIX = 'address:'
+
+
+class LoginThrottle(object):
+    """
+    Throttles login attempts by identity, and by client address unless
+    ``address_buckets`` is None.
+    """
+    def __init__(self, identity_buckets, address_buckets=None):
+        self.identity_buckets = identity_buckets
+        self.address_buckets = address_buckets
+
+    def allow(self, request, identity):
+        """
+        Return True if a login attempt from ``request`` for
+        ``identity`` may go ahead, taking a token from each bucket.
+        """
+        address = request.remote_addr
+        if address is not None and self.address_buckets is not None:
+            key = ADDRESS_PREFIX + address
+            if not self.address_buckets.consume(key, request):
+                logger.info(
+                    'Throttled login attempt from {0}'.format(address))
+                return False
+        key = IDENTITY_PREFIX + identity.strip().lower()
+        if not self.identity_buckets.consume(key, request):
+            logger.info('Throttled login attempt for {0!r}'.format(identity))
+            return False
+        return True
+
+
+BACKENDS = ('memory', 'database', 'none')
+
+MINUTE = 60
+
+
+def _buckets_from_settings(settings, backend, kind, burst, per_minute):
+    prefix = 'paildocket.login_throttle.{0}_'.format(kind)
+    capacity = float(settings.get(prefix + 'burst', burst))
+    if not capacity:
+        return None
+    rate = float(settings.get(prefix + 'per_minute', per_minute)) / MINUTE
+    if backend == 'database':
+        return DatabaseTokenBuckets(
+            capacity, rate, prefix='{0}:'.format(kind),
+            prune_every=int(settings.get(
+                'paildocket.login_throttle.prune_every', 1000)))
+    maxsize = int(settings.get(
+        'paildocket.login_throttle.memory_maxsize', 100000))
+    return MemoryTokenBuckets(capacity, rate, maxsize)
+
+
+def includeme(config):
+    settings = config.registry.settings
+    backend = settings.get(
+        'paildocket.login_throttle.backend', 'memory').strip()
+    if backend not in BACKENDS:
+        raise ValueError(
+            'paildocket.login_throttle.backend must be one of {0}'.format(
+                ', '.join(BACKENDS)))
+    if backend == 'none':
+        config.registry['login_throttle'] = None
+        return
+
+    identity_buckets = _buckets_from_settings(
+        settings, backend, 'identity', 10, 2)
+    address_buckets = _buckets_from_settings(
+        settings, backend, 'address', 50, 20)
+    config.registry['login_throttle'] = LoginThrottle(
+        identity_buckets, address_buckets)
@@ -1,8 +1,11 @@
 from pyramid.decorator import reify
+from pyramid.events import ContextFound
 from pyramid.traversal import find_root
 from pyramid.security import Allow, Everyone, Authenticated, DENY_ALL
 
-from paildocket.models import Checklist, encoded_userid_to_userid
+from paildocket.models import (
+    Checklist, EDIT_ROLE, VIEW_ROLE, encoded_userid_to_userid
+)
 from paildocket.security import ViewPermission, EditAndViewPermission
 
 
@@ -56,21 +59,63 @@ class ChecklistResource(object):
 
     def __acl__(self):
         acl = []
-        user = self.request.user
-        if self.checklist is not None and user is not None:
-            if user in self.checklist.editors:
-                acl.append((Allow, user.principal, EditAndViewPermission))
-            elif user in self.checklist.viewers:
-                acl.append((Allow, user.principal, ViewPermission))
+        role = self.role
+        if role is not None:
+            principal = self.request.user.principal
+            if role == EDIT_ROLE:
+                acl.append((Allow, principal, EditAndViewPermission))
+            elif role == VIEW_ROLE:
+                acl.append((Allow, principal, ViewPermission))
 
         acl.append(DENY_ALL)
         return acl
 
+    def prefetch(self):
+        """
+        Load the user authenticated by the request (for the
+        authentication callback and ``request.user``), the checklist
+        and the user's role on it with one query, before authorization
+        needs them.
+        """
+        request = self.request
+        userid = request.unauthenticated_userid
+        if userid is None:
+            return
+        user, checklist, role = Checklist.with_role_for_user(
+            request.db_session, userid, self.checklist_id,
+            with_description='If-None-Match' not in request.headers)
+        request.user_identity_map.add(userid, user)
+        if user is not None:
+            # Replaces the reified attribute
+            self._checklist_and_role = checklist, role
+
+    @reify
+    def _checklist_and_role(self):
+        """
+        The checklist and the current user's role on it, loaded
+        together. The checklist's description is loaded too, unless
+        the request is conditional and so might not need it.
+        """
+        user, checklist, role = Checklist.with_role_for_user(
+            self.request.db_session, self.request.user.id, self.checklist_id,
+            with_description='If-None-Match' not in self.request.headers)
+        return checklist, role
+
+    @reify
+    def role(self):
+        """
+        The current user's role on the checklist, `EDIT_ROLE` or
+        `VIEW_ROLE` (directly or through their groups), or None.
+        """
+        if self.request.user is None:
+            return None
+        return self._checklist_and_role[1]
+
     @reify
     def checklist(self):
-        q = self.request.db_session.query(Checklist)
-        q = q.filter(Checklist.id == self.checklist_id)
-        return q.first()
+        if self.request.user is not None:
+            return self._checklist_and_role[0]
+        return Checklist.from_id(self.request.db_session, self.checklist_id)
 
 
 class UserCollectionResource(object):
@@ -113,3 +158,17 @@ class UserResource(object):
 
         acl.append(DENY_ALL)
         return acl
+
+
+def prefetch_context(event):
+    """
+    Let the context found by traversal load what it needs before the
+    view is looked up and authorized, if it has a ``prefetch`` method.
+    """
+    prefetch = getattr(event.request.context, 'prefetch', None)
+    if prefetch is not None:
+        prefetch()
+
+
+def includeme(config):
+    config.add_subscriber(prefetch_context, ContextFound)
@@ -1,3 +1,8 @@
+from pyramid.decorator import reify
+
+from paildocket.cache import LRUCache
+
+
 class BaseView(object):
     """
     Base view class, just to get rid of the __init__ boilerplate.
@@ -13,3 +18,57 @@ class BaseView(object):
 
     def _extra_init(self):
         pass
+
+
+class FormView(BaseView):
+    """
+    Base class for views displaying and processing a deform form.
+
+    Subclasses override `create_form`. The form is only built when
+    first used, which a GET usually avoids: the HTML of the empty form
+    depends only on the form, the locale and the action URL, so it is
+    rendered once and then served from the registry's ``form_cache``.
+    Forms whose empty rendering depends on anything else (the user,
+    say) must not use `render_empty_form`.
+    """
+    @reify
+    def form(self):
+        return self.create_form()
+
+    def create_form(self):
+        """Return a new ``deform.Form`` for this view."""
+        raise NotImplementedError
+
+    @property
+    def form_action(self):
+        return self.request.resource_url(self.context, self.request.view_name)
+
+    def render_empty_form(self):
+        cache = self.request.registry.get('form_cache')
+        if cache is None:
+            return self.form.render()
+        key = (
+            type(self).__module__, type(self).__qualname__,
+            self.request.locale_name, self.form_action,
+        )
+        html = cache.get(key)
+        if html is None:
+            html = self.form.render()
+            cache.set(key, html)
+        return html
+
+
+def includeme(config):
+    form_cache_size = int(config.registry.settings.get(
+        'paildocket.form_cache_size', 256))
+    if form_cache_size:
+        config.registry['form_cache'] = LRUCache(form_cache_size)
+    else:
+        config.registry['form_cache'] = None
+
+    fragment_cache_size = int(config.registry.settings.get(
+        'paildocket.fragment_cache_size', 1000))
+    if fragment_cache_size:
+        config.registry['fragment_cache'] = LRUCache(fragment_cache_size)
+    else:
+        config.registry['fragment_cache'] = None
@@ -1,13 +1,19 @@
 import logging
 
+import colander
 import deform
 from pyramid.view import view_config, view_defaults
-from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import HTTPFound, HTTPNotModified
+from pyramid.renderers import render
 
-from paildocket.views import BaseView
+from paildocket.views import BaseView, FormView
+from paildocket.export import export_response
 from paildocket.i18n import _
-from paildocket.models import Checklist
-from paildocket.schemas import ChecklistSchema
+from paildocket.models import (
+    Checklist, ChecklistPermission, User, userid_to_encoded_userid
+)
+from paildocket.pagination import keyset_page
+from paildocket.schemas import BulkPermissionsSchema, ChecklistSchema
 from paildocket.security import ViewPermission
 from paildocket.traversal import ChecklistCollectionResource, ChecklistResource
 
@@ -15,26 +21,158 @@ from paildocket.traversal import ChecklistCollectionResource, ChecklistResource
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_PAGE_SIZE = 50
+
+
 @view_defaults(context=ChecklistCollectionResource, permission=ViewPermission)
 class ChecklistCollectionViews(BaseView):
     @view_config(renderer='checklist/index.jinja2')
     def index(self):
-        db_session = self.request.db_session
+        return {'list_html': self.render_list()}
+
+    def render_list(self):
+        """
+        Return the HTML of the requested page of the user's checklists.
+
+        It is kept in the registry's ``fragment_cache`` under the user's
+        ``permissions_generation``, which changes whenever the page
+        might, so a cached page is served without querying checklists.
+        """
+        after = self._page_key('after')
+        before = self._page_key('before')
         user = self.request.user
-        editable = Checklist.editable_by_user_query(db_session, user)
-        viewable = Checklist.only_viewable_by_user_query(db_session, user)
-        return {
-            'editable': editable.all(),
-            'viewable': viewable.all(),
-        }
+        cache = self.request.registry.get('fragment_cache')
+        key = (
+            'checklist-index', user.id, user.permissions_generation,
+            after, before, self.page_size,
+            self.request.locale_name, self.request.application_url,
+        )
+        if cache is not None:
+            html = cache.get(key)
+            if html is not None:
+                return html
+
+        visible = Checklist.visible_to_user_query(
+            self.request.db_session, user)
+        page = keyset_page(
+            visible, Checklist.id, self.page_size, after=after, before=before)
+        html = render(
+            'checklist/_index_list.jinja2', {'page': page}, self.request)
+        if cache is not None:
+            cache.set(key, html)
+        return html
+
+    @view_config(name='search', renderer='checklist/search.jinja2')
+    def search(self):
+        """
+        Search the checklists the user can view, and their items, for
+        the terms of the ``q`` parameter, best matches first.
+        """
+        terms = self.request.GET.get('q', '').strip()
+        if not terms:
+            return {'terms': '', 'page': None, 'page_key': _format_rank_key}
+        page = Checklist.search_page(
+            self.request.db_session, self.request.user, terms, self.page_size,
+            after=_parse_rank_key(self.request.GET.get('after')),
+            before=_parse_rank_key(self.request.GET.get('before')))
+        return {'terms': terms, 'page': page, 'page_key': _format_rank_key}
+
+    @view_config(name='export', request_method='GET')
+    def export(self):
+        """
+        Stream the checklists the user can view and their items, as
+        CSV or JSON Lines (``format=jsonl``).
+        """
+        return export_response(self.request)
+
+    @view_config(name='permissions', request_method='POST', renderer='json')
+    def change_permissions(self):
+        """
+        Grant and revoke many permissions at once, as described by
+        `BulkPermissionsSchema`, and report how many changed. The user
+        must be able to edit every checklist involved.
+        """
+        request = self.request
+        translate = request.localizer.translate
+        try:
+            data = BulkPermissionsSchema().deserialize(request.json_body)
+        except ValueError:
+            return self._error(400, {'': translate(_('Invalid JSON'))})
+        except colander.Invalid as e:
+            return self._error(400, e.asdict(translate=translate))
+
+        changes = data['grant'] + data['revoke']
+        checklist_ids = set(change['checklist'] for change in changes)
+        editable = Checklist.ids_editable_by_user(
+            request.db_session, request.user, checklist_ids)
+        if editable != checklist_ids:
+            return self._error(403, {'checklist': translate(_(
+                'You cannot edit checklist(s) ${ids}',
+                mapping={'ids': _join_sorted(checklist_ids - editable)}))})
+        userids = set(change['user'] for change in changes)
+        existing = User.existing_userids(request.db_session, userids)
+        if existing != userids:
+            return self._error(400, {'user': translate(_(
+                'Unknown user(s) ${ids}',
+                mapping={'ids': _join_sorted(
+                    userid_to_encoded_userid(userid)
+                    for userid in userids - existing)}))})
+        granted = ChecklistPermission.grant_many(
+            request.db_session, _permission_tuples(data['grant']))
+        revoked = ChecklistPermission.revoke_many(
+            request.db_session, _permission_tuples(data['revoke']))
+        return {'granted': granted, 'revoked': revoked}
+
+    def _error(self, status, errors):
+        self.request.response.status_int = status
+        return {'errors': errors}
+
+    @property
+    def page_size(self):
+        settings = self.request.registry.settings
+        return int(settings.get(
+            'paildocket.checklist.page_size', DEFAULT_PAGE_SIZE))
+
+    def _page_key(self, name):
+        try:
+            return int(self.request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+
+def _format_rank_key(key):
+    return '{0!r}:{1}'.format(*key)
+
+
+def _parse_rank_key(value):
+    """
+    Return the ``(rank, id)`` search page key formatted as ``value``,
+    or None if it is missing or malformed.
+    """
+    try:
+        rank, checklist_id = value.split(':')
+        return float(rank), int(checklist_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _permission_tuples(changes):
+    return [
+        (change['checklist'], change['user'], change['role'])
+        for change in changes
+    ]
+
+
+def _join_sorted(values):
+    return ', '.join(sorted(str(value) for value in values))
 
 
 @view_defaults(context=ChecklistCollectionResource, permission=ViewPermission)
-class ChecklistCreateViews(BaseView):
-    def _extra_init(self):
-        self.form = deform.Form(
+class ChecklistCreateViews(FormView):
+    def create_form(self):
+        return deform.Form(
             ChecklistSchema(),
-            action=self.request.resource_url(context, self.request.view_name),
+            action=self.form_action,
             buttons=(deform.Button('submit', title=_('Create')),),
             formid='checklist_form',
         )
@@ -42,7 +180,7 @@ class ChecklistCreateViews(BaseView):
     @view_config(name='create', request_method='GET',
                  renderer='checklist/create.jinja2')
     def display(self):
-        return {'form': self.form}
+        return {'form_html': self.render_empty_form()}
 
     @view_config(name='create', request_method='POST',
                  renderer='checklist/create.jinja2')
@@ -50,7 +188,7 @@ class ChecklistCreateViews(BaseView):
         try:
             checklist = self.validate()
         except deform.ValidationFailure as error_form:
-            return {'form': error_form}
+            return {'form_html': error_form.render()}
         self.request.db_session.add(checklist)
         self.request.db_session.flush()
         destination = self.request.resource_url(self.context[checklist.id])
@@ -71,8 +209,23 @@ class ChecklistView(BaseView):
     @view_config(renderer='json')
     def index(self):
         checklist = self.context.checklist
+        # Weak, as the compression tween would make it anyway, so that
+        # the 304 carries the same validator as the 200
+        etag = (str(checklist.version), False)
+        if etag[0] in self.request.if_none_match:
+            # Answered before the deferred description is loaded
+            return HTTPNotModified(
+                etag=etag, cache_control='private, no-cache')
+        response = self.request.response
+        response.etag = etag
+        response.cache_control = 'private, no-cache'
         return {
             'id': checklist.id,
             'title': checklist.title,
             'description': checklist.description,
         }
+
+    @view_config(name='export', request_method='GET')
+    def export(self):
+        """Stream the checklist and its items, see `export_response`."""
+        return export_response(self.request, self.context.checklist_id)
@@ -4,14 +4,17 @@ import deform
 import colander
 from pyramid.view import view_config, view_defaults, forbidden_view_config
 from pyramid.security import remember, forget
-from pyramid.httpexceptions import HTTPFound, HTTPForbidden
+from pyramid.httpexceptions import (
+    HTTPFound, HTTPForbidden, HTTPServiceUnavailable
+)
 from pyramid.traversal import find_root
 from sqlalchemy import or_
 
-from paildocket.views import BaseView
-from paildocket.i18n import _
+from paildocket.views import BaseView, FormView
+from paildocket.i18n import _, remember_language
 from paildocket.models import User
 from paildocket.schemas import LoginSchema, RegisterUserSchema
+from paildocket.security import PasswordHashingUnavailable
 from paildocket.traversal import RootResource
 
 
@@ -30,6 +33,15 @@ def forbidden(request):
         return HTTPFound(location=destination)
 
 
+@view_config(context=PasswordHashingUnavailable)
+def password_hashing_unavailable(exc, request):
+    logger.warning('Password hashing unavailable: {0}'.format(exc))
+    response = HTTPServiceUnavailable(
+        'The service is busy, please try again shortly')
+    response.retry_after = 5
+    return response
+
+
 @view_defaults(context=RootResource)
 class RootViews(BaseView):
     @view_config(renderer='index.jinja2')
@@ -45,6 +57,25 @@ class RootViews(BaseView):
             'value_repr_types': [(v, repr(v), repr(type(v))) for v in values],
         }
 
+    @view_config(name='language', request_method='POST')
+    def language(self):
+        language = self.request.POST.get('lang')
+        if language in self.request.registry['available_languages']:
+            remember_language(self.request, language)
+        return HTTPFound(location=self._local_referer())
+
+    def _local_referer(self):
+        """
+        Return the referring page if it belongs to this application, so
+        a cross-site POST cannot redirect elsewhere, or the root's URL.
+        """
+        referer = self.request.referer
+        application_url = self.request.application_url
+        if referer and (referer == application_url or
+                        referer.startswith(application_url + '/')):
+            return referer
+        return self.request.resource_url(self.context)
+
     @view_config(name='logout')
     def logout(self):
         headers = forget(self.request)
@@ -53,27 +84,28 @@ class RootViews(BaseView):
 
 
 @view_defaults(name='login', renderer='login.jinja2', context=RootResource)
-class LoginView(BaseView):
+class LoginView(FormView):
     def _extra_init(self):
-        self.form = deform.Form(
+        self.password_context = self.request.registry['password_context']
+
+    def create_form(self):
+        return deform.Form(
             LoginSchema(),
-            action=self.request.resource_url(
-                self.context, self.request.view_name),
+            action=self.form_action,
             buttons=(deform.Button('submit', title=_('Log In')),),
             formid='login_form',
         )
-        self.password_context = self.request.registry['password_context']
 
     @view_config(request_method='GET')
     def display(self):
-        return {'form': self.form}
+        return {'form_html': self.render_empty_form()}
 
     @view_config(request_method='POST')
     def process(self):
         try:
             user = self.validate()
         except deform.ValidationFailure as error_form:
-            return {'form': error_form}
+            return {'form_html': error_form.render()}
         destination = self.request.resource_url(self.context)
         headers = self.log_user_on(user)
         return HTTPFound(location=destination, headers=headers)
@@ -87,11 +119,19 @@ class LoginView(BaseView):
         data = self.form.validate(self.request.POST.items())
         identity = data['identity']
         password = data['password']
+        throttle = self.request.registry.get('login_throttle')
+        if throttle is not None and not throttle.allow(self.request, identity):
+            self.request.response.status_int = 429
+            message = _('Too many login attempts, please try again later')
+            self.form.error = colander.Invalid(None, message)
+            raise deform.ValidationFailure(self.form, self.form.cstruct, None)
         user = User.from_identity(self.request.db_session, identity)
         if user is None:
             # Eliminate timing differences for unknown identity case
-            # versus invalid password.
-            self.password_context.encrypt(password)
+            # versus invalid password, by verifying against a hash of
+            # the configured cost computed at startup.
+            dummy_hash = self.request.registry['password_dummy_hash']
+            self.password_context.verify(password, dummy_hash)
         else:
             if self.verify_password_possible_update(password, user):
                 return user
@@ -104,14 +144,24 @@ class LoginView(BaseView):
         Verify the password against the user's password hash, and
         upgrade the hash if necessary. Return true if the password
         was verified successfully.
+
+        Upgrades are handed to the registry's ``password_rehasher`` if
+        there is one, so the login does not pay for a second hash.
         """
-        verify_and_update = self.password_context.verify_and_update
-        valid, new_hash = verify_and_update(password, user.password_hash)
-        if valid and new_hash:
-            logger.info('Upgrading password hash for user {0!r}'.format(user))
-            user.password_hash = new_hash
-            self.request.db_session.add(user)
-            self.request.db_session.flush()
+        rehasher = self.request.registry.get('password_rehasher')
+        if rehasher is None:
+            verify_and_update = self.password_context.verify_and_update
+            valid, new_hash = verify_and_update(password, user.password_hash)
+            if valid and new_hash:
+                logger.info(
+                    'Upgrading password hash for user {0!r}'.format(user))
+                user.password_hash = new_hash
+                self.request.db_session.add(user)
+                self.request.db_session.flush()
+            return valid
+        valid = self.password_context.verify(password, user.password_hash)
+        if valid and self.password_context.needs_update(user.password_hash):
+            rehasher.enqueue(user, password)
         return valid
 
     def log_user_on(self, user):
@@ -128,26 +178,26 @@ class LoginView(BaseView):
     renderer='register.jinja2',
     context=RootResource,
 )
-class RegisterView(BaseView):
-    def _extra_init(self):
+class RegisterView(FormView):
+    def create_form(self):
         schema = RegisterUserSchema()
-        self.form = deform.Form(
+        return deform.Form(
             schema,
-            action=self.request.resource_url(self.context, 'register'),
+            action=self.form_action,
             buttons=(deform.Button('submit', title=_('Register')),),
             formid='register_form'
         )
 
     @view_config(request_method='GET')
     def display(self):
-        return {'form': self.form}
+        return {'form_html': self.render_empty_form()}
 
     @view_config(request_method='POST')
     def process(self):
         try:
             username, email, password = self.validate()
         except deform.ValidationFailure as error_form:
-            return {'form': error_form}
+            return {'form_html': error_form.render()}
         self.register_user(username, email, password)
         destination = self.request.resource_url(self.context, 'login')
         return HTTPFound(location=destination)
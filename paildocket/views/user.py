@@ -8,6 +8,7 @@ from pyramid.httpexceptions import HTTPFound
 from paildocket.views import BaseView
 from paildocket.i18n import _
 from paildocket.models import User
+from paildocket.schemas import ResolveIdentitiesSchema
 from paildocket.security import ViewPermission
 from paildocket.traversal import UserCollectionResource, UserResource
 
@@ -24,6 +25,54 @@ class UserCollectionViews(BaseView):
     def index(self):
         return {'user': self.request.user}
 
+    @view_config(name='lookup', request_method='GET', renderer='json')
+    def lookup(self):
+        """
+        Autocomplete the start of a username or email given as ``q``,
+        returning at most ``limit`` users.
+        """
+        request = self.request
+        user_lookup = request.registry['user_lookup']
+        try:
+            limit = int(request.GET['limit'])
+        except (KeyError, ValueError):
+            limit = None
+        users = user_lookup.lookup(
+            request.db_session, request.GET.get('q', ''), limit)
+        # Let the browser answer a repeated term itself, e.g. when a
+        # character is typed and deleted again.
+        request.response.cache_control = 'private, max-age={0}'.format(
+            user_lookup.cache_ttl)
+        return {'users': users}
+
+    @view_config(name='resolve', request_method='POST', renderer='json')
+    def resolve(self):
+        """
+        Resolve the usernames and emails of `ResolveIdentitiesSchema` to
+        users, and list those which identify nobody.
+        """
+        request = self.request
+        translate = request.localizer.translate
+        try:
+            data = ResolveIdentitiesSchema().deserialize(request.json_body)
+        except ValueError:
+            request.response.status_int = 400
+            return {'errors': {'': translate(_('Invalid JSON'))}}
+        except colander.Invalid as e:
+            request.response.status_int = 400
+            return {'errors': e.asdict(translate=translate)}
+
+        identities = data['identities']
+        found = User.from_identities(request.db_session, identities)
+        return {
+            'users': {
+                identity: {
+                    'id': user.encoded_userid, 'username': user.username}
+                for identity, user in found.items()
+            },
+            'unknown': sorted(set(identities).difference(found)),
+        }
+
 
 @view_defaults(context=UserResource, permission=ViewPermission)
 class UserViews(BaseView):
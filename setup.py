@@ -43,12 +43,21 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
+    extras_require={
+        # faster JSON rendering, see paildocket.renderers
+        'orjson': ['orjson'],
+        # brotli compressed static assets, see paildocket.assets
+        'brotli': ['brotli'],
+    },
     entry_points="""\
     [paste.app_factory]
     main = paildocket.wsgi:main
     [console_scripts]
     paildocket-initdb = paildocket.management:initialize_database
     paildocket-adduser = paildocket.management:add_user
+    paildocket-password-status = paildocket.management:password_status
+    paildocket-build-assets = paildocket.management:build_assets_command
     paildocket-fixture = paildocket.management:manage_fixtures
+    paildocket-benchmark = paildocket.benchmark:benchmark
     """,
 )